@@ -1,8 +1,126 @@
 import argparse
+import logging
+import queue
+import threading
 from pathlib import Path
 
+import h5py
+import numpy as np
+import pandas as pd
+
 from abc_atlas_access.abc_atlas_cache.abc_project_cache import AbcProjectCache
-from abc_atlas_access.abc_atlas_cache.anndata_utils import get_gene_data
+from abc_atlas_access.abc_atlas_cache.anndata_utils import (
+    get_gene_data,
+    iter_gene_data
+)
+
+
+def prefetch(chunks, max_chunks=2):
+    """Read the chunks of an iterator in a background thread, so that
+    writing a chunk overlaps with reading the next ones."""
+    chunk_queue = queue.Queue(maxsize=max_chunks)
+    done = object()
+
+    def _read():
+        try:
+            for chunk in chunks:
+                chunk_queue.put(chunk)
+        except BaseException as err:
+            chunk_queue.put(err)
+        else:
+            chunk_queue.put(done)
+
+    threading.Thread(target=_read, daemon=True).start()
+    while True:
+        chunk = chunk_queue.get()
+        if chunk is done:
+            return
+        if isinstance(chunk, BaseException):
+            raise chunk
+        yield chunk
+
+
+def with_empty_chunk(chunks, columns):
+    """Yield the chunks, or a single chunk without cells if there are none,
+    so that the writers still write the columns of an empty output."""
+    empty = True
+    for chunk in chunks:
+        empty = False
+        yield chunk
+    if empty:
+        yield pd.DataFrame(columns=columns,
+                           index=pd.Index([], name="cell_label"),
+                           dtype=np.float32)
+
+
+def write_csv(chunks, output_file_path):
+    header = True
+    for chunk in chunks:
+        chunk.to_csv(output_file_path, mode="w" if header else "a",
+                     header=header)
+        header = False
+
+
+def write_parquet(chunks, output_file_path):
+    # pyarrow is only needed for parquet output.
+    import pyarrow
+    import pyarrow.parquet
+
+    writer = None
+    dtypes = None
+    try:
+        for chunk in chunks:
+            # The schema of the file is that of the first chunk; chunks of
+            # later matrix files may hold another dtype.
+            if dtypes is None:
+                dtypes = chunk.dtypes
+            else:
+                chunk = chunk.astype(dtypes, copy=False)
+            table = pyarrow.Table.from_pandas(chunk, preserve_index=True)
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(output_file_path,
+                                                       table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_hdf5(chunks, output_file_path):
+    with h5py.File(output_file_path, "w") as out_file:
+        cell_labels = None
+        data = None
+        for chunk in chunks:
+            if data is None:
+                out_file.create_dataset(
+                    "gene_symbol",
+                    data=np.array(chunk.columns, dtype=object),
+                    dtype=h5py.string_dtype()
+                )
+                cell_labels = out_file.create_dataset(
+                    "cell_label", shape=(0,), maxshape=(None,),
+                    dtype=h5py.string_dtype(), chunks=True
+                )
+                data = out_file.create_dataset(
+                    "data", shape=(0, chunk.shape[1]),
+                    maxshape=(None, chunk.shape[1]),
+                    dtype=chunk.dtypes.iloc[0] if chunk.shape[1] > 0
+                    else np.float32,
+                    chunks=True
+                )
+            start = data.shape[0]
+            cell_labels.resize((start + len(chunk),))
+            cell_labels[start:] = np.array(chunk.index, dtype=object)
+            data.resize((start + len(chunk), chunk.shape[1]))
+            data[start:] = chunk.to_numpy()
+
+
+WRITERS = {
+    ".csv": write_csv,
+    ".parquet": write_parquet,
+    ".h5": write_hdf5,
+    ".hdf5": write_hdf5,
+}
 
 
 if __name__ == "__main__":
@@ -52,7 +170,28 @@ if __name__ == "__main__":
         help="A comma-separated list of gene symbols to extract from the "
              "expression matrix."
     )
+    parser.add_argument(
+        "--n_workers",
+        type=int,
+        default=1,
+        help="Number of processes reading expression matrix files at the "
+             "same time. Not supported with --streaming, which reads the "
+             "files one at a time."
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Write the gene data one chunk of cells at a time as it is read "
+             "instead of loading all of it into memory first. The output "
+             "format is chosen from the suffix of output_file_path: .csv, "
+             ".parquet (requires pyarrow) or .h5/.hdf5. Cells are written in "
+             "the order of the expression matrix files, and cells missing "
+             "from their expression matrix are not written."
+    )
     args = parser.parse_args()
+    if args.streaming and args.n_workers != 1:
+        parser.error("--n_workers is not supported with --streaming")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
 
     genes = args.genes.split(",")
     for idx, gene in enumerate(genes):
@@ -88,13 +227,37 @@ if __name__ == "__main__":
     ).set_index('gene_identifier')
 
     print("Processing genes:", genes)
-    gene_data = get_gene_data(
-        abc_atlas_cache=abc_cache,
-        all_cells=cell,
-        all_genes=gene,
-        selected_genes=genes,
-        data_type="raw" if args.use_raw else "log2"
-    )
+    if args.streaming:
+        output_file_path = Path(args.output_file_path).expanduser()
+        suffix = output_file_path.suffix.lower()
+        if suffix not in WRITERS:
+            raise ValueError(
+                f"Unknown output format {suffix}; expected one of "
+                f"{sorted(WRITERS.keys())}"
+            )
+        print("Writing gene data to:", output_file_path)
+        WRITERS[suffix](
+            with_empty_chunk(
+                prefetch(iter_gene_data(
+                    abc_atlas_cache=abc_cache,
+                    all_cells=cell,
+                    all_genes=gene,
+                    selected_genes=genes,
+                    data_type="raw" if args.use_raw else "log2"
+                )),
+                columns=gene.gene_symbol[np.isin(gene.gene_symbol, genes)]
+            ),
+            output_file_path
+        )
+    else:
+        gene_data = get_gene_data(
+            abc_atlas_cache=abc_cache,
+            all_cells=cell,
+            all_genes=gene,
+            selected_genes=genes,
+            data_type="raw" if args.use_raw else "log2",
+            n_workers=args.n_workers
+        )
 
-    print("Writing gene data to:", args.output_file_path)
-    gene_data.to_csv(args.output_file_path)
\ No newline at end of file
+        print("Writing gene data to:", args.output_file_path)
+        gene_data.to_csv(args.output_file_path)
\ No newline at end of file
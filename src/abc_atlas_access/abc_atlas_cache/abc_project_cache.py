@@ -1,4 +1,5 @@
-from typing import Optional, Union, List
+from typing import Dict, Optional, Sequence, Tuple, Union, List
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import logging
 import os
@@ -9,6 +10,10 @@ from abc_atlas_access.abc_atlas_cache.cloud_cache import (
     S3CloudCache,
     LocalCache
 )
+from abc_atlas_access.abc_atlas_cache.metadata_table import (
+    DataFrameMemo,
+    read_metadata_table
+)
 
 
 class AbcProjectCacheVersionException(Exception):
@@ -58,6 +63,7 @@ class AbcProjectCache(object):
         self.cache = cache
         self.skip_version_check = skip_version_check
         self._local = local
+        self._dataframe_memo: Optional[DataFrameMemo] = None
         self.load_manifest()
         self._ui_class_name = self.__class__.__name__
         self.logger = logging.getLogger(self._ui_class_name)
@@ -97,7 +103,12 @@ class AbcProjectCache(object):
         cls,
         cache_dir: Union[str, Path],
         s3_bucket: str = None,
-        auth_required: bool = False
+        auth_required: bool = False,
+        manifest_list_ttl: float = 3600,
+        offline: bool = False,
+        multipart_threshold: int = 64 * 1024**2,
+        multipart_chunksize: int = 16 * 1024**2,
+        max_concurrency: int = 8
     ) -> "ProjectCloudApiBase":
         """Instantiates this object with a connection to a s3 bucket and/or
         a local cache related to that bucket. Will download data from s3 and
@@ -115,6 +126,25 @@ class AbcProjectCache(object):
             ``default`` credentials in a aws credentials file. If False,
             assume the bucket is public and use unsigned access. Defaults to
             False.  
+        manifest_list_ttl: float
+            Number of seconds the listing of the manifests available in the
+            bucket is cached in cache_dir before the bucket is listed again.
+            Defaults to one hour.
+        offline: bool
+            If True, never contact the bucket; only the manifests and data
+            already downloaded into cache_dir are used, and requesting a
+            file that is not downloaded raises a RuntimeError. Defaults to
+            False.
+        multipart_threshold: int
+            Size in bytes above which a file is downloaded as several
+            byte-range parts fetched concurrently rather than as a single
+            stream. Defaults to 64 MB.
+        multipart_chunksize: int
+            Size in bytes of each byte-range part of a multipart download.
+            Defaults to 16 MB.
+        max_concurrency: int
+            Maximum number of threads used to fetch the parts of a multipart
+            download. Defaults to 8.
 
         Returns
         -------
@@ -125,6 +155,11 @@ class AbcProjectCache(object):
         cache = S3CloudCache(cache_dir=cache_dir,
                              bucket_name=s3_bucket,
                              auth_required=auth_required,
+                             manifest_list_ttl=manifest_list_ttl,
+                             offline=offline,
+                             multipart_threshold=multipart_threshold,
+                             multipart_chunksize=multipart_chunksize,
+                             max_concurrency=max_concurrency,
                              ui_class_name=cls.__class__.__name__)
         return cls(cache)
 
@@ -303,7 +338,8 @@ class AbcProjectCache(object):
             directory: str,
             data_kind: str,
             force_download: bool = False,
-            skip_hash_check: bool = False
+            skip_hash_check: bool = False,
+            max_workers: int = 1
     ) -> List[Path]:
         """
         Return a list of all files in a directory. If the cache is local,
@@ -322,6 +358,9 @@ class AbcProjectCache(object):
             locally.
         skip_hash_check: bool
             If True, skip the file hash check for file integrity.
+        max_workers: int
+            Number of files to download at the same time. Ignored when
+            operating on a local cache.
 
         Returns
         -------
@@ -352,14 +391,16 @@ class AbcProjectCache(object):
                 directory=directory,
                 data_kind=data_kind,
                 force_download=force_download,
-                skip_hash_check=skip_hash_check
+                skip_hash_check=skip_hash_check,
+                max_workers=max_workers
             )
 
     def get_directory_metadata(
             self,
             directory: str,
             force_download: bool = False,
-            skip_hash_check: bool = False
+            skip_hash_check: bool = False,
+            max_workers: int = 1
     ) -> List[Path]:
         """
         Return a list of all paths to all metadata files in a directory. If the
@@ -377,7 +418,9 @@ class AbcProjectCache(object):
             locally.
         skip_hash_check: bool
             If True, skip the file hash check for file integrity.
-
+        max_workers: int
+            Number of files to download at the same time. Ignored when
+            operating on a local cache.
 
         Returns
         -------
@@ -388,14 +431,16 @@ class AbcProjectCache(object):
             directory=directory,
             data_kind='metadata',
             force_download=force_download,
-            skip_hash_check=skip_hash_check
+            skip_hash_check=skip_hash_check,
+            max_workers=max_workers
         )
 
     def get_directory_expression_matrices(
             self,
             directory: str,
             force_download: bool = False,
-            skip_hash_check: bool = False
+            skip_hash_check: bool = False,
+            max_workers: int = 1
     ) -> List[Path]:
         """
         Return a list of all expression matrix files in a directory. If the
@@ -413,6 +458,9 @@ class AbcProjectCache(object):
             locally.
         skip_hash_check: bool
             If True, skip the file hash check for file integrity.
+        max_workers: int
+            Number of files to download at the same time. Ignored when
+            operating on a local cache.
 
         Returns
         -------
@@ -423,14 +471,16 @@ class AbcProjectCache(object):
             directory=directory,
             data_kind='expression_matrices',
             force_download=force_download,
-            skip_hash_check=skip_hash_check
+            skip_hash_check=skip_hash_check,
+            max_workers=max_workers
         )
     
     def get_directory_image_volumes(
             self,
             directory: str,
             force_download: bool = False,
-            skip_hash_check: bool = False
+            skip_hash_check: bool = False,
+            max_workers: int = 1
     ) -> List[Path]:
         """
         Return a list of all image volume files in a directory. If the
@@ -448,6 +498,9 @@ class AbcProjectCache(object):
             locally.
         skip_hash_check: bool
             If True, skip the file hash check for file integrity.
+        max_workers: int
+            Number of files to download at the same time. Ignored when
+            operating on a local cache.
 
         Returns
         -------
@@ -458,14 +511,16 @@ class AbcProjectCache(object):
             directory=directory,
             data_kind='image_volumes',
             force_download=force_download,
-            skip_hash_check=skip_hash_check
+            skip_hash_check=skip_hash_check,
+            max_workers=max_workers
         )
     
     def get_directory_mapmycells(
             self,
             directory: str,
             force_download: bool = False,
-            skip_hash_check: bool = False
+            skip_hash_check: bool = False,
+            max_workers: int = 1
     ) -> List[Path]:
         """
         Return a list of all mapmycells files in a directory. If the
@@ -483,6 +538,9 @@ class AbcProjectCache(object):
             locally.
         skip_hash_check: bool
             If True, skip the file hash check for file integrity.
+        max_workers: int
+            Number of files to download at the same time. Ignored when
+            operating on a local cache.
 
         Returns
         -------
@@ -493,7 +551,8 @@ class AbcProjectCache(object):
             directory=directory,
             data_kind='mapmycells',
             force_download=force_download,
-            skip_hash_check=skip_hash_check
+            skip_hash_check=skip_hash_check,
+            max_workers=max_workers
         )
 
     def _warn_directory_size(self, directory: str, data_kind: str):
@@ -603,18 +662,61 @@ class AbcProjectCache(object):
                 skip_hash_check=skip_hash_check
             )
 
+    def enable_dataframe_cache(
+            self,
+            max_bytes: int = 4 * 1024**3,
+            copy: bool = True
+    ) -> None:
+        """
+        Keep the tables returned by get_metadata_dataframe in memory, so
+        that repeated calls with the same arguments do not read the file
+        again. Tables are cached per manifest and dropped, least recently
+        used first, when their total estimated size exceeds max_bytes.
+
+        Parameters
+        ----------
+        max_bytes: int
+            Maximum total estimated size in bytes of the cached tables.
+            Defaults to 4 GB.
+        copy: bool
+            If True, return a copy of the cached table on every call. If
+            False, return a shallow copy that shares its values with the
+            cached table, which is faster but must not be modified in place.
+        """
+        self._dataframe_memo = DataFrameMemo(max_bytes=max_bytes, copy=copy)
+
+    def disable_dataframe_cache(self) -> None:
+        """
+        Stop keeping tables returned by get_metadata_dataframe in memory
+        and drop the tables already cached.
+        """
+        self._dataframe_memo = None
+
     def get_metadata_dataframe(
             self,
             directory: str,
             file_name: str,
             force_download: bool = False,
             skip_hash_check: bool = False,
+            use_columnar_cache: bool = True,
+            columns: Optional[List[str]] = None,
+            filters: Optional[List[tuple]] = None,
+            compact: bool = False,
             **kwargs
     ) -> pd.DataFrame:
         """
         Get the metadata table with the given file name. Download the file if
         using a S3Cache and the file is not currently on disk.
 
+        The first time a table is read, a Parquet copy of it is written next
+        to the csv (if pyarrow is installed) and loaded in place of the csv
+        by later calls. Calls passing the dtype, index_col or parse_dates
+        arguments of pandas.read_csv get a copy of their own, a usecols list
+        of column names reads those columns from the copy and other
+        pandas.read_csv arguments always read the csv.
+        Passing columns and filters reads only the selected part of the
+        table, e.g. ``filters=[('dataset_label', '==', 'WMB-10Xv3')]``.
+
         Parameters
         ----------
         directory: str
@@ -626,6 +728,23 @@ class AbcProjectCache(object):
             locally.
         skip_hash_check: bool
             If True, skip the file hash check for file integrity.
+        use_columnar_cache: bool
+            If True, read and write the Parquet copy of the table.
+        columns: Optional[List[str]]
+            Names of the columns to read. If None, read all columns.
+        filters: Optional[List[tuple]]
+            Only read the rows passing all of these (column, operator, value)
+            filters, where operator is one of '==', '!=', '<', '<=', '>',
+            '>=', 'in' or 'not in'. A list of such lists selects the rows
+            passing any one of them. The index of a filtered table is
+            renumbered from zero unless index_col is given.
+        compact: bool
+            If True, store repeated strings such as labels, colors and
+            cluster names as categoricals and numbers in the narrowest dtype
+            that holds them exactly, which greatly reduces the memory used
+            by large tables. The dtypes are derived from the whole table the
+            first time it is read in compact mode and saved next to the csv;
+            later reads parse the table straight into them.
         **kwargs
            Keyword arguments to pass to pandas.read_csv
 
@@ -634,13 +753,107 @@ class AbcProjectCache(object):
         data_frame: pandas.DataFrame
             Dataframe of the requested metadata file.
         """
+        memo = self._dataframe_memo
+        memo_key = None
+        if memo is not None:
+            # Arguments may be unhashable (lists, dicts of dtypes, ...), so
+            # they are keyed on their representation.
+            memo_key = (self.current_manifest, directory, file_name,
+                        repr(columns), repr(filters), compact,
+                        repr(sorted(kwargs.items())))
+            if not force_download:
+                data = memo.get(memo_key)
+                if data is not None:
+                    return data
+
         path = self.get_file_path(
             directory=directory,
             file_name=file_name,
             force_download=force_download,
             skip_hash_check=skip_hash_check
         )
-        return pd.read_csv(path, **kwargs)
+        file_hash = None
+        if use_columnar_cache:
+            file_hash = self.cache.get_file_path(
+                directory=directory,
+                file_name=file_name
+            )['file_attributes'].file_hash
+        data = read_metadata_table(
+            path,
+            file_hash=file_hash,
+            columns=columns,
+            filters=filters,
+            compact=compact,
+            **kwargs
+        )
+        if memo is not None:
+            memo.put(memo_key, data)
+        return data
+
+    def get_metadata_dataframes(
+            self,
+            tables: Sequence[tuple],
+            force_download: bool = False,
+            skip_hash_check: bool = False,
+            max_workers: int = 4
+    ) -> Dict[Tuple[str, str], pd.DataFrame]:
+        """
+        Get several metadata tables at once. The tables are downloaded if
+        needed and read concurrently, so that loading them takes about as
+        long as loading the largest one.
+
+        Parameters
+        ----------
+        tables: Sequence[tuple]
+            The tables to get, each given as a (directory, file_name) tuple
+            or a (directory, file_name, kwargs) tuple where kwargs is a dict
+            of keyword arguments to pass to get_metadata_dataframe for that
+            table (e.g. columns, filters, compact or pandas.read_csv
+            arguments).
+        force_download: bool
+            If True, force the files to be downloaded even if they already
+            exist locally.
+        skip_hash_check: bool
+            If True, skip the file hash check for file integrity.
+        max_workers: int
+            Maximum number of tables to download and read at the same time.
+
+        Returns
+        -------
+        data_frames: Dict[Tuple[str, str], pandas.DataFrame]
+            The tables keyed on (directory, file_name), in the order
+            requested.
+
+        Raises
+        ------
+        ValueError
+            If a table is requested more than once or max_workers is not
+            positive. Any error raised getting a table is raised once all
+            tables have been attempted.
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be a positive integer; "
+                             f"got {max_workers}")
+        requests = {}
+        for table in tables:
+            directory, file_name = table[0], table[1]
+            kwargs = table[2] if len(table) > 2 else {}
+            if (directory, file_name) in requests:
+                raise ValueError(f"{file_name} in directory {directory} is "
+                                 "requested more than once")
+            requests[(directory, file_name)] = kwargs
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                key: executor.submit(self.get_metadata_dataframe,
+                                     directory=key[0],
+                                     file_name=key[1],
+                                     force_download=force_download,
+                                     skip_hash_check=skip_hash_check,
+                                     **kwargs)
+                for key, kwargs in requests.items()
+            }
+        return {key: future.result() for key, future in futures.items()}
 
     def _get_local_path(
             self,
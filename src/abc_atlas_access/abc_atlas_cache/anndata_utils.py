@@ -1,10 +1,20 @@
-from typing import List
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from pathlib import Path
+import logging
+import os
 import time
+import h5py
 import pandas as pd
 import numpy as np
 import anndata
+import scipy.sparse
 import warnings
 from abc_atlas_access.abc_atlas_cache.abc_project_cache import AbcProjectCache
+from abc_atlas_access.abc_atlas_cache.gene_data_cache import GeneDataCache
+
+logger = logging.getLogger(__name__)
 
 
 def get_gene_data(
@@ -13,7 +23,13 @@ def get_gene_data(
     all_genes: pd.DataFrame,
     selected_genes: List[str],
     data_type: str = "log2",
-    chunk_size: int = 8192
+    chunk_size: int = 8192,
+    n_workers: int = 1,
+    max_memory: Optional[int] = None,
+    result_cache: Optional[GeneDataCache] = None,
+    output: str = "dataframe",
+    dtype: Optional[np.dtype] = None,
+    stats_callback: Optional[Callable[[dict], None]] = None
 ):
     """Load expression matrix data from the ABC Atlas and extract data for
     specific genes.
@@ -40,85 +56,1319 @@ def get_gene_data(
         Kind of expression matrix to load either "log2" or "raw". Defaults to
         "log2".
     chunk_size: int (Default: 8192)
-        Size of the chunk to load from the anndata files. Adjust this size if
-        needed based on memory/file io. Default: 8192.
+        Maximum number of rows to load from the anndata files at once. Only
+        the rows spanning requested cells are read, so runs of unrequested
+        cells longer than this are skipped. Adjust this size if needed based
+        on memory/file io. Default: 8192.
+    n_workers: int (Default: 1)
+        Number of processes reading expression matrix files at the same
+        time. Each file is read by one process. Default: 1.
+    max_memory: int (Default: None)
+        Approximate maximum number of bytes of expression matrix data held
+        in memory at once by all processes. The number of rows loaded at once
+        is reduced below chunk_size to fit if needed. Default: no limit.
+    result_cache: GeneDataCache (Default: None)
+        Cache of previously extracted genes. Genes found in the cache for
+        the same manifest, data_type and cells are not read from the
+        expression matrices, and the genes that are read are added to it.
+    output: str (Default: "dataframe")
+        Type of the returned data: "dataframe" for a dense pandas.DataFrame,
+        "sparse" for a scipy.sparse.csr_matrix of cells by genes, or
+        "anndata" for an anndata.AnnData with a sparse X, all_cells as obs and
+        the selected rows of all_genes as var. The sparse outputs are built
+        without a dense copy of the data.
+    dtype: numpy.dtype (Default: None)
+        dtype to store the data as, e.g. numpy.float32 for log2 data or an
+        integer type for raw counts, to reduce the memory used. Values are
+        converted as they are read. If None, use the dtype of the expression
+        matrices.
+    stats_callback: Callable (Default: None)
+        Function called with a dict of statistics after each expression
+        matrix file is read. See Notes. The statistics are also logged to
+        the logger of this module at INFO level.
+
+    Notes
+    -----
+    If a gene-major copy of an expression matrix file has been created with
+    create_gene_major_copy, only the columns of the requested genes are read
+    from the copy instead of reading the rows of every requested cell.
+
+    Cells that are not found in their expression matrix are NaN in floating
+    point dense output and 0 in integer or sparse output.
+
+    The statistics of each expression matrix file have the keys:
+
+    - directory, matrix: the directory and name of the expression matrix
+    - file_path: path to the file read
+    - wall_time, cpu_time: wall clock and CPU time in seconds spent reading
+      the file (CPU time of the worker process if n_workers > 1)
+    - bytes_read: bytes of matrix data read
+    - chunks: number of blocks of rows (or of genes, when reading a
+      gene-major copy) read
+    - cells_kept: number of requested cells found in the file
+    - cells_skipped: number of cells of the file that were not requested
 
     Returns
     -------
-    output_gene_data: pandas.DataFrame
+    output_gene_data: pandas.DataFrame, scipy.sparse.csr_matrix or
+    anndata.AnnData
         Subset of gene data indexed by cell.
     """
-    # Create a mask for the requested genes.
-    gene_mask = np.isin(all_genes.gene_symbol, selected_genes)
-    gene_filtered = all_genes[gene_mask]
-    if len(gene_filtered) > len(selected_genes):
-        msg = (
-            f"You asked for {len(selected_genes)} genes, but "
-            f"get_gene_data is selecting {len(gene_filtered)}; "
-            "probably some of the gene symbols you specified are "
-            "associated with more than one gene"
+    if n_workers < 1:
+        raise ValueError("n_workers must be a positive integer; "
+                         f"got {n_workers}")
+    if output not in ("dataframe", "sparse", "anndata"):
+        raise ValueError("output must be one of 'dataframe', 'sparse' or "
+                         f"'anndata'; got {output}")
+    sparse = output != "dataframe"
+    if sparse and dtype is not None and np.dtype(dtype) not in _SPARSE_DTYPES:
+        raise ValueError(f"dtype {np.dtype(dtype)} is not supported by "
+                         f"scipy.sparse for {output} output; dtype must be "
+                         "one of "
+                         f"{', '.join(str(d) for d in _SPARSE_DTYPES)}")
+
+    gene_filtered, gene_positions = _find_genes(
+        all_genes, selected_genes, "get_gene_data"
+    )
+
+    if result_cache is None:
+        output_gene_data = _load_gene_data(
+            abc_atlas_cache=abc_atlas_cache,
+            all_cells=all_cells,
+            gene_positions=gene_positions,
+            data_type=data_type,
+            chunk_size=chunk_size,
+            n_workers=n_workers,
+            max_memory=max_memory,
+            sparse=sparse,
+            dtype=dtype,
+            stats_callback=stats_callback
         )
-        warnings.warn(msg)
+    else:
+        cells_fingerprint = result_cache.cells_fingerprint(all_cells)
+        keys = [
+            result_cache.key(
+                manifest=abc_atlas_cache.current_manifest,
+                data_type=data_type,
+                gene_identifier=gene_identifier,
+                cells_fingerprint=cells_fingerprint
+            )
+            for gene_identifier in gene_filtered.index
+        ]
+        columns = [result_cache.get(key) for key in keys]
+        missing = [idx for idx, column in enumerate(columns)
+                   if column is None]
+        if len(missing) > 0:
+            loaded = _load_gene_data(
+                abc_atlas_cache=abc_atlas_cache,
+                all_cells=all_cells,
+                gene_positions=gene_positions[missing],
+                data_type=data_type,
+                chunk_size=chunk_size,
+                n_workers=n_workers,
+                max_memory=max_memory,
+                stats_callback=stats_callback
+            )
+            for loaded_idx, idx in enumerate(missing):
+                columns[idx] = loaded[:, loaded_idx]
+                result_cache.put(keys[idx], columns[idx], evict=False)
+            # Evict once for all the new genes rather than after each one.
+            result_cache.evict(keep=keys)
+        # The cached genes keep the dtype of the expression matrices and
+        # are converted as requested here.
+        if sparse:
+            output_gene_data = _columns_to_csr(columns, len(all_cells), dtype)
+        elif len(columns) > 0:
+            output_gene_data = np.column_stack(columns)
+            if dtype is not None:
+                if not np.issubdtype(dtype, np.floating):
+                    # Cells missing from their matrix are NaN in the cache
+                    # and 0 in integer output, as in _empty_output.
+                    output_gene_data = np.nan_to_num(output_gene_data,
+                                                     nan=0)
+                output_gene_data = output_gene_data.astype(dtype)
+        else:
+            output_gene_data = np.empty((len(all_cells), 0), dtype=dtype)
+
+    if output == "sparse":
+        return output_gene_data
+    if output == "anndata":
+        return anndata.AnnData(
+            X=output_gene_data,
+            obs=all_cells,
+            var=gene_filtered
+        )
+    return pd.DataFrame(
+        output_gene_data,
+        index=all_cells.index,
+        columns=pd.Index(gene_filtered.gene_symbol)
+    )
+
+
+def _columns_to_csr(
+    columns: List[np.ndarray],
+    num_cells: int,
+    dtype: Optional[np.dtype]
+) -> scipy.sparse.csr_matrix:
+    """Build a sparse matrix of cells by genes from the dense expression of
+    each gene, treating missing (NaN) values as 0.
+    """
+    if dtype is None:
+        dtype = np.result_type(*columns) if len(columns) > 0 else np.float64
+    output = _SparseBlocks()
+    for col, values in enumerate(columns):
+        rows = np.flatnonzero((values != 0) & ~np.isnan(values)) \
+            if np.issubdtype(values.dtype, np.floating) \
+            else np.flatnonzero(values)
+        output.add_column(rows, col, values[rows])
+    return output.to_csr((num_cells, len(columns)), dtype)
+
 
-    # wait to create output dataframe until we have read in the
-    # first chunk and know the dtype we need
-    output_gene_data = None
+def _load_gene_data(
+    abc_atlas_cache: AbcProjectCache,
+    all_cells: pd.DataFrame,
+    gene_positions: np.ndarray,
+    data_type: str,
+    chunk_size: int,
+    n_workers: int,
+    max_memory: Optional[int],
+    sparse: bool = False,
+    dtype: Optional[np.dtype] = None,
+    stats_callback: Optional[Callable[[dict], None]] = None
+) -> Union[np.ndarray, scipy.sparse.csr_matrix]:
+    """Read the expression of genes in a set of cells from the expression
+    matrices. See get_gene_data for the parameters.
 
+    Returns
+    -------
+    numpy.ndarray or scipy.sparse.csr_matrix
+        Array of cells by genes; sparse if sparse is True.
+    """
     num_total_cells = len(all_cells)
 
     # Get the names of the data in the ABC atlas that we need
-    # to load.
+    # to load, with the output rows of the cells found in each.
     matrices = all_cells.groupby(
-        ['dataset_label', 'feature_matrix_label']
-    )[[all_cells.columns[0]]].count()
-    matrices.columns = ['cell_count']
+        ['dataset_label', 'feature_matrix_label'], observed=True
+    ).indices
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    file_paths = {}
+    for directory, matrix_file in sorted(matrices.keys()):
+        file_paths[(directory, matrix_file)] = abc_atlas_cache.get_file_path(
+            directory=directory,
+            file_name=f"{matrix_file}/{data_type}"
+        )
+    if dtype is None:
+        dtype = np.result_type(*[_matrix_dtype(file_path)
+                                 for file_path in file_paths.values()])
+    dtype = np.dtype(dtype)
+    shape = (num_total_cells, len(gene_positions))
+    # Budget of expression data read at once by each worker.
+    worker_memory = None if max_memory is None else max_memory / n_workers
+
+    def _report(matrix_index, stats):
+        stats = {'directory': matrix_index[0], 'matrix': matrix_index[1],
+                 **stats}
+        _report_file_stats(stats, stats_callback)
+        return stats['cells_kept']
 
-    total_start = time.process_time()
     # Loop over all data files.
     num_processed_cells = 0
-    for matrix_index in matrices.index:
-        directory = matrix_index[0]
-        matrix_file = matrix_index[1]
+    if n_workers == 1:
+        if sparse:
+            output_gene_data = _SparseBlocks()
+        else:
+            output_gene_data = _empty_output(shape, dtype)
+        for matrix_index, file_path in file_paths.items():
+            logger.info("loading file: %s", matrix_index[1])
+            num_processed_cells += _report(matrix_index, _read_matrix_genes(
+                file_path=file_path,
+                cell_labels=all_cells.index[matrices[matrix_index]],
+                cell_positions=matrices[matrix_index],
+                gene_positions=gene_positions,
+                chunk_size=chunk_size,
+                output=output_gene_data,
+                max_memory=worker_memory
+            ))
+        if sparse:
+            output_gene_data = output_gene_data.to_csr(shape, dtype)
+    elif sparse:
+        # Workers return the non-zero values they read.
+        output_gene_data = _SparseBlocks()
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {
+                executor.submit(
+                    _read_matrix_genes_sparse,
+                    file_path=file_path,
+                    cell_labels=all_cells.index[matrices[matrix_index]],
+                    cell_positions=matrices[matrix_index],
+                    gene_positions=gene_positions,
+                    chunk_size=chunk_size,
+                    max_memory=worker_memory
+                ): matrix_index
+                for matrix_index, file_path in file_paths.items()
+            }
+            for future in as_completed(futures):
+                file_stats, file_output = future.result()
+                output_gene_data.extend(file_output)
+                num_processed_cells += _report(futures[future], file_stats)
+        output_gene_data = output_gene_data.to_csr(shape, dtype)
+    else:
+        # Workers write the rows of their cells directly into an output
+        # array in shared memory.
+        output_memory = shared_memory.SharedMemory(
+            create=True,
+            size=max(int(np.prod(shape)) * dtype.itemsize, 1)
+        )
+        try:
+            output_view = np.ndarray(shape, dtype=dtype,
+                                     buffer=output_memory.buf)
+            output_view[:] = _empty_output((1, 1), dtype)[0, 0]
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                futures = {
+                    executor.submit(
+                        _read_matrix_genes_shared,
+                        memory_name=output_memory.name,
+                        shape=shape,
+                        dtype=dtype,
+                        file_path=file_path,
+                        cell_labels=all_cells.index[matrices[matrix_index]],
+                        cell_positions=matrices[matrix_index],
+                        gene_positions=gene_positions,
+                        chunk_size=chunk_size,
+                        max_memory=worker_memory
+                    ): matrix_index
+                    for matrix_index, file_path in file_paths.items()
+                }
+                for future in as_completed(futures):
+                    num_processed_cells += _report(futures[future],
+                                                   future.result())
+            output_gene_data = output_view.copy()
+            del output_view
+        finally:
+            output_memory.close()
+            output_memory.unlink()
+
+    logger.info(
+        "total: %.2f s wall, %.2f s cpu, total cells: %d, "
+        "processed cells: %d",
+        time.perf_counter() - wall_start, time.process_time() - cpu_start,
+        num_total_cells, num_processed_cells
+    )
+    return output_gene_data
 
-        print("loading file:", matrix_file)
 
+def iter_gene_data(
+    abc_atlas_cache: AbcProjectCache,
+    all_cells: pd.DataFrame,
+    all_genes: pd.DataFrame,
+    selected_genes: List[str],
+    data_type: str = "log2",
+    chunk_size: int = 8192,
+    max_memory: Optional[int] = None,
+    dtype: Optional[np.dtype] = None,
+    stats_callback: Optional[Callable[[dict], None]] = None
+) -> Iterator[pd.DataFrame]:
+    """Load expression matrix data from the ABC Atlas and extract data for
+    specific genes, one chunk of cells at a time.
+
+    Unlike get_gene_data, the data of all cells is never held in memory at
+    once, so the chunks can be written out as they are read (see
+    scripts/create_gene_expression.py).
+
+    Parameters
+    ----------
+    abc_atlas_cache: AbcProjectCache
+        An AbcProjectCache instance object to handle downloading and serving
+        the path to the expression matrix data.
+    all_cells: pandas.DataFrame
+        cells metadata loaded as a pandas Dataframe from the AbcProjectCache
+        indexed on cell_label.
+    all_genes: pandas.DataFrame
+        genes metadata loaded as a pandas Dataframe from the AbcProjectCache
+        indexed on gene_identifier.
+    selected_genes: list of strings
+        List of gene_symbols that are a subset of those in the full genes
+        DataFrame.
+    data_type: str (Default: "log2")
+        Kind of expression matrix to load either "log2" or "raw". Defaults to
+        "log2".
+    chunk_size: int (Default: 8192)
+        Maximum number of rows to load from the anndata files at once.
+        Default: 8192.
+    max_memory: int (Default: None)
+        Approximate maximum number of bytes of expression matrix data held
+        in memory at once. The number of rows loaded at once is reduced below
+        chunk_size to fit if needed. Default: no limit.
+    dtype: numpy.dtype (Default: None)
+        dtype to convert the data to. If None, use the dtype of the
+        expression matrices.
+    stats_callback: Callable (Default: None)
+        Function called with a dict of statistics after each expression
+        matrix file is read (see get_gene_data).
+
+    Yields
+    ------
+    pandas.DataFrame
+        Gene data of a chunk of cells, indexed by cell. Cells are yielded in
+        the order of the expression matrix files and of the rows within
+        them, not in the order of all_cells; cells that are not found in
+        their expression matrix are not yielded. The rows of the expression
+        matrices are always read, even if gene-major copies exist.
+    """
+    gene_filtered, gene_positions = _find_genes(
+        all_genes, selected_genes, "iter_gene_data"
+    )
+    columns = pd.Index(gene_filtered.gene_symbol)
+    matrices = all_cells.groupby(
+        ['dataset_label', 'feature_matrix_label'], observed=True
+    ).indices
+    for directory, matrix_file in sorted(matrices.keys()):
         file_path = abc_atlas_cache.get_file_path(
             directory=directory,
             file_name=f"{matrix_file}/{data_type}"
         )
+        logger.info("loading file: %s", matrix_file)
+        stats = {'directory': directory,
+                 'matrix': matrix_file,
+                 'file_path': str(file_path),
+                 'bytes_read': 0,
+                 'chunks': 0,
+                 'cells_kept': 0,
+                 'cells_skipped': 0,
+                 'wall_time': 0.0,
+                 'cpu_time': 0.0}
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        for rows, block in _iter_matrix_rows(
+                file_path=file_path,
+                cell_labels=all_cells.index[matrices[(directory,
+                                                      matrix_file)]],
+                cell_positions=matrices[(directory, matrix_file)],
+                gene_positions=gene_positions,
+                chunk_size=chunk_size,
+                max_memory=max_memory,
+                stats=stats):
+            if dtype is not None:
+                block = block.astype(dtype, copy=False)
+            chunk_data = pd.DataFrame(block, index=all_cells.index[rows],
+                                      columns=columns)
+            # Only count the time spent reading, not the time the caller
+            # spends on the chunks.
+            stats['wall_time'] += time.perf_counter() - wall_start
+            stats['cpu_time'] += time.process_time() - cpu_start
+            yield chunk_data
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+        stats['wall_time'] += time.perf_counter() - wall_start
+        stats['cpu_time'] += time.process_time() - cpu_start
+        _report_file_stats(stats, stats_callback)
+
+
+def aggregate_gene_data(
+    abc_atlas_cache: AbcProjectCache,
+    all_cells: pd.DataFrame,
+    all_genes: pd.DataFrame,
+    group_by: Union[str, List[str]],
+    selected_genes: Optional[List[str]] = None,
+    statistics: Tuple[str, ...] = ("mean", "fraction"),
+    data_type: str = "log2",
+    chunk_size: int = 8192
+) -> Dict[str, pd.DataFrame]:
+    """Compute statistics of gene expression for groups of cells (e.g.
+    clusters or regions) in the ABC Atlas.
 
-        start = time.process_time()
+    The expression matrices are read once, chunk by chunk, and the
+    statistics of every group are accumulated with sparse matrix products,
+    so the expression of the individual cells is never held in memory.
+
+    Parameters
+    ----------
+    abc_atlas_cache: AbcProjectCache
+        An AbcProjectCache instance object to handle downloading and serving
+        the path to the expression matrix data.
+    all_cells: pandas.DataFrame
+        cells metadata loaded as a pandas Dataframe from the AbcProjectCache
+        indexed on cell_label.
+    all_genes: pandas.DataFrame
+        genes metadata loaded as a pandas Dataframe from the AbcProjectCache
+        indexed on gene_identifier.
+    group_by: str or list of str
+        Column(s) of all_cells to group the cells by. Cells with a missing
+        value in any of these columns are ignored.
+    selected_genes: list of strings (Default: None)
+        List of gene_symbols that are a subset of those in the full genes
+        DataFrame. If None, compute the statistics of all genes.
+    statistics: tuple of str (Default: ("mean", "fraction"))
+        Statistics to compute. Any of "sum", "mean", "fraction" (fraction of
+        cells with non-zero expression) and "var" (sample variance).
+    data_type: str (Default: "log2")
+        Kind of expression matrix to load either "log2" or "raw". Defaults to
+        "log2".
+    chunk_size: int (Default: 8192)
+        Maximum number of rows to load from the anndata files at once.
+        Default: 8192.
+
+    Returns
+    -------
+    dict of pandas.DataFrame
+        For each requested statistic, a DataFrame of groups by genes.
+    """
+    unknown = set(statistics).difference(_AGGREGATE_STATISTICS)
+    if len(unknown) > 0:
+        raise ValueError(
+            f"Unknown statistics {sorted(unknown)}; statistics must be in "
+            f"{_AGGREGATE_STATISTICS}"
+        )
+    if selected_genes is None:
+        gene_filtered = all_genes
+        gene_positions = None
+    else:
+        gene_filtered, gene_positions = _find_genes(
+            all_genes, selected_genes, "aggregate_gene_data"
+        )
+    num_genes = len(gene_filtered)
+
+    # Group number of each cell; -1 for cells without a group.
+    grouped = all_cells.groupby(group_by, sort=True, observed=True)
+    group_codes = grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    group_index = grouped.size().index
+    num_groups = len(group_index)
+
+    counts = np.zeros(num_groups, dtype=np.int64)
+    sums = np.zeros((num_groups, num_genes), dtype=np.float64)
+    nonzero = np.zeros((num_groups, num_genes), dtype=np.int64) \
+        if "fraction" in statistics else None
+    squares = np.zeros((num_groups, num_genes), dtype=np.float64) \
+        if "var" in statistics else None
+
+    matrices = all_cells[group_codes >= 0].groupby(
+        ['dataset_label', 'feature_matrix_label'], observed=True
+    ).indices
+    for directory, matrix_file in sorted(matrices.keys()):
+        file_path = abc_atlas_cache.get_file_path(
+            directory=directory,
+            file_name=f"{matrix_file}/{data_type}"
+        )
         expression_data = anndata.read_h5ad(file_path, backed='r')
-        obs = expression_data.obs
-        # Loop over each chunk of the file, slicing by gene
-        # and storing the data in the output DataFrame.
-        for chunk, min_idx, max_idx in expression_data.chunked_X(
-                chunk_size=chunk_size):
-            cell_indexes = obs.index[min_idx:max_idx]
-            cell_mask = cell_indexes.isin(all_cells.index)
-            subcell_indexes = cell_indexes[cell_mask]
-            num_processed_cells += len(subcell_indexes)
-
-            chunk = chunk.toarray()[cell_mask, :][:, gene_mask]
-
-            if output_gene_data is None:
-                output_gene_data = pd.DataFrame(
-                    index=all_cells.index,
-                    columns=gene_filtered.index,
-                    dtype=chunk.dtype
+        try:
+            # Group of each cell of the file; -1 for cells that were not
+            # requested.
+            cell_rows = all_cells.index.get_indexer(
+                expression_data.obs.index
+            )
+            cell_groups = np.where(cell_rows >= 0,
+                                   group_codes[cell_rows], -1)
+            for min_idx, max_idx in _row_blocks(
+                    np.flatnonzero(cell_groups >= 0), chunk_size):
+                chunk_groups = cell_groups[min_idx:max_idx]
+                cell_mask = chunk_groups >= 0
+                chunk = expression_data.X[min_idx:max_idx]
+                chunk = scipy.sparse.csr_matrix(chunk)[cell_mask]
+                if gene_positions is not None:
+                    chunk = chunk[:, gene_positions]
+                chunk_groups = chunk_groups[cell_mask]
+
+                # Sparse (groups x cells) indicator matrix over only the
+                # groups present in the chunk, so that the sums over each
+                # group are a single matrix product and the dense partial
+                # results stay as small as the chunk.
+                present, local = np.unique(chunk_groups, return_inverse=True)
+                indicator = scipy.sparse.csr_matrix(
+                    (np.ones(len(local)), (local, np.arange(len(local)))),
+                    shape=(len(present), len(local))
                 )
+                counts[present] += np.bincount(local,
+                                               minlength=len(present))
+                sums[present] += (indicator @ chunk).toarray()
+                if nonzero is not None:
+                    nonzero[present] += (
+                        indicator @ (chunk != 0)
+                    ).toarray().astype(np.int64)
+                if squares is not None:
+                    # Square in float64, as integer (raw count) matrices
+                    # would overflow in their own dtype.
+                    values = chunk.astype(np.float64)
+                    squares[present] += (
+                        indicator @ values.multiply(values)
+                    ).toarray()
+        finally:
+            expression_data.file.close()
+
+    output = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_group = counts[:, np.newaxis]
+        if "sum" in statistics:
+            output["sum"] = sums
+        if "mean" in statistics:
+            output["mean"] = sums / per_group
+        if "fraction" in statistics:
+            output["fraction"] = nonzero / per_group
+        if "var" in statistics:
+            output["var"] = np.where(
+                per_group > 1,
+                (squares - sums**2 / per_group) / (per_group - 1),
+                np.nan
+            )
+    columns = pd.Index(gene_filtered.gene_symbol)
+    return {
+        statistic: pd.DataFrame(values, index=group_index, columns=columns)
+        for statistic, values in output.items()
+    }
+
+
+_AGGREGATE_STATISTICS = ("sum", "mean", "fraction", "var")
+
+# dtypes that scipy.sparse matrices can hold (float16 is not one of them).
+_SPARSE_DTYPES = tuple(np.dtype(dtype) for dtype in (
+    np.bool_, np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32,
+    np.int64, np.uint64, np.float32, np.float64, np.longdouble,
+    np.complex64, np.complex128, np.clongdouble
+))
+
+
+def _find_genes(
+    all_genes: pd.DataFrame,
+    selected_genes: List[str],
+    function_name: str
+) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Find the requested genes in the genes metadata.
 
-            output_gene_data.loc[
-                    subcell_indexes, gene_filtered.index] = chunk
+    Parameters
+    ----------
+    all_genes: pandas.DataFrame
+        genes metadata loaded as a pandas Dataframe from the AbcProjectCache
+        indexed on gene_identifier.
+    selected_genes: list of strings
+        List of gene_symbols that are a subset of those in the full genes
+        DataFrame.
+    function_name: str
+        Name of the function the genes are selected for (used in warning
+        messages).
 
+    Returns
+    -------
+    gene_filtered: pandas.DataFrame
+        The rows of all_genes of the requested genes.
+    gene_positions: numpy.ndarray
+        Column positions of the requested genes in the expression matrices.
+    """
+    gene_mask = np.isin(all_genes.gene_symbol, selected_genes)
+    gene_filtered = all_genes[gene_mask]
+    if len(gene_filtered) > len(selected_genes):
+        msg = (
+            f"You asked for {len(selected_genes)} genes, but "
+            f"{function_name} is selecting {len(gene_filtered)}; "
+            "probably some of the gene symbols you specified are "
+            "associated with more than one gene"
+        )
+        warnings.warn(msg)
+    return gene_filtered, np.flatnonzero(gene_mask)
+
+
+def _report_file_stats(
+    stats: dict,
+    stats_callback: Optional[Callable[[dict], None]]
+):
+    """Log the statistics of the reading of an expression matrix file and
+    pass them to stats_callback.
+    """
+    logger.info(
+        "%s/%s: %.2f s wall, %.2f s cpu, %d bytes read in %d chunks, "
+        "%d cells kept, %d cells skipped",
+        stats['directory'], stats['matrix'], stats['wall_time'],
+        stats['cpu_time'], stats['bytes_read'], stats['chunks'],
+        stats['cells_kept'], stats['cells_skipped']
+    )
+    if stats_callback is not None:
+        stats_callback(stats)
+
+
+def _read_matrix_genes(
+    file_path: Union[str, Path],
+    cell_labels: pd.Index,
+    cell_positions: np.ndarray,
+    gene_positions: np.ndarray,
+    chunk_size: int,
+    output: Union[np.ndarray, "_SparseBlocks"],
+    max_memory: Optional[float] = None
+) -> dict:
+    """Read the requested genes of the requested cells of one expression
+    matrix file into the output array.
+
+    Parameters
+    ----------
+    file_path: str or pathlib.Path
+        Path to the h5ad file.
+    cell_labels: pandas.Index
+        Labels of the requested cells that are expected in this file.
+    cell_positions: numpy.ndarray
+        Output row of each of cell_labels.
+    gene_positions: numpy.ndarray
+        Column positions of the genes to read.
+    chunk_size: int
+        Maximum number of rows to read at once.
+    output: numpy.ndarray or _SparseBlocks
+        Array of cells by genes to write into, or collection of the
+        non-zero values of the output to add to.
+    max_memory: Optional[float]
+        Approximate maximum number of bytes of the matrix to read at once.
+        The number of rows read at once is reduced to fit if needed.
+
+    Returns
+    -------
+    dict
+        Statistics of the reading of the file (see get_gene_data).
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    stats = {'file_path': str(file_path),
+             'bytes_read': 0,
+             'chunks': 0,
+             'cells_kept': 0,
+             'cells_skipped': 0}
+    copy_path = gene_major_path(file_path)
+    if _is_current_gene_major(file_path, copy_path):
+        _read_gene_major_genes(
+            copy_path=copy_path,
+            cell_labels=cell_labels,
+            cell_positions=cell_positions,
+            gene_positions=gene_positions,
+            output=output,
+            stats=stats
+        )
+    else:
+        _read_matrix_rows(
+            file_path=file_path,
+            cell_labels=cell_labels,
+            cell_positions=cell_positions,
+            gene_positions=gene_positions,
+            chunk_size=chunk_size,
+            output=output,
+            max_memory=max_memory,
+            stats=stats
+        )
+    stats['wall_time'] = time.perf_counter() - wall_start
+    stats['cpu_time'] = time.process_time() - cpu_start
+    return stats
+
+
+def _read_matrix_rows(
+    file_path: Union[str, Path],
+    cell_labels: pd.Index,
+    cell_positions: np.ndarray,
+    gene_positions: np.ndarray,
+    chunk_size: int,
+    output: Union[np.ndarray, "_SparseBlocks"],
+    max_memory: Optional[float],
+    stats: dict
+):
+    """Read the requested genes of the requested cells from the rows of an
+    h5ad file, adding to the counts in stats. See _read_matrix_genes for the
+    parameters.
+    """
+    as_sparse = isinstance(output, _SparseBlocks)
+    for rows, block in _iter_matrix_rows(
+            file_path=file_path,
+            cell_labels=cell_labels,
+            cell_positions=cell_positions,
+            gene_positions=gene_positions,
+            chunk_size=chunk_size,
+            max_memory=max_memory,
+            stats=stats,
+            as_sparse=as_sparse):
+        if as_sparse:
+            output.add_rows(rows, block)
+        else:
+            output[rows] = block
+
+
+def _iter_matrix_rows(
+    file_path: Union[str, Path],
+    cell_labels: pd.Index,
+    cell_positions: np.ndarray,
+    gene_positions: np.ndarray,
+    chunk_size: int,
+    max_memory: Optional[float],
+    stats: dict,
+    as_sparse: bool = False
+) -> Iterator[Tuple[np.ndarray, Union[np.ndarray, scipy.sparse.csr_matrix]]]:
+    """Read the requested genes of the requested cells from the rows of an
+    h5ad file one block of rows at a time, adding to the counts in stats.
+    See _read_matrix_genes for the parameters.
+
+    Yields
+    ------
+    tuple
+        The output rows of the cells of a block and the block of cells by
+        genes (sparse if as_sparse is True).
+    """
+    expression_data = anndata.read_h5ad(file_path, backed='r')
+    try:
+        # Row of each cell of the file in the output; -1 for cells that
+        # were not requested.
+        label_rows = cell_labels.get_indexer(expression_data.obs.index)
+        output_rows = np.where(label_rows >= 0,
+                               cell_positions[label_rows], -1)
+        if max_memory is not None:
+            chunk_size = max(1, min(
+                chunk_size,
+                int(max_memory / _matrix_bytes_per_row(expression_data))
+            ))
+
+        stats['cells_kept'] = int(np.count_nonzero(output_rows >= 0))
+        stats['cells_skipped'] = len(output_rows) - stats['cells_kept']
+        # Loop over the chunks of the file that contain requested cells,
+        # slicing by gene.
+        for min_idx, max_idx in _row_blocks(
+                np.flatnonzero(output_rows >= 0), chunk_size):
+            chunk = expression_data.X[min_idx:max_idx]
+            stats['chunks'] += 1
+            stats['bytes_read'] += _nbytes(chunk)
+            chunk_rows = output_rows[min_idx:max_idx]
+            cell_mask = chunk_rows >= 0
+            yield chunk_rows[cell_mask], _select_genes(
+                chunk, cell_mask, gene_positions, as_sparse=as_sparse)
+    finally:
+        expression_data.file.close()
+
+
+def _nbytes(chunk) -> int:
+    """Number of bytes of a dense or sparse chunk of a matrix."""
+    if scipy.sparse.issparse(chunk):
+        return chunk.data.nbytes + chunk.indices.nbytes + chunk.indptr.nbytes
+    return np.asarray(chunk).nbytes
+
+
+def _read_matrix_genes_shared(
+    memory_name: str,
+    shape: Tuple[int, int],
+    dtype: np.dtype,
+    **kwargs
+) -> dict:
+    """Run _read_matrix_genes in a worker process, writing into an output
+    array in the named shared memory block.
+
+    Parameters
+    ----------
+    memory_name: str
+        Name of the shared memory block holding the output.
+    shape: tuple
+        Shape of the output array.
+    dtype: numpy.dtype
+        dtype of the output array.
+    **kwargs
+        Remaining arguments of _read_matrix_genes.
+
+    Returns
+    -------
+    dict
+        Statistics of the reading of the file.
+    """
+    output_memory = shared_memory.SharedMemory(name=memory_name)
+    try:
+        output = np.ndarray(shape, dtype=dtype, buffer=output_memory.buf)
+        result = _read_matrix_genes(output=output, **kwargs)
+        del output
+    finally:
+        output_memory.close()
+    return result
+
+
+def _read_matrix_genes_sparse(**kwargs) -> Tuple[dict, "_SparseBlocks"]:
+    """Run _read_matrix_genes in a worker process, collecting the non-zero
+    values read.
+
+    Parameters
+    ----------
+    **kwargs
+        Arguments of _read_matrix_genes other than output.
+
+    Returns
+    -------
+    tuple
+        Statistics of the reading of the file and the values read.
+    """
+    output = _SparseBlocks()
+    return _read_matrix_genes(output=output, **kwargs), output
+
+
+def _matrix_dtype(file_path: Union[str, Path]) -> np.dtype:
+    """Read the dtype of the expression matrix of an h5ad file without
+    loading the file.
+    """
+    with h5py.File(file_path, 'r') as h5_file:
+        matrix = h5_file['X']
+        if isinstance(matrix, h5py.Group):
+            return matrix['data'].dtype
+        return matrix.dtype
+
+
+def _matrix_bytes_per_row(expression_data: anndata.AnnData) -> float:
+    """Average number of bytes stored for a row of a backed expression
+    matrix.
+    """
+    n_rows = max(expression_data.n_obs, 1)
+    matrix = expression_data.file['X']
+    if isinstance(matrix, h5py.Group):
+        data = matrix['data']
+        indices = matrix['indices']
+        return max(
+            data.shape[0] * (data.dtype.itemsize + indices.dtype.itemsize)
+            / n_rows,
+            1
+        )
+    return max(matrix.dtype.itemsize * expression_data.n_vars, 1)
+
+
+def _row_blocks(rows: np.ndarray, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """Group the rows to read from an expression matrix into blocks of
+    consecutive rows.
+
+    Each block starts at a requested row and ends after the last requested
+    row within chunk_size rows of its start, so that rows between requested
+    rows are only read when they are close together.
+
+    Parameters
+    ----------
+    rows: numpy.ndarray
+        Sorted positions of the requested rows.
+    chunk_size: int
+        Maximum number of rows in a block.
+
+    Yields
+    ------
+    tuple of int
+        Start and stop position of each block.
+    """
+    idx = 0
+    while idx < len(rows):
+        start = rows[idx]
+        # first requested row that does not fit in this block
+        next_idx = np.searchsorted(rows, start + chunk_size, side='left')
+        yield int(start), int(rows[next_idx - 1]) + 1
+        idx = next_idx
+
+
+def _empty_output(shape: tuple, dtype: np.dtype) -> np.ndarray:
+    """Allocate the output of get_gene_data.
+
+    Cells that are not found in any expression matrix are left as NaN for
+    floating point data and 0 for integer data.
+
+    Parameters
+    ----------
+    shape: tuple
+        Number of cells by number of genes.
+    dtype: numpy.dtype
+        dtype of the expression data.
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+    if np.issubdtype(dtype, np.floating):
+        return np.full(shape, np.nan, dtype=dtype)
+    return np.zeros(shape, dtype=dtype)
+
+
+def _select_genes(
+    chunk,
+    cell_mask: np.ndarray,
+    gene_positions: np.ndarray,
+    as_sparse: bool = False
+) -> Union[np.ndarray, scipy.sparse.csr_matrix]:
+    """Select the requested cells and genes of a chunk of an expression
+    matrix.
+
+    Sparse chunks are sliced before being densified so that only the
+    requested genes are ever stored densely.
+
+    Parameters
+    ----------
+    chunk: scipy.sparse.spmatrix or numpy.ndarray
+        Chunk of rows (cells) of an expression matrix.
+    cell_mask: numpy.ndarray
+        Boolean mask of the rows of the chunk to keep.
+    gene_positions: numpy.ndarray
+        Column positions of the genes to keep.
+    as_sparse: bool
+        If True, return a sparse matrix instead of a dense array.
+
+    Returns
+    -------
+    numpy.ndarray or scipy.sparse.csr_matrix
+        Array of the selected cells by the selected genes.
+    """
+    if scipy.sparse.issparse(chunk):
+        selected = chunk.tocsr()[cell_mask][:, gene_positions]
+        return selected if as_sparse else selected.toarray()
+    selected = np.asarray(chunk)[cell_mask][:, gene_positions]
+    return scipy.sparse.csr_matrix(selected) if as_sparse else selected
+
+
+class _SparseBlocks(object):
+    """Collects the non-zero values of the output of get_gene_data as they
+    are read, to build a sparse matrix of cells by genes.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.cols = []
+        self.values = []
+
+    def add_rows(self, rows: np.ndarray, block: scipy.sparse.spmatrix):
+        """Add the values of a block of rows (cells) of the output."""
+        block = block.tocoo()
+        self.rows.append(rows[block.row])
+        self.cols.append(block.col)
+        self.values.append(block.data)
+
+    def add_column(self, rows: np.ndarray, col: int, values: np.ndarray):
+        """Add the values of a column (gene) of the output in some rows."""
+        self.rows.append(rows)
+        self.cols.append(np.full(len(rows), col))
+        self.values.append(values)
+
+    def extend(self, other: "_SparseBlocks"):
+        """Add the values collected by another _SparseBlocks."""
+        self.rows.extend(other.rows)
+        self.cols.extend(other.cols)
+        self.values.extend(other.values)
+
+    def to_csr(self, shape: Tuple[int, int],
+               dtype: np.dtype) -> scipy.sparse.csr_matrix:
+        """Build the sparse matrix of the collected values."""
+        if len(self.values) == 0:
+            return scipy.sparse.csr_matrix(shape, dtype=dtype)
+        matrix = scipy.sparse.coo_matrix(
+            (np.concatenate(self.values).astype(dtype, copy=False),
+             (np.concatenate(self.rows), np.concatenate(self.cols))),
+            shape=shape
+        ).tocsr()
+        # Casting to dtype may turn non-zero values into zeros (e.g. float
+        # to int or underflow to a smaller float); do not store them.
+        matrix.eliminate_zeros()
+        return matrix
+
+
+def create_gene_major_copies(
+    abc_atlas_cache: AbcProjectCache,
+    directory: str,
+    data_types: Tuple[str, ...] = ("log2", "raw"),
+    max_memory: int = 2 * 1024**3,
+    chunk_size: int = 8192
+) -> List[Path]:
+    """Create gene-major copies of the expression matrix files of a
+    directory in the ABC Atlas, downloading the files if needed.
+
+    See create_gene_major_copy.
+
+    Parameters
+    ----------
+    abc_atlas_cache: AbcProjectCache
+        An AbcProjectCache instance object to handle downloading and serving
+        the path to the expression matrix data.
+    directory: str
+        Name of the directory whose expression matrices to copy.
+    data_types: tuple of str (Default: ("log2", "raw"))
+        Kinds of expression matrices to copy.
+    max_memory: int (Default: 2 GB)
+        Approximate maximum number of bytes of the transposed matrix held in
+        memory at once while creating each copy.
+    chunk_size: int (Default: 8192)
+        Number of rows of the expression matrices to read at once.
+
+    Returns
+    -------
+    list of pathlib.Path
+        Paths of the gene-major copies.
+    """
+    output_paths = []
+    for file_name in abc_atlas_cache.list_expression_matrix_files(directory):
+        if file_name.split("/")[-1] not in data_types:
+            continue
+        file_path = abc_atlas_cache.get_file_path(
+            directory=directory,
+            file_name=file_name
+        )
+        output_paths.append(create_gene_major_copy(
+            file_path,
+            max_memory=max_memory,
+            chunk_size=chunk_size
+        ))
+    return output_paths
+
+
+def create_gene_major_copy(
+    file_path: Union[str, Path],
+    max_memory: int = 2 * 1024**3,
+    chunk_size: int = 8192
+) -> Path:
+    """Write a gene-major (CSC) copy of the expression matrix of an h5ad
+    file next to it.
+
+    The expression matrices of the ABC Atlas are stored cell-major (CSR), so
+    extracting a gene requires reading every row of a matrix. In the copy the
+    values of each gene are stored contiguously, so get_gene_data can read
+    only the requested genes. The copy is used by get_gene_data as long as
+    the h5ad file it was made from is unchanged.
+
+    The matrix is transposed in groups of genes whose values fit in
+    max_memory, reading the h5ad file once per group.
+
+    Parameters
+    ----------
+    file_path: str or pathlib.Path
+        Path to an h5ad file with a CSR expression matrix.
+    max_memory: int (Default: 2 GB)
+        Approximate maximum number of bytes of the transposed matrix held in
+        memory at once.
+    chunk_size: int (Default: 8192)
+        Number of rows of the expression matrix to read at once.
+
+    Returns
+    -------
+    pathlib.Path
+        Path of the gene-major copy.
+
+    Raises
+    ------
+    ValueError
+        If the expression matrix of the file is not stored as CSR.
+    """
+    file_path = Path(file_path)
+    output_path = gene_major_path(file_path)
+    source_stat = file_path.stat()
+
+    expression_data = anndata.read_h5ad(file_path, backed='r')
+    try:
+        obs_names = expression_data.obs_names.to_numpy(dtype=object)
+        var_names = expression_data.var_names.to_numpy(dtype=object)
+    finally:
         expression_data.file.close()
-        del expression_data  # Clean up our loaded file.
-        print(f" - time taken:  {time.process_time() - start}")
-
-    output_gene_data.columns = gene_filtered.gene_symbol
-    print(f"total time taken: {time.process_time() - total_start}")
-    print(
-        "\ttotal cells:", num_total_cells,
-        "processed cells:", num_processed_cells
+
+    tmp_path = output_path.with_name(
+        f"{output_path.name}.{os.getpid()}.tmp"
     )
-    return output_gene_data
+    try:
+        with h5py.File(file_path, 'r') as source, \
+                h5py.File(tmp_path, 'w') as copy:
+            matrix = source['X']
+            if not isinstance(matrix, h5py.Group) \
+                    or matrix.attrs.get('encoding-type') != 'csr_matrix':
+                raise ValueError(
+                    f"The expression matrix of {file_path} is not stored as "
+                    "a CSR matrix."
+                )
+            n_rows, n_cols = (int(size) for size in matrix.attrs['shape'])
+            row_ptr = matrix['indptr'][:]
+            indices = matrix['indices']
+            data = matrix['data']
+
+            # First pass: count the values of each gene.
+            col_counts = np.zeros(n_cols, dtype=np.int64)
+            for row_start in range(0, n_rows, chunk_size):
+                row_stop = min(row_start + chunk_size, n_rows)
+                col_counts += np.bincount(
+                    indices[row_ptr[row_start]:row_ptr[row_stop]],
+                    minlength=n_cols
+                )
+            col_ptr = np.zeros(n_cols + 1, dtype=np.int64)
+            np.cumsum(col_counts, out=col_ptr[1:])
+
+            row_dtype = np.int32 if n_rows < 2**31 else np.int64
+            copy.attrs['shape'] = (n_rows, n_cols)
+            copy.attrs['source_size'] = source_stat.st_size
+            copy.attrs['source_mtime_ns'] = source_stat.st_mtime_ns
+            copy.create_dataset('obs_names', data=obs_names,
+                                dtype=h5py.string_dtype())
+            copy.create_dataset('var_names', data=var_names,
+                                dtype=h5py.string_dtype())
+            copy.create_dataset('indptr', data=col_ptr)
+            copy_indices = copy.create_dataset(
+                'indices', shape=(int(col_ptr[-1]),), dtype=row_dtype
+            )
+            copy_data = copy.create_dataset(
+                'data', shape=(int(col_ptr[-1]),), dtype=data.dtype
+            )
+
+            # Second pass: transpose the genes in groups that fit in memory.
+            max_values = max(1, max_memory // (
+                data.dtype.itemsize + np.dtype(row_dtype).itemsize))
+            for col_start, col_stop in _gene_blocks(col_ptr, max_values):
+                block_data, block_indices = _transpose_gene_block(
+                    row_ptr, indices, data, col_ptr,
+                    col_start, col_stop, chunk_size, row_dtype
+                )
+                copy_data[col_ptr[col_start]:col_ptr[col_stop]] = block_data
+                copy_indices[col_ptr[col_start]:col_ptr[col_stop]] = \
+                    block_indices
+        os.replace(tmp_path, output_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return output_path
+
+
+def gene_major_path(file_path: Union[str, Path]) -> Path:
+    """Path of the gene-major copy of an h5ad file.
+
+    Parameters
+    ----------
+    file_path: str or pathlib.Path
+        Path to an h5ad file.
+
+    Returns
+    -------
+    pathlib.Path
+    """
+    file_path = Path(file_path)
+    return file_path.with_name(f"{file_path.stem}.gene_major.h5")
+
+
+def _gene_blocks(
+    col_ptr: np.ndarray,
+    max_values: int
+) -> Iterator[Tuple[int, int]]:
+    """Group consecutive genes into blocks of at most max_values values
+    (or a single gene if it alone has more values).
+    """
+    n_cols = len(col_ptr) - 1
+    col_start = 0
+    while col_start < n_cols:
+        col_stop = np.searchsorted(
+            col_ptr, col_ptr[col_start] + max_values, side='right'
+        ) - 1
+        col_stop = min(max(int(col_stop), col_start + 1), n_cols)
+        yield col_start, col_stop
+        col_start = col_stop
+
+
+def _transpose_gene_block(
+    row_ptr: np.ndarray,
+    indices: h5py.Dataset,
+    data: h5py.Dataset,
+    col_ptr: np.ndarray,
+    col_start: int,
+    col_stop: int,
+    chunk_size: int,
+    row_dtype: np.dtype
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Read the values of genes col_start to col_stop from a CSR matrix
+    and return them in CSC order.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        The values and the row of each value.
+    """
+    offset = col_ptr[col_start]
+    block_data = np.empty(col_ptr[col_stop] - offset, dtype=data.dtype)
+    block_indices = np.empty(col_ptr[col_stop] - offset, dtype=row_dtype)
+    # Position of the next value of each gene in the block.
+    next_value = col_ptr[col_start:col_stop] - offset
+    n_rows = len(row_ptr) - 1
+    for row_start in range(0, n_rows, chunk_size):
+        row_stop = min(row_start + chunk_size, n_rows)
+        value_start, value_stop = row_ptr[row_start], row_ptr[row_stop]
+        chunk_cols = indices[value_start:value_stop]
+        chunk_data = data[value_start:value_stop]
+        chunk_rows = np.repeat(
+            np.arange(row_start, row_stop, dtype=row_dtype),
+            np.diff(row_ptr[row_start:row_stop + 1])
+        )
+        in_block = (chunk_cols >= col_start) & (chunk_cols < col_stop)
+        chunk_cols = chunk_cols[in_block] - col_start
+
+        # Order the values by gene, keeping the row order within a gene.
+        order = np.argsort(chunk_cols, kind='stable')
+        chunk_cols = chunk_cols[order]
+        col_counts = np.bincount(chunk_cols, minlength=col_stop - col_start)
+        first_of_col = np.cumsum(col_counts) - col_counts
+        positions = (next_value[chunk_cols]
+                     + np.arange(len(chunk_cols)) - first_of_col[chunk_cols])
+        block_data[positions] = chunk_data[in_block][order]
+        block_indices[positions] = chunk_rows[in_block][order]
+        next_value += col_counts
+    return block_data, block_indices
+
+
+def _is_current_gene_major(
+    file_path: Union[str, Path],
+    copy_path: Path
+) -> bool:
+    """Whether a gene-major copy exists and was made from the current
+    version of the h5ad file.
+    """
+    if not copy_path.is_file():
+        return False
+    source_stat = Path(file_path).stat()
+    try:
+        with h5py.File(copy_path, 'r') as copy:
+            return (copy.attrs['source_size'] == source_stat.st_size
+                    and copy.attrs['source_mtime_ns']
+                    == source_stat.st_mtime_ns)
+    except (OSError, KeyError):
+        return False
+
+
+def _read_gene_major_genes(
+    copy_path: Path,
+    cell_labels: pd.Index,
+    cell_positions: np.ndarray,
+    gene_positions: np.ndarray,
+    output: Union[np.ndarray, "_SparseBlocks"],
+    stats: dict
+):
+    """Read the requested genes of the requested cells from the gene-major
+    copy of an expression matrix into the output array.
+
+    Parameters
+    ----------
+    copy_path: pathlib.Path
+        Path to the gene-major copy.
+    cell_labels: pandas.Index
+        Labels of the requested cells that are expected in this file.
+    cell_positions: numpy.ndarray
+        Output row of each of cell_labels.
+    gene_positions: numpy.ndarray
+        Column positions of the genes to read.
+    output: numpy.ndarray or _SparseBlocks
+        Array of cells by genes to write into, or collection of the
+        non-zero values of the output to add to.
+    stats: dict
+        Statistics of the reading of the file to add to.
+    """
+    with h5py.File(copy_path, 'r') as copy:
+        label_rows = cell_labels.get_indexer(
+            pd.Index(copy['obs_names'].asstr()[:])
+        )
+        output_rows = np.where(label_rows >= 0,
+                               cell_positions[label_rows], -1)
+        found = output_rows >= 0
+        stats['cells_kept'] = int(np.count_nonzero(found))
+        stats['cells_skipped'] = len(output_rows) - stats['cells_kept']
+        sparse = isinstance(output, _SparseBlocks)
+        if not sparse:
+            # Values not stored in the sparse matrix are zero.
+            output[output_rows[found]] = 0
+
+        col_ptr = copy['indptr']
+        indices = copy['indices']
+        data = copy['data']
+        for output_col, gene in enumerate(gene_positions):
+            value_start, value_stop = col_ptr[gene], col_ptr[gene + 1]
+            gene_indices = indices[value_start:value_stop]
+            gene_data = data[value_start:value_stop]
+            stats['chunks'] += 1
+            stats['bytes_read'] += gene_indices.nbytes + gene_data.nbytes
+            gene_rows = output_rows[gene_indices]
+            keep = gene_rows >= 0
+            if sparse:
+                output.add_column(gene_rows[keep], output_col,
+                                  gene_data[keep])
+            else:
+                output[gene_rows[keep], output_col] = gene_data[keep]
@@ -1,18 +1,34 @@
 from typing import List, Optional, Union
 from abc import ABC, abstractmethod
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    as_completed,
+    wait
+)
 from pathlib import Path, PurePosixPath
+import hashlib
+import io
 import json
+import marshal
+import os
+import sys
+import threading
+import time
 import warnings
 import tqdm
 import boto3
 from botocore import UNSIGNED
 from botocore.client import Config
+from botocore.exceptions import BotoCoreError, ClientError
 from abc_atlas_access.abc_atlas_cache.manifest import (
     Manifest,
     DataTypeNotInDirectory
 )
+from abc_atlas_access.abc_atlas_cache.download_ledger import DownloadLedger
 from abc_atlas_access.abc_atlas_cache.file_attributes import CacheFileAttributes  # noqa: E501
-from abc_atlas_access.abc_atlas_cache.utils import file_hash_from_path
+from abc_atlas_access.abc_atlas_cache.file_lock import FileLock
+from abc_atlas_access.abc_atlas_cache.utils import atomic_write
 
 
 class OutdatedManifestWarning(UserWarning):
@@ -263,14 +279,68 @@ class BasicLocalCache(ABC):
 
         manifest_path = self._cache_dir / manifest_name
 
-        with open(manifest_path, "r") as f:
-            local_manifest = Manifest(
-                cache_dir=self._cache_dir,
-                json_input=f,
+        with open(manifest_path, "rb") as f:
+            raw_manifest = f.read()
+        json_hash = hashlib.md5(raw_manifest).hexdigest()
+
+        # A pre-parsed copy of the manifest and its index is kept next to
+        # the JSON and used as long as the JSON it was made from is
+        # unchanged.
+        parsed_path = self._parsed_manifest_path(manifest_path)
+        if parsed_path.exists():
+            with open(parsed_path, "rb") as f:
+                header = f.readline().decode().strip()
+                if header == self._parsed_manifest_header(json_hash):
+                    try:
+                        return Manifest.from_serialized(
+                            cache_dir=self._cache_dir,
+                            serialized=f.read()
+                        )
+                    except ValueError:
+                        # e.g. a truncated file; parse the JSON instead.
+                        pass
+
+        local_manifest = Manifest(
+            cache_dir=self._cache_dir,
+            json_input=io.BytesIO(raw_manifest),
+        )
+        try:
+            atomic_write(
+                parsed_path,
+                f"{self._parsed_manifest_header(json_hash)}\n".encode()
+                + local_manifest.serialize()
             )
+        except OSError:
+            # e.g. a read only cache; the JSON is parsed every time.
+            pass
 
         return local_manifest
 
+    # Version of the pre-parsed manifest format; changing it invalidates
+    # files written by earlier versions of this package.
+    _PARSED_MANIFEST_FORMAT = "abc_atlas_access-manifest-1"
+
+    @classmethod
+    def _parsed_manifest_header(cls, json_hash: str) -> str:
+        """
+        Header line of a pre-parsed manifest. The marshal format may change
+        between Python versions, so the file is only loaded by the same
+        marshal and Python versions that wrote it, for the same JSON.
+        """
+        python_version = '.'.join(str(v) for v in sys.version_info[:2])
+        return (f"{cls._PARSED_MANIFEST_FORMAT} marshal-{marshal.version} "
+                f"python-{python_version} {json_hash}")
+
+    @staticmethod
+    def _parsed_manifest_path(manifest_path: Path) -> Path:
+        """Path of the pre-parsed copy of a manifest file. Each Python
+        version keeps its own copy, so that interpreters sharing a cache
+        directory do not overwrite each other's."""
+        python_tag = f'py{sys.version_info[0]}{sys.version_info[1]}'
+        return manifest_path.with_name(
+            f'{manifest_path.stem}.{python_tag}.marshal'
+        )
+
     def load_manifest(self, manifest_name: str):
         """
         Load a manifest from this dataset.
@@ -487,25 +557,36 @@ class CloudCacheBase(BasicLocalCache):
         # last loaded from this cache dir (if applicable)
         self._manifest_last_used = c_path / '_manifest_last_used.txt'
 
-        # self._downloaded_data_path is where we will keep a JSONized
-        # dict mapping paths to downloaded files to their file_hashes;
-        # this will be used when determining if a downloaded file
-        # can instead be a symlink
-        self._downloaded_data_path = c_path / '_downloaded_data.json'
+        # self._download_ledger keeps an append-only record of the files
+        # that were downloaded successfully. Caches created by earlier
+        # versions kept a JSON list of paths in _downloaded_data.json,
+        # which is imported into the ledger the first time it is used.
+        self._downloaded_data_path = c_path / '_downloaded_data.jsonl'
+        self._download_ledger = DownloadLedger(
+            path=self._downloaded_data_path,
+            legacy_path=c_path / '_downloaded_data.json'
+        )
+        # progress bars may be shared by the parts of a file and by several
+        # files downloading concurrently
+        self._pbar_lock = threading.Lock()
 
         # if the local manifest is missing but there are
         # data files in cache_dir, emit a warning.
-        if not self._downloaded_data_path.exists():
+        if not self._download_ledger.exists():
             file_list = c_path.glob('**/*')
             has_files = False
             for fname in file_list:
                 # If the file exists ignore it if it is a json file
-                # the last used manifest file, or a .DS_Store file for Mac
-                # compatibility.
+                # the last used manifest file, a .DS_Store file for Mac
+                # compatibility, a lock/temporary file left by the cache,
+                # an interrupted download and its part journal or a
+                # pre-parsed manifest.
                 if fname.is_file() \
                         and 'json' not in fname.name \
                         and '_manifest_last_used' not in fname.name \
-                        and 'DS_Store' not in fname.name:
+                        and 'DS_Store' not in fname.name \
+                        and fname.suffix not in ('.lock', '.tmp', '.partial',
+                                                 '.journal', '.marshal'):
                     has_files = True
                     break
             if has_files:
@@ -538,21 +619,13 @@ class CloudCacheBase(BasicLocalCache):
             # This file does not exist; there is nothing to do
             return None
 
-        if self._downloaded_data_path.exists():
-            with open(self._downloaded_data_path, 'rb') as in_file:
-                downloaded_data = set(json.load(in_file))
-        else:
-            downloaded_data = set()
-
-        abs_path = str(file_attributes.local_path.resolve())
-        if abs_path in downloaded_data:
-            return None
-
-        downloaded_data.add(abs_path)
-        with open(self._downloaded_data_path, 'w') as out_file:
-            out_file.write(json.dumps(list(downloaded_data),
-                                      indent=2,
-                                      sort_keys=True))
+        self._download_ledger.add(
+            path=file_attributes.local_path.resolve(),
+            size=file_attributes.local_path.stat().st_size,
+            file_hash=file_attributes.file_hash,
+            manifest_version=(None if self._manifest is None
+                              else self._manifest.version)
+        )
         return None
 
     def _remove_download_from_list(self,
@@ -575,19 +648,7 @@ class CloudCacheBase(BasicLocalCache):
             # This file does not exist; there is nothing to do
             return None
 
-        if self._downloaded_data_path.exists():
-            with open(self._downloaded_data_path, 'rb') as in_file:
-                downloaded_data = set(json.load(in_file))
-        else:
-            downloaded_data = set()
-
-        abs_path = str(file_attributes.local_path.resolve())
-        if abs_path in downloaded_data:
-            downloaded_data.remove(abs_path)
-            with open(self._downloaded_data_path, 'w') as out_file:
-                out_file.write(json.dumps(list(downloaded_data),
-                                          indent=2,
-                                          sort_keys=True))
+        self._download_ledger.remove(file_attributes.local_path.resolve())
         return None
 
     def _warn_of_outdated_manifest(self, manifest_name: str) -> None:
@@ -715,7 +776,8 @@ class CloudCacheBase(BasicLocalCache):
     def _download_file(self,
                        file_attributes: CacheFileAttributes,
                        force_download: bool = False,
-                       skip_hash_check: bool = False
+                       skip_hash_check: bool = False,
+                       pbar: Optional[tqdm.tqdm] = None
                        ) -> bool:
         """
         Check if a file exists locally. If it does not, download it and
@@ -730,6 +792,9 @@ class CloudCacheBase(BasicLocalCache):
             locally
         skip_hash_check: bool
             If True, skip the file hash check
+        pbar: Optional[tqdm.tqdm]
+            Progress bar to report downloaded bytes to. If None, a progress
+            bar is created for this file only.
 
         Returns
         -------
@@ -784,8 +849,12 @@ class CloudCacheBase(BasicLocalCache):
         """
         Save the name of the last manifest used in this cache.
         """
-        with open(self._manifest_last_used, 'w') as out_file:
-            out_file.write(manifest_name)
+        atomic_write(self._manifest_last_used, manifest_name)
+
+    @staticmethod
+    def _lock_path(local_path: Path) -> Path:
+        """Path of the lock file guarding the download of a file."""
+        return local_path.with_name(local_path.name + '.lock')
 
     def _file_exists(self, file_attributes: CacheFileAttributes) -> bool:
         """
@@ -838,22 +907,26 @@ class CloudCacheBase(BasicLocalCache):
         -------
         bool
         """
-        if not self._downloaded_data_path.exists():
+        record = self._download_ledger.get(
+            file_attributes.local_path.resolve()
+        )
+        if record is None:
             return False
 
-        with open(self._downloaded_data_path, 'rb') as in_file:
-            available_files = set(json.load(in_file))
-        if str(file_attributes.local_path.resolve()) in available_files:
-            return True
+        # Records imported from older caches do not have a size.
+        if record['size'] is not None \
+                and record['size'] != file_attributes.local_path.stat().st_size:
+            return False
 
-        return False
+        return True
 
     def download_file(
         self,
         directory: str,
         file_name: str,
         force_download: bool = False,
-        skip_hash_check: bool = False
+        skip_hash_check: bool = False,
+        pbar: Optional[tqdm.tqdm] = None
     ) -> Path:
         """
         Return the local path to a file, downloading the file
@@ -870,6 +943,10 @@ class CloudCacheBase(BasicLocalCache):
             locally
         skip_hash_check: bool
             If True, skip the file hash check
+        pbar: Optional[tqdm.tqdm]
+            Progress bar to report downloaded bytes to. Files that do not
+            need to be downloaded advance it by their full size. If None, a
+            progress bar is created for this file only.
 
         Returns
         -------
@@ -882,27 +959,125 @@ class CloudCacheBase(BasicLocalCache):
         RuntimeError
             If the file cannot be downloaded
         """
-        super_attributes = self.get_file_path(directory=directory,
-                                              file_name=file_name)
-        file_attributes = super_attributes['file_attributes']
-        # If the file exists, check that it was downloaded successfully.
-        if super_attributes['exists'] \
-                and not self._check_successful_download(
-                        file_attributes=super_attributes['file_attributes']):
-            force_download = True
-        self._download_file(
-            file_attributes=file_attributes,
-            force_download=force_download,
-            skip_hash_check=skip_hash_check
-        )
+        file_attributes = self.get_file_path(
+            directory=directory,
+            file_name=file_name
+        )['file_attributes']
+        # Only one thread or process at a time may download a given file.
+        # Any others wait here and then find the file already downloaded.
+        with FileLock(self._lock_path(file_attributes.local_path)):
+            # If the file exists, check that it was downloaded successfully.
+            if self._file_exists(file_attributes) \
+                    and not self._check_successful_download(
+                            file_attributes=file_attributes):
+                force_download = True
+            was_downloaded = self._download_file(
+                file_attributes=file_attributes,
+                force_download=force_download,
+                skip_hash_check=skip_hash_check,
+                pbar=pbar
+            )
+        if pbar is not None and not was_downloaded:
+            with self._pbar_lock:
+                pbar.update(file_attributes.file_size)
         return file_attributes.local_path
 
+    def _reserve_connections(self, n_files: int) -> None:
+        """
+        Prepare for downloading n_files files at the same time. Nothing to
+        do unless the cache keeps a pool of connections to the data.
+        """
+        return None
+
+    def download_files(
+        self,
+        directory: str,
+        file_names: List[str],
+        force_download: bool = False,
+        skip_hash_check: bool = False,
+        max_workers: int = 4
+    ) -> dict:
+        """
+        Download several files from a directory concurrently, reporting the
+        progress of all of them in a single progress bar.
+
+        A failure to download one file does not stop the others.
+
+        Parameters
+        ----------
+        directory: str
+            The name of the directory containing the files
+        file_names: List[str]
+            The names of the files to be accessed
+        force_download: bool
+            If True, force the files to be downloaded even if they already
+            exist locally
+        skip_hash_check: bool
+            If True, skip the file hash check
+        max_workers: int
+            Maximum number of files to download at the same time
+
+        Returns
+        -------
+        dict
+            Keyed on file name, in the order of file_names. Each value is a
+            dict where
+
+            'local_path' is the pathlib.Path the file was downloaded to, or
+            None if the download failed
+
+            'error' is the exception raised while downloading the file, or
+            None if the download succeeded
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be a positive integer; "
+                             f"got {max_workers}")
+        self._reserve_connections(n_files=max_workers)
+        total_size = 0
+        for file_name in file_names:
+            try:
+                total_size += self.get_file_path(
+                    directory=directory,
+                    file_name=file_name
+                )['file_attributes'].file_size
+            except KeyError:
+                # Reported below when the download itself fails.
+                continue
+
+        results = {}
+        pbar = tqdm.tqdm(desc=directory,
+                         total=total_size,
+                         unit_scale=True,
+                         unit_divisor=1000.,
+                         unit="MB")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.download_file,
+                                directory=directory,
+                                file_name=file_name,
+                                force_download=force_download,
+                                skip_hash_check=skip_hash_check,
+                                pbar=pbar): file_name
+                for file_name in file_names
+            }
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = {'local_path': future.result(),
+                                                'error': None}
+                except Exception as error:
+                    results[futures[future]] = {'local_path': None,
+                                                'error': error}
+        pbar.close()
+
+        return {file_name: results[file_name] for file_name in file_names}
+
     def download_directory(
             self,
             directory: str,
             data_kind: str,
             force_download: bool = False,
             skip_hash_check: bool = False,
+            max_workers: int = 1
     ) -> List[Path]:
         """
         Download all of the files in a directory.
@@ -919,16 +1094,44 @@ class CloudCacheBase(BasicLocalCache):
             locally.
         skip_hash_check: bool
             If True, skip the file hash check for file integrity.
+        max_workers: int
+            Number of files to download at the same time. If greater than 1,
+            files are downloaded concurrently with a single progress bar for
+            the whole directory (see download_files).
 
         Returns
         -------
         output_paths: list Paths
             List of paths to the downloaded metadata files
+
+        Raises
+        ------
+        RuntimeError
+            If max_workers is greater than 1 and any of the files could not
+            be downloaded. All other files are still downloaded.
         """
         file_list = self._manifest._list_data_in_directory(
             directory=directory,
             data_kind=data_kind
         )
+        if max_workers > 1:
+            results = self.download_files(
+                directory=directory,
+                file_names=file_list,
+                force_download=force_download,
+                skip_hash_check=skip_hash_check,
+                max_workers=max_workers
+            )
+            failed = [f"{file_name}: {result['error']!r}"
+                      for file_name, result in results.items()
+                      if result['error'] is not None]
+            if len(failed) > 0:
+                raise RuntimeError(
+                    f"Could not download {len(failed)} of {len(file_list)} "
+                    f"files in {directory}:\n" + "\n".join(failed)
+                )
+            return [result['local_path'] for result in results.values()]
+
         output_files = []
         for file_name in file_list:
             output_files.append(
@@ -945,7 +1148,8 @@ class CloudCacheBase(BasicLocalCache):
             self,
             directory: str,
             force_download: bool = False,
-            skip_hash_check: bool = False
+            skip_hash_check: bool = False,
+            max_workers: int = 1
     ) -> List[Path]:
         """
         Download all the metadata files in a directory.
@@ -959,6 +1163,8 @@ class CloudCacheBase(BasicLocalCache):
             locally.
         skip_hash_check: bool
             If True, skip the file hash check for file integrity.
+        max_workers: int
+            Number of files to download at the same time.
 
         Returns
         -------
@@ -969,14 +1175,16 @@ class CloudCacheBase(BasicLocalCache):
             directory=directory,
             data_kind='metadata',
             force_download=force_download,
-            skip_hash_check=skip_hash_check
+            skip_hash_check=skip_hash_check,
+            max_workers=max_workers
         )
 
     def download_directory_expression_matrices(
             self,
             directory: str,
             force_download: bool = False,
-            skip_hash_check: bool = False
+            skip_hash_check: bool = False,
+            max_workers: int = 1
     ) -> List[Path]:
         """
         Download all the data the expression_matrices in a directory.
@@ -990,6 +1198,8 @@ class CloudCacheBase(BasicLocalCache):
             locally.
         skip_hash_check: bool
             If True, skip the file hash check for file integrity.
+        max_workers: int
+            Number of files to download at the same time.
 
         Returns
         -------
@@ -1000,14 +1210,16 @@ class CloudCacheBase(BasicLocalCache):
             directory=directory,
             data_kind='expression_matrices',
             force_download=force_download,
-            skip_hash_check=skip_hash_check
+            skip_hash_check=skip_hash_check,
+            max_workers=max_workers
         )
     
     def download_directory_image_volumes(
             self,
             directory: str,
             force_download: bool = False,
-            skip_hash_check: bool = False
+            skip_hash_check: bool = False,
+            max_workers: int = 1
     ) -> List[Path]:
         """
         Download all the image volume files in a directory.
@@ -1021,6 +1233,8 @@ class CloudCacheBase(BasicLocalCache):
             locally.
         skip_hash_check: bool
             If True, skip the file hash check for file integrity.
+        max_workers: int
+            Number of files to download at the same time.
 
         Returns
         -------
@@ -1031,14 +1245,16 @@ class CloudCacheBase(BasicLocalCache):
             directory=directory,
             data_kind='image_volumes',
             force_download=force_download,
-            skip_hash_check=skip_hash_check
+            skip_hash_check=skip_hash_check,
+            max_workers=max_workers
         )
     
     def download_directory_mapmycells(
             self,
             directory: str,
             force_download: bool = False,
-            skip_hash_check: bool = False
+            skip_hash_check: bool = False,
+            max_workers: int = 1
     ) -> List[Path]:
         """
         Download all the mapmycells files in a directory.
@@ -1052,6 +1268,8 @@ class CloudCacheBase(BasicLocalCache):
             locally.
         skip_hash_check: bool
             If True, skip the file hash check for file integrity.
+        max_workers: int
+            Number of files to download at the same time.
 
         Returns
         -------
@@ -1062,7 +1280,8 @@ class CloudCacheBase(BasicLocalCache):
             directory=directory,
             data_kind='mapmycells',
             force_download=force_download,
-            skip_hash_check=skip_hash_check
+            skip_hash_check=skip_hash_check,
+            max_workers=max_workers
         )
 
     def _compare_directories(
@@ -1180,10 +1399,13 @@ class CloudCacheBase(BasicLocalCache):
         output_dict[f'manifest_error_{data_kind}'] = []
         for file_name in file_list0.intersection(file_list1):
             directory, metadata_file = file_name.split(': ')
-            file_attr_0 = manifest_0.get_file_attributes(directory,
-                                                         metadata_file)
-            file_attr_1 = manifest_1.get_file_attributes(directory,
-                                                         metadata_file)
+            # Both manifests share this cache's directory, so comparing the
+            # manifest entries is equivalent to comparing the full
+            # CacheFileAttributes (local_path is derived from relative_path).
+            file_attr_0 = manifest_0._get_file_record(directory,
+                                                      metadata_file)
+            file_attr_1 = manifest_1._get_file_record(directory,
+                                                      metadata_file)
 
             if file_attr_0 != file_attr_1 and \
                     file_attr_0.version == file_attr_1.version:
@@ -1278,6 +1500,29 @@ class S3CloudCache(CloudCacheBase):
         If True, use authentication to access the S3 bucket. Will use
         the ``default`` credentials in a aws credentials file. If False,
         assume the bucket is public and use unsigned access. Defaults to False.
+
+    multipart_threshold: int
+        Size in bytes above which a file is downloaded as several byte-range
+        parts fetched concurrently rather than as a single stream. Defaults
+        to 64 MB.
+
+    multipart_chunksize: int
+        Size in bytes of each byte-range part of a multipart download.
+        Defaults to 16 MB.
+
+    max_concurrency: int
+        Maximum number of threads used to fetch the parts of a multipart
+        download. Defaults to 8.
+
+    manifest_list_ttl: float
+        Number of seconds the listing of the manifests available in the
+        bucket is cached in cache_dir before the bucket is listed again.
+        Set to 0 to list the bucket every time. Defaults to one hour.
+
+    offline: bool
+        If True, never contact the bucket; only the manifests and data files
+        already downloaded into cache_dir are available, and requesting any
+        other file raises a RuntimeError. Defaults to False.
     """
 
     def __init__(
@@ -1286,35 +1531,162 @@ class S3CloudCache(CloudCacheBase):
             bucket_name: str,
             ui_class_name=None,
             auth_required: bool = False,
+            multipart_threshold: int = 64 * 1024**2,
+            multipart_chunksize: int = 16 * 1024**2,
+            max_concurrency: int = 8,
+            manifest_list_ttl: float = 3600,
+            offline: bool = False,
         ):
+        if multipart_chunksize < 1:
+            raise ValueError("multipart_chunksize must be a positive integer; "
+                             f"got {multipart_chunksize}")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be a positive integer; "
+                             f"got {max_concurrency}")
         self._manifest = None
         self._bucket_name = bucket_name
         self._auth_required = auth_required
+        self._multipart_threshold = multipart_threshold
+        self._multipart_chunksize = multipart_chunksize
+        self._max_concurrency = max_concurrency
+        self._manifest_list_ttl = manifest_list_ttl
+        self._offline = offline
+        # Connections the S3 client keeps open: enough for the parts of
+        # _FILES_PER_POOL files downloading concurrently (download_files
+        # grows it for more).
+        self._max_pool_connections = max(
+            10, self._FILES_PER_POOL * max_concurrency
+        )
+        # creating boto3 clients is not thread safe
+        self._client_lock = threading.Lock()
 
         super().__init__(cache_dir=cache_dir,
                          ui_class_name=ui_class_name)
 
     _s3_client = None
 
+    # Number of files whose parts the S3 client's connection pool is sized
+    # for by default; the default max_workers of download_files.
+    _FILES_PER_POOL = 4
+
     @property
     def bucket_name(self) -> str:
         return self._bucket_name
 
     @property
     def s3_client(self):
-        if self._s3_client is None:
-            if self._auth_required:
-                s3_config = Config()
-            else:
-                s3_config = Config(signature_version=UNSIGNED)
-            self._s3_client = boto3.client('s3',
-                                           config=s3_config)
-        return self._s3_client
+        with self._client_lock:
+            if self._s3_client is None:
+                # botocore keeps only 10 connections by default, which
+                # would cap the throughput of concurrent part downloads.
+                if self._auth_required:
+                    s3_config = Config(
+                        max_pool_connections=self._max_pool_connections
+                    )
+                else:
+                    s3_config = Config(
+                        signature_version=UNSIGNED,
+                        max_pool_connections=self._max_pool_connections
+                    )
+                self._s3_client = boto3.client('s3',
+                                               config=s3_config)
+            return self._s3_client
+
+    def _reserve_connections(self, n_files: int) -> None:
+        """
+        Make sure the S3 client can keep a connection open for each part of
+        n_files files downloading at the same time, replacing it with a
+        client with a larger pool if needed.
+        """
+        n_connections = n_files * self._max_concurrency
+        with self._client_lock:
+            if n_connections > self._max_pool_connections:
+                self._max_pool_connections = n_connections
+                self._s3_client = None
+
+    @property
+    def offline(self) -> bool:
+        """Whether this cache only uses files already in cache_dir"""
+        return self._offline
+
+    @property
+    def _manifest_listing_path(self) -> Path:
+        """Path of the cached listing of the manifests in the bucket"""
+        return self._cache_dir / '_manifest_listing.json'
 
     def _list_all_manifests(self) -> list:
         """
         Return a list of all of the file names of the manifests associated
-        with this dataset
+        with this dataset.
+
+        The listing of the bucket is cached in cache_dir for
+        manifest_list_ttl seconds. If the bucket cannot be reached, the
+        cached listing is used regardless of its age or, failing that,
+        the manifests already downloaded.
+
+        Raises
+        ------
+        RuntimeError
+            If offline and no manifest has been downloaded.
+        """
+        if self._offline:
+            output = self.list_all_downloaded_manifests()
+            if len(output) == 0:
+                raise RuntimeError(
+                    f"No manifests have been downloaded into "
+                    f"{self._cache_dir}; a manifest must be downloaded "
+                    f"before {self.ui} can be used offline."
+                )
+            return output
+
+        cached = self._read_manifest_listing()
+        if cached is not None and \
+                time.time() - cached['timestamp'] < self._manifest_list_ttl:
+            return cached['manifests']
+
+        try:
+            output = self._list_bucket_manifests()
+        except (BotoCoreError, ClientError) as err:
+            if cached is not None:
+                output = cached['manifests']
+            else:
+                output = self.list_all_downloaded_manifests()
+                if len(output) == 0:
+                    raise
+            warnings.warn(
+                f"Could not list the manifests in {self._bucket_name} "
+                f"({err}). Using the manifests known locally: {output}",
+                UserWarning
+            )
+            return output
+
+        try:
+            atomic_write(self._manifest_listing_path,
+                         json.dumps({'bucket_name': self._bucket_name,
+                                     'timestamp': time.time(),
+                                     'manifests': output}))
+        except OSError:
+            pass
+        return output
+
+    def _read_manifest_listing(self) -> Optional[dict]:
+        """
+        Read the cached listing of the manifests in the bucket. Return None
+        if there is no usable listing for this bucket.
+        """
+        try:
+            with open(self._manifest_listing_path, 'rb') as in_file:
+                listing = json.load(in_file)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(listing, dict) \
+                or listing.get('bucket_name') != self._bucket_name:
+            return None
+        return listing
+
+    def _list_bucket_manifests(self) -> list:
+        """
+        List the file names of the manifests in the bucket
         """
         paginator = self.s3_client.get_paginator('list_objects_v2')
         subset_iterator = paginator.paginate(
@@ -1342,26 +1714,334 @@ class S3CloudCache(CloudCacheBase):
         manifest_name: str
             The name of the manifest to load. Must be an element in
             self.manifest_file_names
+
+        Raises
+        ------
+        RuntimeError
+            If the cache is offline.
         """
+        if self._offline:
+            raise RuntimeError(
+                f"Cannot download {manifest_name}: the cache is offline and "
+                f"the manifest is not in {self._cache_dir}"
+            )
         response = self.s3_client.get_object(Bucket=self._bucket_name,
                                              Key=manifest_name)
 
         filepath = self._cache_dir / manifest_name
         filepath.parents[0].mkdir(parents=True, exist_ok=True)
 
-        with open(filepath, 'wb') as f:
+        # Other processes may be reading or downloading the same manifest,
+        # so only move it into place once complete.
+        atomic_write(filepath, b''.join(response['Body'].iter_chunks()))
+
+    def _download_range(self,
+                        obj_key: str,
+                        local_path: Path,
+                        start: int,
+                        end: int,
+                        pbar: tqdm.tqdm,
+                        keep_bytes: bool = False,
+                        hasher: Optional["hashlib._Hash"] = None
+                        ) -> Optional[bytes]:
+        """
+        Download the inclusive byte range [start, end] of an object and
+        write it at the same offset of an already allocated local file.
+
+        Parameters
+        ----------
+        obj_key: str
+            Key of the object in the bucket
+        local_path: pathlib.Path
+            Path to the local file to write into. Must already exist.
+        start: int
+            First byte of the range to download
+        end: int
+            Last byte (inclusive) of the range to download
+        pbar: tqdm.tqdm
+            Progress bar to update with the number of bytes written
+        keep_bytes: bool
+            If True, also return the downloaded bytes so that they can be
+            hashed without reading them back from disk. Only needed when
+            ranges may complete out of order; otherwise pass hasher.
+        hasher: Optional[hashlib._Hash]
+            If not None, updated with each chunk as it is written so that
+            the range never has to be held in memory. The caller must make
+            sure the ranges of a file are hashed in order.
+
+        Returns
+        -------
+        bytes or None
+            The downloaded bytes if keep_bytes is True; None otherwise
+        """
+        response = self.s3_client.get_object(Bucket=self._bucket_name,
+                                             Key=obj_key,
+                                             Range=f'bytes={start}-{end}')
+        chunks = []
+        # Each thread uses its own file handle so that seek/write pairs
+        # from different parts cannot interleave.
+        with open(local_path, 'r+b') as out_file:
+            out_file.seek(start)
             for chunk in response['Body'].iter_chunks():
-                f.write(chunk)
+                out_file.write(chunk)
+                if keep_bytes:
+                    chunks.append(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                with self._pbar_lock:
+                    pbar.update(len(chunk))
+            # Make sure the bytes are on disk before the range is recorded
+            # as complete in the journal.
+            out_file.flush()
+            os.fsync(out_file.fileno())
+        if keep_bytes:
+            return b''.join(chunks)
+        return None
+
+    @staticmethod
+    def _hash_range(local_path: Path,
+                    start: int,
+                    end: int,
+                    hasher: "hashlib._Hash") -> None:
+        """Update hasher with the inclusive byte range [start, end] of a
+        local file, reading it in bounded chunks."""
+        with open(local_path, 'rb') as in_file:
+            in_file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = in_file.read(min(remaining, 1000000))
+                if len(chunk) == 0:
+                    break
+                hasher.update(chunk)
+                remaining -= len(chunk)
+
+    @staticmethod
+    def _partial_path(local_path: Path) -> Path:
+        """Path of the file an in-progress download is written to."""
+        return local_path.with_name(local_path.name + '.partial')
+
+    @staticmethod
+    def _journal_path(local_path: Path) -> Path:
+        """Path of the journal of byte ranges completed in the partial
+        file of an in-progress download."""
+        return local_path.with_name(local_path.name + '.partial.journal')
+
+    @staticmethod
+    def _read_part_journal(journal_path: Path, header: dict) -> Optional[set]:
+        """
+        Read the byte ranges recorded as complete in a download journal.
+
+        Parameters
+        ----------
+        journal_path: pathlib.Path
+            Path to the journal file
+        header: dict
+            Description of the download the journal must belong to. If the
+            journal was written for a different file, size, or part size it
+            cannot be resumed from.
+
+        Returns
+        -------
+        set or None
+            Set of completed (start, end) ranges. None if there is no usable
+            journal.
+        """
+        if not journal_path.exists():
+            return None
+        with open(journal_path, 'r') as in_file:
+            lines = in_file.read().splitlines()
+        if len(lines) == 0:
+            return None
+        try:
+            if json.loads(lines[0]) != header:
+                return None
+        except ValueError:
+            return None
+
+        completed = set()
+        for line in lines[1:]:
+            # A line may be truncated if the process was killed while
+            # writing it; such a range is simply downloaded again.
+            values = line.split()
+            if len(values) == 2 and all(v.isdigit() for v in values):
+                completed.add((int(values[0]), int(values[1])))
+        return completed
+
+    def _download_parts(self,
+                        file_attributes: CacheFileAttributes,
+                        object_size: int,
+                        pbar: tqdm.tqdm,
+                        compute_hash: bool = True) -> Optional[str]:
+        """
+        Download an object into its partial file, skipping any byte ranges
+        that a previous, interrupted download already completed.
+
+        Objects larger than the multipart threshold are split into parts
+        fetched concurrently and written in place into a preallocated file.
+        Every completed part is appended to a journal next to the partial
+        file so that a later call can resume from it.
+
+        The md5 hash of the file is computed from the downloaded bytes as
+        they arrive rather than by reading the finished file back. When the
+        parts arrive in order (a single part, or max_concurrency of 1) each
+        chunk is hashed as it is written. Otherwise, since md5 can only be
+        computed over the bytes in order, parts that finish early are held
+        in memory until the parts before them are hashed; at most twice
+        max_concurrency parts are in flight or waiting at any time. Only
+        ranges completed by a previous attempt are read from disk.
+
+        Parameters
+        ----------
+        file_attributes: CacheFileAttributes
+            Describes the file to download
+        object_size: int
+            Size of the object in bytes
+        pbar: tqdm.tqdm
+            Progress bar to update with the number of bytes written
+        compute_hash: bool
+            If True, compute and return the md5 hash of the file
+
+        Returns
+        -------
+        str or None
+            The file hash (md5; hexadecimal) of the downloaded file if
+            compute_hash is True; None otherwise
+        """
+        obj_key = str(file_attributes.relative_path)
+        partial_path = self._partial_path(file_attributes.local_path)
+        journal_path = self._journal_path(file_attributes.local_path)
+
+        if object_size > self._multipart_threshold:
+            part_size = self._multipart_chunksize
+        else:
+            part_size = max(object_size, 1)
+        ranges = [(start, min(start + part_size, object_size) - 1)
+                  for start in range(0, object_size, part_size)]
+
+        header = {'file_hash': file_attributes.file_hash,
+                  'size': object_size,
+                  'part_size': part_size}
+        completed = None
+        if partial_path.exists():
+            completed = self._read_part_journal(journal_path, header)
+        if completed is None:
+            with open(partial_path, 'wb') as out_file:
+                out_file.truncate(object_size)
+            with open(journal_path, 'w') as out_file:
+                out_file.write(json.dumps(header) + '\n')
+            completed = set()
+
+        remaining = [idx for idx, r in enumerate(ranges) if r not in completed]
+        with self._pbar_lock:
+            pbar.update(object_size - sum(ranges[idx][1] - ranges[idx][0] + 1
+                                          for idx in remaining))
+
+        hasher = hashlib.md5() if compute_hash else None
+
+        if len(ranges) == 1 or self._max_concurrency == 1:
+            with open(journal_path, 'a') as journal:
+                for start, end in ranges:
+                    if (start, end) in completed:
+                        # Downloaded by a previous attempt.
+                        if hasher is not None:
+                            self._hash_range(partial_path, start, end, hasher)
+                        continue
+                    self._download_range(obj_key,
+                                         partial_path,
+                                         start,
+                                         end,
+                                         pbar,
+                                         hasher=hasher)
+                    journal.write(f'{start} {end}\n')
+                    journal.flush()
+            if hasher is None:
+                return None
+            return hasher.hexdigest()
+
+        # bytes of downloaded parts, keyed on part index, that are waiting
+        # for the parts before them to be hashed
+        unhashed = {}
+        next_to_hash = 0
+
+        def _advance_hash():
+            nonlocal next_to_hash
+            while next_to_hash < len(ranges):
+                start, end = ranges[next_to_hash]
+                if next_to_hash in unhashed:
+                    hasher.update(unhashed.pop(next_to_hash))
+                elif (start, end) in completed:
+                    # Downloaded by a previous attempt.
+                    self._hash_range(partial_path, start, end, hasher)
+                else:
+                    break
+                next_to_hash += 1
+
+        if len(remaining) > 0:
+            # Create the client before spawning threads so that it is only
+            # instantiated once.
+            _ = self.s3_client
+            window = 2 * self._max_concurrency
+            to_submit = iter(remaining)
+            pending = {}
+            with ThreadPoolExecutor(
+                    max_workers=min(self._max_concurrency,
+                                    len(remaining))) as executor, \
+                    open(journal_path, 'a') as journal:
+                try:
+                    while True:
+                        while len(pending) + len(unhashed) < window:
+                            idx = next(to_submit, None)
+                            if idx is None:
+                                break
+                            start, end = ranges[idx]
+                            future = executor.submit(self._download_range,
+                                                     obj_key,
+                                                     partial_path,
+                                                     start,
+                                                     end,
+                                                     pbar,
+                                                     compute_hash)
+                            pending[future] = idx
+                        if len(pending) == 0:
+                            break
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            idx = pending.pop(future)
+                            data = future.result()
+                            start, end = ranges[idx]
+                            journal.write(f'{start} {end}\n')
+                            journal.flush()
+                            if hasher is not None:
+                                unhashed[idx] = data
+                        if hasher is not None:
+                            _advance_hash()
+                except BaseException:
+                    # Stop fetching further parts; the ones already recorded
+                    # in the journal are kept for the next attempt.
+                    for future in pending:
+                        future.cancel()
+                    raise
+
+        if hasher is None:
+            return None
+        _advance_hash()
+        return hasher.hexdigest()
 
     def _download_file(self,
                        file_attributes: CacheFileAttributes,
                        force_download: bool = False,
-                       skip_hash_check: bool = False
+                       skip_hash_check: bool = False,
+                       pbar: Optional[tqdm.tqdm] = None
                        ) -> bool:
         """
         Check if a file exists locally. If it does not, download it
         and return True. Return False otherwise.
 
+        The file is first written to ``<local_path>.partial`` and only moved
+        to local_path once complete (and its hash verified). If the download
+        is interrupted, the next call resumes from the byte ranges recorded
+        in ``<local_path>.partial.journal``.
+
         Parameters
         ----------
         file_attributes: CacheFileAttributes
@@ -1372,6 +2052,10 @@ class S3CloudCache(CloudCacheBase):
         skip_hash_check: bool
             If True, skip the file hash check. Not recommended as this
             verifies that the file was downloaded successfully.
+        pbar: Optional[tqdm.tqdm]
+            Progress bar to report downloaded bytes to, e.g. one shared by
+            several concurrent downloads. If None, a progress bar is created
+            for this file only.
 
         Returns
         -------
@@ -1387,15 +2071,43 @@ class S3CloudCache(CloudCacheBase):
         RuntimeError
             If it is not able to successfully download the file after
             10 iterations
-        """
+
+        RuntimeError
+            If the cache is offline and the file needs to be downloaded,
+            including a file on disk that is not recorded as a verified
+            download.
+        """
+        if self._offline:
+            if not self._file_exists(file_attributes):
+                raise RuntimeError(
+                    f"Cannot download {file_attributes.relative_path}: the "
+                    f"cache is offline and the file is not in "
+                    f"{self._cache_dir}"
+                )
+            if force_download \
+                    and self._check_successful_download(file_attributes):
+                raise RuntimeError(
+                    f"Cannot download {file_attributes.relative_path} again: "
+                    "the cache is offline"
+                )
+            if force_download:
+                raise RuntimeError(
+                    f"Cannot verify {file_attributes.relative_path}: the "
+                    f"cache is offline and {file_attributes.local_path} is "
+                    "present but not recorded as a verified download. Use a "
+                    "LocalCache to read files without verifying them."
+                )
         was_downloaded = False
+        local_path = file_attributes.local_path
+        partial_path = self._partial_path(local_path)
+        journal_path = self._journal_path(local_path)
         if force_download:
             # Remove the file from the list of successfully downloaded files.
             self._remove_download_from_list(file_attributes)
-            if file_attributes.local_path.exists():
-                file_attributes.local_path.unlink()
-
-        local_path = file_attributes.local_path
+            if local_path.exists():
+                local_path.unlink()
+            partial_path.unlink(missing_ok=True)
+            journal_path.unlink(missing_ok=True)
 
         local_dir = local_path.parents[0]
         local_dir.mkdir(parents=True, exist_ok=True)
@@ -1407,37 +2119,47 @@ class S3CloudCache(CloudCacheBase):
         n_iter = 0
         max_iter = 10  # maximum number of times to try download
 
-        pbar = None
+        owns_pbar = pbar is None
+        object_size = 0
         if not self._file_exists(file_attributes):
-            response = self.s3_client.list_objects_v2(Bucket=self._bucket_name,
-                                                      Prefix=str(obj_key))
-            object_info = response['Contents'][0]
-            pbar = tqdm.tqdm(desc=object_info["Key"].split("/")[-1],
-                             total=object_info["Size"],
-                             unit_scale=True,
-                             unit_divisor=1000.,
-                             unit="MB")
+            # The size of this exact key sets the layout of the parts, so it
+            # is not taken from a listing of every key with this prefix.
+            response = self.s3_client.head_object(Bucket=self._bucket_name,
+                                                  Key=str(obj_key))
+            object_size = response["ContentLength"]
+            if owns_pbar:
+                pbar = tqdm.tqdm(desc=str(obj_key).split("/")[-1],
+                                 total=object_size,
+                                 unit_scale=True,
+                                 unit_divisor=1000.,
+                                 unit="MB")
 
         while not self._file_exists(file_attributes):
             n_iter += 1
             was_downloaded = True
-            response = self.s3_client.get_object(Bucket=self._bucket_name,
-                                                 Key=str(obj_key))
-
-            if 'Body' in response:
-                with open(local_path, 'wb') as out_file:
-                    for chunk in response['Body'].iter_chunks():
-                        out_file.write(chunk)
-                        pbar.update(len(chunk))
+            test_checksum = self._download_parts(
+                file_attributes=file_attributes,
+                object_size=object_size,
+                pbar=pbar,
+                compute_hash=not skip_hash_check
+            )
 
-            # Verify the hash of the downloaded file
+            # Verify the hash of the downloaded file. The manifest only
+            # records the hash of the whole file so a mismatch means the
+            # whole download has to be restarted.
             if not skip_hash_check:
-                test_checksum = file_hash_from_path(file_attributes.local_path)
                 if test_checksum != file_attributes.file_hash:
-                    file_attributes.local_path.unlink(missing_ok=True)
+                    partial_path.unlink(missing_ok=True)
+                    with self._pbar_lock:
+                        pbar.update(-object_size)
+
+            if partial_path.exists():
+                os.replace(partial_path, local_path)
+            journal_path.unlink(missing_ok=True)
 
             if n_iter > max_iter:
-                pbar.close()
+                if owns_pbar:
+                    pbar.close()
                 raise RuntimeError("Could not download "
                                    f"{file_attributes.relative_path} "
                                    f"In {max_iter} iterations.")
@@ -1445,7 +2167,7 @@ class S3CloudCache(CloudCacheBase):
             if file_attributes.local_path.exists():
                 self._update_list_of_downloads(file_attributes=file_attributes)
 
-        if pbar is not None:
+        if owns_pbar and pbar is not None:
             pbar.close()
 
         return was_downloaded
@@ -1477,15 +2199,15 @@ class LocalCache(CloudCacheBase):
     def _download_file(self,
                        file_attributes: CacheFileAttributes,
                        force_download: bool = False,
-                       skip_hash_check: bool = False) -> bool:
+                       skip_hash_check: bool = False,
+                       pbar: Optional[tqdm.tqdm] = None) -> bool:
         raise NotImplementedError()
 
     def _save_last_used_manifest(self, manifest_name: str):
         """
         """
         try:
-            with open(self._manifest_last_used, 'w') as out_file:
-                out_file.write(manifest_name)
+            atomic_write(self._manifest_last_used, manifest_name)
         except OSError:
             warnings.warn(
                 f"""LocalCache is a read only directory and cannot
@@ -0,0 +1,208 @@
+from typing import Dict, Optional, Union
+from datetime import datetime, timezone
+from pathlib import Path
+import json
+import threading
+from abc_atlas_access.abc_atlas_cache.file_lock import FileLock
+from abc_atlas_access.abc_atlas_cache.utils import atomic_write
+
+
+class DownloadLedger(object):
+    """
+    A record of the files that have been successfully downloaded into a
+    cache directory.
+
+    The ledger is an append-only log with one JSON record per line. Each
+    download appends a record of the file's absolute path, size, file hash,
+    the manifest version it was downloaded under and a timestamp; removing a
+    file appends a record marking it removed. The log is read once into an
+    in-memory index keyed on path, so that lookups and updates do not depend
+    on the number of files in the cache. Records appended to the log by
+    other processes are picked up incrementally on the next lookup.
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        Path to the log file
+    legacy_path: Optional[str or pathlib.Path]
+        Path to a JSON list of downloaded file paths as written by earlier
+        versions of this package. If the log does not exist yet, the paths
+        listed in this file are imported into it.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        legacy_path: Optional[Union[str, Path]] = None
+    ):
+        self._path = Path(path)
+        self._legacy_path = None if legacy_path is None else Path(legacy_path)
+        self._index: Dict[str, dict] = {}
+        # number of bytes of the log already read into self._index
+        self._offset = 0
+        self._lock = threading.Lock()
+        self._lock_path = self._path.with_name(self._path.name + '.lock')
+
+    @property
+    def path(self) -> Path:
+        """Path to the log file"""
+        return self._path
+
+    def exists(self) -> bool:
+        """
+        Whether any download has ever been recorded in this cache directory
+        """
+        return self._path.exists() or (self._legacy_path is not None
+                                       and self._legacy_path.exists())
+
+    def get(self, path: Union[str, Path]) -> Optional[dict]:
+        """
+        Return the record of a downloaded file.
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            Absolute path to the downloaded file
+
+        Returns
+        -------
+        dict or None
+            The record of the file with keys 'path', 'size', 'file_hash',
+            'manifest_version' and 'timestamp'. None if the file is not
+            recorded as downloaded.
+        """
+        with self._lock:
+            self._refresh()
+            return self._index.get(str(path))
+
+    def __contains__(self, path: Union[str, Path]) -> bool:
+        return self.get(path) is not None
+
+    def add(
+        self,
+        path: Union[str, Path],
+        size: Optional[int] = None,
+        file_hash: Optional[str] = None,
+        manifest_version: Optional[str] = None
+    ) -> None:
+        """
+        Record a file as successfully downloaded.
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            Absolute path to the downloaded file
+        size: Optional[int]
+            Size of the downloaded file in bytes
+        file_hash: Optional[str]
+            The file hash of the downloaded file
+        manifest_version: Optional[str]
+            Version of the manifest the file was downloaded under
+        """
+        record = {'path': str(path),
+                  'size': size,
+                  'file_hash': file_hash,
+                  'manifest_version': manifest_version,
+                  'timestamp': self._timestamp()}
+        with self._lock:
+            self._refresh()
+            existing = self._index.get(record['path'])
+            if existing is not None and all(
+                    existing.get(key) == record[key]
+                    for key in ('size', 'file_hash', 'manifest_version')):
+                return None
+            self._append(record)
+        return None
+
+    def remove(self, path: Union[str, Path]) -> None:
+        """
+        Record a file as no longer downloaded.
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            Absolute path to the file
+        """
+        with self._lock:
+            self._refresh()
+            if str(path) not in self._index:
+                return None
+            self._append({'path': str(path),
+                          'removed': True,
+                          'timestamp': self._timestamp()})
+        return None
+
+    @staticmethod
+    def _timestamp() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def _apply(self, record: dict) -> None:
+        """Apply one log record to the in-memory index."""
+        if record.get('removed', False):
+            self._index.pop(record['path'], None)
+        else:
+            self._index[record['path']] = record
+
+    def _append(self, record: dict) -> None:
+        """Append a record to the log and apply it to the index."""
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        # Appends are not atomic on every file system (e.g. NFS), so
+        # processes sharing the log take turns writing to it.
+        with FileLock(self._lock_path):
+            with open(self._path, 'a') as out_file:
+                out_file.write(json.dumps(record) + '\n')
+        self._refresh()
+
+    def _refresh(self) -> None:
+        """
+        Read any records appended to the log since it was last read. Must be
+        called while holding self._lock.
+        """
+        if not self._path.exists():
+            self._import_legacy()
+            if not self._path.exists():
+                return None
+        size = self._path.stat().st_size
+        if size == self._offset:
+            return None
+        if size < self._offset:
+            # The log was replaced; read it again from the start.
+            self._index = {}
+            self._offset = 0
+        with open(self._path, 'rb') as in_file:
+            in_file.seek(self._offset)
+            new_data = in_file.read()
+        # Only consume complete lines; a record another process is still
+        # writing is read on a later refresh.
+        end = new_data.rfind(b'\n') + 1
+        for line in new_data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self._apply(record)
+        self._offset += end
+        return None
+
+    def _import_legacy(self) -> None:
+        """
+        Create the log from the list of downloaded files written by earlier
+        versions of this package, if there is one.
+        """
+        if self._legacy_path is None or not self._legacy_path.exists():
+            return None
+        with open(self._legacy_path, 'rb') as in_file:
+            legacy_paths = json.load(in_file)
+        timestamp = self._timestamp()
+        lines = [json.dumps({'path': path,
+                             'size': None,
+                             'file_hash': None,
+                             'manifest_version': None,
+                             'timestamp': timestamp})
+                 for path in sorted(legacy_paths)]
+        with FileLock(self._lock_path):
+            # Another process may have imported the list while we waited.
+            if self._path.exists():
+                return None
+            atomic_write(self._path, ''.join(line + '\n' for line in lines))
+        return None
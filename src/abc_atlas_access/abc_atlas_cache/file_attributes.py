@@ -1,4 +1,5 @@
 import pathlib
+from typing import NamedTuple
 from pydantic import BaseModel
 
 
@@ -10,3 +11,17 @@ class CacheFileAttributes(BaseModel):
     relative_path: str  # path relative to cache_dir/bucket_name
     file_type: str
     file_hash: str
+
+
+class FileRecord(NamedTuple):
+    """
+    The attributes of a file as listed in a manifest, without the
+    validation of CacheFileAttributes. Used internally where many manifest
+    entries are read at once (e.g. comparing manifests).
+    """
+    url: str
+    version: str
+    file_size: int
+    relative_path: str
+    file_type: str
+    file_hash: str
@@ -0,0 +1,161 @@
+from typing import Optional, Union
+from pathlib import Path
+import errno
+import os
+import sys
+import threading
+import time
+import weakref
+
+if sys.platform == 'win32':
+    import msvcrt
+    # msvcrt.locking reports a lock held elsewhere as a deadlock avoided
+    _LOCK_HELD_ERRNOS = (errno.EACCES, errno.EDEADLOCK)
+else:
+    import fcntl
+    _LOCK_HELD_ERRNOS = (errno.EACCES, errno.EAGAIN)
+
+
+class _ThreadLock(object):
+    """A threading.Lock that can be weakly referenced."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float = -1) -> bool:
+        return self._lock.acquire(timeout=timeout)
+
+    def release(self) -> None:
+        self._lock.release()
+
+
+class FileLock(object):
+    """
+    An exclusive advisory lock on a lock file, usable as a context manager.
+
+    The lock coordinates both the threads of one process and separate
+    processes, including processes on different hosts sharing an NFS
+    mounted cache directory (POSIX record locks are used for that reason).
+    The lock file is created if needed and left in place when the lock is
+    released, as removing it would let two processes lock different files
+    of the same name.
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        Path to the lock file
+    timeout: Optional[float]
+        Maximum number of seconds to wait for the lock. If None, wait
+        indefinitely.
+    poll_interval: float
+        Number of seconds to wait between attempts to take the lock while
+        another process holds it.
+    """
+
+    # OS level locks are held per process, so threads of the same process
+    # additionally synchronize on a threading.Lock per lock file. The locks
+    # are weakly referenced so that they are dropped once no FileLock on
+    # their path remains.
+    _thread_locks: "weakref.WeakValueDictionary[str, _ThreadLock]" = \
+        weakref.WeakValueDictionary()
+    _thread_locks_guard = threading.Lock()
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        timeout: Optional[float] = None,
+        poll_interval: float = 0.1
+    ):
+        self._path = Path(path)
+        self._timeout = timeout
+        self._poll_interval = poll_interval
+        self._file = None
+        key = os.path.abspath(self._path)
+        with self._thread_locks_guard:
+            thread_lock = self._thread_locks.get(key)
+            if thread_lock is None:
+                thread_lock = _ThreadLock()
+                self._thread_locks[key] = thread_lock
+            self._thread_lock = thread_lock
+
+    @property
+    def path(self) -> Path:
+        """Path to the lock file"""
+        return self._path
+
+    def acquire(self) -> None:
+        """
+        Take the lock, waiting for other threads or processes to release it.
+
+        Raises
+        ------
+        TimeoutError
+            If the lock could not be taken within timeout seconds.
+        OSError
+            If the file system of the lock file does not support locking.
+        """
+        start = time.monotonic()
+        timeout = -1 if self._timeout is None else self._timeout
+        if not self._thread_lock.acquire(timeout=timeout):
+            raise TimeoutError(f"Could not lock {self._path} in "
+                               f"{self._timeout} seconds")
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            lock_file = open(self._path, 'a+b')
+            while True:
+                try:
+                    self._lock_file(lock_file)
+                    break
+                except OSError as err:
+                    # Any other error (e.g. ENOLCK on NFS without a lock
+                    # daemon) means the file system cannot lock at all.
+                    if err.errno not in _LOCK_HELD_ERRNOS:
+                        lock_file.close()
+                        raise
+                    if self._timeout is not None and \
+                            time.monotonic() - start > self._timeout:
+                        lock_file.close()
+                        raise TimeoutError(f"Could not lock {self._path} in "
+                                           f"{self._timeout} seconds")
+                    time.sleep(self._poll_interval)
+            self._file = lock_file
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def release(self) -> None:
+        """Release the lock."""
+        if self._file is None:
+            return None
+        try:
+            self._unlock_file(self._file)
+        finally:
+            self._file.close()
+            self._file = None
+            self._thread_lock.release()
+        return None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.release()
+
+    @staticmethod
+    def _lock_file(lock_file) -> None:
+        """Take a non-blocking OS level lock; raise OSError if it fails."""
+        if sys.platform == 'win32':
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.lockf(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    @staticmethod
+    def _unlock_file(lock_file) -> None:
+        """Release the OS level lock."""
+        if sys.platform == 'win32':
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.lockf(lock_file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,215 @@
+from typing import Iterable, Optional, Union
+from pathlib import Path
+import hashlib
+import io
+import json
+import os
+import numpy as np
+import pandas as pd
+from abc_atlas_access.abc_atlas_cache.utils import atomic_write
+
+
+class GeneDataCache(object):
+    """
+    An on-disk cache of the expression of single genes across a set of
+    cells, as extracted by anndata_utils.get_gene_data.
+
+    Each gene's expression is stored in its own .npy file, so a request for
+    several genes can be assembled from genes cached by earlier requests.
+    Entries are keyed on the manifest, the kind of expression matrix, the
+    gene and a fingerprint of the requested cells (their labels, order and
+    expression matrix files). When the cache grows beyond max_size bytes,
+    the least recently used entries are removed.
+
+    The total size of the cache is scanned from disk once and then kept up
+    to date as entries are added, so the directory is only listed again
+    when the cache may have outgrown max_size.
+
+    Parameters
+    ----------
+    cache_dir: str or pathlib.Path
+        Directory to store the cached gene data in.
+    max_size: int
+        Maximum total size in bytes of the cached gene data. Defaults to
+        10 GB.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path],
+        max_size: int = 10 * 1024**3
+    ):
+        self._cache_dir = Path(cache_dir)
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self._max_size = max_size
+        # Estimated total size of the entries; None until first scanned.
+        # Entries written by other processes are only counted at the next
+        # scan.
+        self._size = None
+
+    @property
+    def cache_dir(self) -> Path:
+        """Directory the cached gene data is stored in"""
+        return self._cache_dir
+
+    @property
+    def size(self) -> int:
+        """Total size in bytes of the cached gene data"""
+        return sum(path.stat().st_size for path in self._entry_paths())
+
+    @staticmethod
+    def cells_fingerprint(all_cells: pd.DataFrame) -> str:
+        """
+        Return a fingerprint of a set of cells that changes if the cells,
+        their order or their expression matrix files change.
+
+        Parameters
+        ----------
+        all_cells: pandas.DataFrame
+            cells metadata indexed on cell_label with the columns
+            dataset_label and feature_matrix_label.
+
+        Returns
+        -------
+        str
+        """
+        hashed = pd.util.hash_pandas_object(
+            all_cells[['dataset_label', 'feature_matrix_label']],
+            index=True
+        )
+        return hashlib.md5(hashed.to_numpy().tobytes()).hexdigest()
+
+    @staticmethod
+    def key(
+        manifest: str,
+        data_type: str,
+        gene_identifier: str,
+        cells_fingerprint: str
+    ) -> str:
+        """
+        Return the key of the expression of a gene.
+
+        Parameters
+        ----------
+        manifest: str
+            Name of the manifest the expression matrices belong to.
+        data_type: str
+            Kind of expression matrix, either "log2" or "raw".
+        gene_identifier: str
+            Identifier of the gene.
+        cells_fingerprint: str
+            Fingerprint of the cells from GeneDataCache.cells_fingerprint.
+
+        Returns
+        -------
+        str
+        """
+        return hashlib.md5(json.dumps(
+            [manifest, data_type, gene_identifier, cells_fingerprint]
+        ).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Return the cached expression of a gene.
+
+        Parameters
+        ----------
+        key: str
+            Key from GeneDataCache.key.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            The expression of the gene in each cell; None if it is not
+            cached.
+        """
+        path = self._entry_path(key)
+        try:
+            values = np.load(path, allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+        try:
+            # mark the entry as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        return values
+
+    def put(self, key: str, values: np.ndarray, evict: bool = True) -> None:
+        """
+        Cache the expression of a gene, removing the least recently used
+        entries if the cache grows beyond its maximum size.
+
+        Parameters
+        ----------
+        key: str
+            Key from GeneDataCache.key.
+        values: numpy.ndarray
+            The expression of the gene in each cell.
+        evict: bool
+            If False, do not remove entries now. Used to add several genes
+            and then call GeneDataCache.evict once for all of them.
+        """
+        path = self._entry_path(key)
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(values), allow_pickle=False)
+        if self._size is None:
+            self._size = self.size
+        try:
+            self._size -= path.stat().st_size
+        except OSError:
+            pass
+        atomic_write(path, buffer.getvalue())
+        self._size += buffer.getbuffer().nbytes
+        if evict:
+            self.evict(keep=[key])
+        return None
+
+    def evict(self, keep: Iterable[str] = ()) -> None:
+        """
+        Remove the least recently used entries until the cache fits in its
+        maximum size.
+
+        Parameters
+        ----------
+        keep: Iterable[str]
+            Keys of entries that must not be removed, e.g. the genes just
+            added.
+        """
+        if self._size is not None and self._size <= self._max_size:
+            return None
+        keep_paths = {self._entry_path(key) for key in keep}
+        entries = []
+        for path in self._entry_paths():
+            try:
+                stat = path.stat()
+            except OSError:
+                # removed by another process
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self._max_size:
+                break
+            if path in keep_paths:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total_size -= size
+        self._size = total_size
+        return None
+
+    def clear(self) -> None:
+        """Remove all cached gene data."""
+        for path in self._entry_paths():
+            path.unlink()
+        self._size = 0
+        return None
+
+    def _entry_path(self, key: str) -> Path:
+        return self._cache_dir / f"{key}.npy"
+
+    def _entry_paths(self):
+        return self._cache_dir.glob("*.npy")
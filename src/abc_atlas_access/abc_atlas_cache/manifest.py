@@ -1,8 +1,10 @@
-from typing import Dict, List, Any, Union
+from typing import Dict, List, Any, Tuple, Union
 import json
+import marshal
 import pathlib
 from abc_atlas_access.abc_atlas_cache.file_attributes import (
     CacheFileAttributes,
+    FileRecord,
 )  # noqa: E501
 
 """Methods for accessing and manipulating manifest.json files associated with
@@ -38,6 +40,83 @@ class Manifest(object):
         cache_dir: Union[str, pathlib.Path],
         json_input,
     ):
+        self._set_cache_dir(cache_dir)
+
+        self._data: Dict[str, Any] = json.load(json_input)
+        if not isinstance(self._data, dict):
+            raise ValueError(
+                "Expected to deserialize manifest into a dict; "
+                f"instead got {type(self._data)}"
+            )
+
+        self._set_summary()
+        self._build_index()
+
+    @classmethod
+    def from_serialized(
+        cls,
+        cache_dir: Union[str, pathlib.Path],
+        serialized: bytes,
+    ) -> "Manifest":
+        """
+        Create a Manifest from the output of Manifest.serialize, skipping
+        the JSON parsing and index building.
+
+        The data is loaded with marshal, which is not secure against
+        malformed data: only load data written by Manifest.serialize with the
+        same Python version, e.g. a file whose header has been checked.
+
+        Parameters
+        ----------
+        cache_dir: str or pathlib.Path
+            The path to the directory where local copies of files will be
+            stored
+        serialized: bytes
+            A manifest serialized by Manifest.serialize
+
+        Returns
+        -------
+        Manifest
+
+        Raises
+        ------
+        ValueError
+            If serialized is not a manifest serialized by
+            Manifest.serialize.
+        """
+        try:
+            loaded = marshal.loads(serialized)
+        except (EOFError, TypeError) as err:
+            raise ValueError(f"Invalid serialized manifest: {err}")
+        if not (isinstance(loaded, tuple) and len(loaded) == 3
+                and all(isinstance(part, dict) for part in loaded)):
+            raise ValueError("Invalid serialized manifest")
+        manifest = cls.__new__(cls)
+        manifest._set_cache_dir(cache_dir)
+        (manifest._data,
+         manifest._data_kind_files,
+         manifest._file_index) = loaded
+        try:
+            manifest._set_summary()
+        except (KeyError, AttributeError, TypeError) as err:
+            raise ValueError(f"Invalid serialized manifest: {err}")
+        return manifest
+
+    def serialize(self) -> bytes:
+        """
+        Return a compact binary form of the parsed manifest and its lookup
+        index that Manifest.from_serialized can load faster than the JSON.
+
+        Returns
+        -------
+        bytes
+        """
+        return marshal.dumps(
+            (self._data, self._data_kind_files, self._file_index)
+        )
+
+    def _set_cache_dir(self, cache_dir: Union[str, pathlib.Path]):
+        """Set the directory local copies of files are stored in."""
         if isinstance(cache_dir, str):
             self._cache_dir = pathlib.Path(cache_dir).resolve()
         elif isinstance(cache_dir, pathlib.Path):
@@ -49,19 +128,56 @@ class Manifest(object):
                 f"got {type(cache_dir)}"
             )
 
-        self._data: Dict[str, Any] = json.load(json_input)
-        if not isinstance(self._data, dict):
-            raise ValueError(
-                "Expected to deserialize manifest into a dict; "
-                f"instead got {type(self._data)}"
-            )
-
+    def _set_summary(self):
+        """Set the version, resource URI and directories of the manifest."""
         self._version: str = self._data["version"]
         self._resource_uri: str = self._data["resource_uri"]
 
         self._directory_list: List[str] = list(self._data["directory_listing"].keys())
         self._directory_list.sort()
 
+    def _build_index(self):
+        """
+        Build the lookup tables used to list and find files so that those
+        queries do not have to walk the manifest's file listing each time.
+
+        self._data_kind_files maps (directory, data_kind) to the sorted list
+        of file names of that kind in the directory.
+
+        self._file_index maps (directory, file_name) to the (file_type,
+        file entry) pair describing the file, where file_name is either a
+        plain name or name/kind for files with multiple kinds.
+        """
+        self._data_kind_files: Dict[Tuple[str, str], List[str]] = {}
+        self._file_index: Dict[Tuple[str, str], Tuple[str, dict]] = {}
+        for directory, sub_directories in self._data["file_listing"].items():
+            file_names = set()
+            for data_kind, files in sub_directories.items():
+                kind_files = []
+                for file_name, files_data in files.items():
+                    # Check for files with multiple kinds (e.g. raw and log2)
+                    if "files" in files_data.keys():
+                        kind_files.append(file_name)
+                        file_names.add(file_name)
+                    else:
+                        kind_files.extend(
+                            "%s/%s" % (file_name, key)
+                            for key in files_data.keys()
+                        )
+                        file_names.update(
+                            "%s/%s" % (file_name, key)
+                            for key in files_data.keys()
+                        )
+                kind_files.sort()
+                self._data_kind_files[(directory, data_kind)] = kind_files
+            for file_name in file_names:
+                try:
+                    self._file_index[(directory, file_name)] = \
+                        self._find_file_entry(directory, file_name)
+                except KeyError:
+                    # Ambiguous names are resolved (and raise) on lookup.
+                    continue
+
     def _list_data_in_directory(
         self,
         directory: str,
@@ -84,23 +200,11 @@ class Manifest(object):
             List of all files either metadata or general data files in a
             directory.
         """
-        output_data_list = []
-        sub_directories = self._data["file_listing"][directory]
-        for sub_dir in sub_directories.keys():
-            if sub_dir != data_kind:
-                continue
-            for sub_dir_key in sub_directories[sub_dir].keys():
-                # Check for files with multiple kinds (e.g. raw and log2)
-                if "files" in sub_directories[sub_dir][sub_dir_key].keys():
-                    output_data_list.append(sub_dir_key)
-                else:
-                    output_data_list.extend(
-                        [
-                            "%s/%s" % (sub_dir_key, key)
-                            for key in sub_directories[sub_dir][sub_dir_key].keys()
-                        ]
-                    )
-        output_data_list.sort()
+        if directory not in self._data["file_listing"]:
+            raise KeyError(directory)
+        output_data_list = list(
+            self._data_kind_files.get((directory, data_kind), [])
+        )
         if len(output_data_list) == 0:
             raise DataTypeNotInDirectory(
                 f"No {data_kind} files found in directory {directory}. "
@@ -224,6 +328,76 @@ class Manifest(object):
         CacheFileAttributes
             The file attributes for the requested file.
         """
+        record = self._get_file_record(directory, file_name)
+        return self._create_file_attributes(
+            remote_path=record.url,
+            version=record.version,
+            size=record.file_size,
+            relative_path=record.relative_path,
+            file_type=record.file_type,
+            file_hash=record.file_hash,
+        )
+
+    def _get_file_record(
+        self,
+        directory: str,
+        file_name: str,
+    ) -> FileRecord:
+        """
+        Get the manifest entry of a file without building and validating a
+        CacheFileAttributes.
+
+        Parameters
+        ----------
+        directory: str
+            The directory to look for the file in.
+        file_name: str
+             The name of the file to look for.
+
+        Returns
+        -------
+        FileRecord
+            The attributes of the requested file as listed in the manifest.
+        """
+        entry = self._file_index.get((directory, file_name))
+        if entry is None:
+            entry = self._find_file_entry(directory, file_name)
+        file_type, file_data = entry
+        return FileRecord(
+            url=file_data["url"],
+            version=file_data["version"],
+            file_size=file_data["size"],
+            relative_path=file_data["relative_path"],
+            file_type=file_type,
+            file_hash=file_data["file_hash"],
+        )
+
+    def _find_file_entry(
+        self,
+        directory: str,
+        file_name: str,
+    ) -> Tuple[str, dict]:
+        """
+        Search the file listing of a directory for a file.
+
+        Parameters
+        ----------
+        directory: str
+            The directory to look for the file in.
+        file_name: str
+             The name of the file to look for.
+
+        Returns
+        -------
+        tuple
+            The file type (e.g. 'csv') and the manifest entry of the file.
+
+        Raises
+        ------
+        KeyError
+            If the directory or file does not exist, or if file_name has
+            multiple kinds and none was specified.
+        """
         file_name = file_name.split("/")
         if len(file_name) == 1:
             file_name = file_name[0]
@@ -233,34 +407,16 @@ class Manifest(object):
             file_name = file_name[0]
         directory_data = self._data["file_listing"][directory]
 
-        file_attributes = None
+        entry = None
         for sub_dir in directory_data.keys():
             if file_name in directory_data[sub_dir].keys():
                 files_data = directory_data[sub_dir][file_name]
                 if "files" in files_data.keys():
                     file_type = list(files_data["files"].keys())[0]
-                    file_attributes = self._create_file_attributes(
-                        remote_path=files_data["files"][file_type]["url"],
-                        version=files_data["files"][file_type]["version"],
-                        size=files_data["files"][file_type]["size"],
-                        relative_path=files_data["files"][file_type]["relative_path"],
-                        file_type=file_type,
-                        file_hash=files_data["files"][file_type]["file_hash"],
-                    )
+                    entry = (file_type, files_data["files"][file_type])
                 elif kind in files_data.keys():
                     file_type = list(files_data[kind]["files"].keys())[0]
-                    file_attributes = self._create_file_attributes(
-                        remote_path=files_data[kind]["files"][file_type]["url"],
-                        version=files_data[kind]["files"][file_type]["version"],
-                        size=files_data[kind]["files"][file_type]["size"],
-                        relative_path=files_data[kind]["files"][file_type][
-                            "relative_path"
-                        ],
-                        file_type=file_type,
-                        file_hash=files_data[kind]["files"][file_type][
-                            "file_hash"
-                        ],  # noqa: E501
-                    )
+                    entry = (file_type, files_data[kind]["files"][file_type])
                 elif kind is None and "files" not in files_data.keys():
                     raise KeyError(
                         f"File {file_name} found in directory but multiple "
@@ -268,10 +424,10 @@ class Manifest(object):
                         "specify the file name as one of "
                         f"{['%s/%s' % (file_name, key) for key in files_data.keys()]}"  # noqa: E501
                     )
-        if file_attributes is None:
+        if entry is None:
             raise KeyError(f"File {file_name} not found in directory {directory}.")
 
-        return file_attributes
+        return entry
 
     def _create_file_attributes(
         self,
@@ -447,10 +603,9 @@ class Manifest(object):
         unit_size = 1024**3
         unit = "GB"
         for file_name in file_list:
-            file_attributes = self.get_file_attributes(
+            total_size += self._get_file_record(
                 directory=directory, file_name=file_name
-            )
-            total_size += file_attributes.file_size
+            ).file_size
         total_size /= unit_size
         if total_size < 1:
             total_size *= 1024
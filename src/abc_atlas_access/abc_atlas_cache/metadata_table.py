@@ -0,0 +1,722 @@
+from typing import (
+    Any, Callable, Dict, Hashable, List, Optional, Sequence, Union
+)
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import json
+import logging
+import operator
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from abc_atlas_access.abc_atlas_cache.utils import atomic_write
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+# Number of rows per row group of the Parquet copies. Row groups whose
+# statistics exclude every row of a filter are skipped when reading.
+_ROW_GROUP_SIZE = 100000
+
+# Number of csv rows parsed at a time when filtering a table read from csv.
+_CSV_CHUNK_SIZE = 500000
+
+# Row filter operators and their pandas equivalents. As when filtering a
+# Parquet file, missing values never satisfy a comparison.
+_FILTER_OPERATORS: Dict[str, Callable[[pd.Series, Any], pd.Series]] = {
+    '==': lambda values, value: values.notna() & operator.eq(values, value),
+    '=': lambda values, value: values.notna() & operator.eq(values, value),
+    '!=': lambda values, value: values.notna() & operator.ne(values, value),
+    '<': lambda values, value: values.notna() & operator.lt(values, value),
+    '<=': lambda values, value: values.notna() & operator.le(values, value),
+    '>': lambda values, value: values.notna() & operator.gt(values, value),
+    '>=': lambda values, value: values.notna() & operator.ge(values, value),
+    'in': lambda values, value: values.isin(value),
+    'not in': lambda values, value: ~values.isin(value),
+}
+
+# String columns with at most this fraction of distinct values are stored
+# as categoricals by compact_dtypes.
+_CATEGORY_MAX_FRACTION = 0.5
+
+# Arguments of pandas.read_csv that a table may be read with and still have
+# a Parquet copy. The copy is made for each combination of these arguments
+# (see _read_arguments_key). A usecols list of column names is read as
+# columns from the copy of the whole table. Any other argument, e.g. one
+# that skips rows or changes which values are missing, always reads the csv.
+_COPY_READ_ARGUMENTS = ('dtype', 'index_col', 'parse_dates')
+
+Filters = Union[List[tuple], List[List[tuple]]]
+
+
+class DataFrameMemo(object):
+    """
+    An in-memory, least recently used cache of loaded metadata tables.
+
+    The size of each table is estimated from the memory used by its values,
+    including the strings of object columns. When the total size exceeds
+    max_bytes, the least recently used tables are dropped. Tables larger
+    than max_bytes are not cached at all. Safe to use from several threads.
+
+    Parameters
+    ----------
+    max_bytes: int
+        Maximum total estimated size in bytes of the cached tables.
+    copy: bool
+        If True, get returns a copy of the cached table that can be freely
+        modified. If False, get returns a shallow copy sharing its values
+        with the cached table: adding or removing columns does not affect
+        the cache, but modifying values in place does (unless pandas
+        copy-on-write is enabled), so such tables must be treated as read
+        only.
+    """
+
+    def __init__(self, max_bytes: int, copy: bool = True):
+        self._max_bytes = max_bytes
+        self._copy = copy
+        self._tables: "OrderedDict[Hashable, pd.DataFrame]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self) -> int:
+        """Maximum total estimated size in bytes of the cached tables"""
+        return self._max_bytes
+
+    @property
+    def nbytes(self) -> int:
+        """Total estimated size in bytes of the cached tables"""
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._tables)
+
+    def get(self, key: Hashable) -> Optional[pd.DataFrame]:
+        """
+        Return the table cached under key.
+
+        Parameters
+        ----------
+        key: Hashable
+            The key the table was cached under.
+
+        Returns
+        -------
+        pandas.DataFrame or None
+            A copy of the cached table, or None if no table is cached under
+            key.
+        """
+        with self._lock:
+            data = self._tables.get(key)
+            if data is None:
+                return None
+            self._tables.move_to_end(key)
+        return data.copy(deep=self._copy)
+
+    def put(self, key: Hashable, data: pd.DataFrame) -> None:
+        """
+        Cache a table under key, dropping the least recently used tables
+        if needed.
+
+        Parameters
+        ----------
+        key: Hashable
+            The key to cache the table under.
+        data: pandas.DataFrame
+            The table. A copy is cached, so later changes to data do not
+            affect the cache.
+        """
+        size = int(data.memory_usage(index=True, deep=True).sum())
+        if size > self._max_bytes:
+            return None
+        data = data.copy(deep=self._copy)
+        with self._lock:
+            self._tables[key] = data
+            self._tables.move_to_end(key)
+            self._sizes[key] = size
+            total = sum(self._sizes.values())
+            while total > self._max_bytes:
+                old_key, _ = self._tables.popitem(last=False)
+                total -= self._sizes.pop(old_key)
+        return None
+
+    def clear(self) -> None:
+        """Drop all cached tables."""
+        with self._lock:
+            self._tables.clear()
+            self._sizes.clear()
+
+
+def metadata_sidecar_path(
+        csv_path: Union[str, Path],
+        file_hash: str,
+        read_key: str = ''
+) -> Path:
+    """
+    Return the path of the columnar (Parquet) copy of a metadata csv.
+
+    The copy is stored next to the csv and named after the file hash of the
+    csv listed in the manifest, so that a copy of an older version of the
+    file is never read in place of the current one, and after the
+    pandas.read_csv arguments the table was read with.
+
+    Parameters
+    ----------
+    csv_path: str or pathlib.Path
+        Path to the metadata csv.
+    file_hash: str
+        The file hash of the csv listed in the manifest.
+    read_key: str
+        Key of the pandas.read_csv arguments the table is read with; empty
+        for a table read without arguments.
+
+    Returns
+    -------
+    pathlib.Path
+        Path to the Parquet copy of the csv.
+    """
+    csv_path = Path(csv_path)
+    return csv_path.with_name(
+        f'{csv_path.stem}.{_version_name(file_hash, read_key)}.parquet'
+    )
+
+
+def metadata_schema_path(
+        csv_path: Union[str, Path],
+        file_hash: str,
+        read_key: str = ''
+) -> Path:
+    """
+    Return the path of the compact dtype schema of a metadata csv (see
+    derive_dtype_schema), stored next to the csv.
+
+    Parameters
+    ----------
+    csv_path: str or pathlib.Path
+        Path to the metadata csv.
+    file_hash: str
+        The file hash of the csv listed in the manifest.
+    read_key: str
+        Key of the pandas.read_csv arguments the table is read with; empty
+        for a table read without arguments.
+
+    Returns
+    -------
+    pathlib.Path
+        Path to the JSON dtype schema of the csv.
+    """
+    csv_path = Path(csv_path)
+    return csv_path.with_name(
+        f'{csv_path.stem}.{_version_name(file_hash, read_key)}.dtypes.json'
+    )
+
+
+def _version_name(file_hash: str, read_key: str) -> str:
+    """Name of a version of a csv read with the given arguments."""
+    return file_hash if read_key == '' else f'{file_hash}-{read_key}'
+
+
+def _read_arguments_key(kwargs: dict) -> Optional[str]:
+    """
+    Return a stable key of the pandas.read_csv arguments a table is read
+    with: an empty string for no arguments, or None if the arguments do not
+    allow a Parquet copy of the table (see _COPY_READ_ARGUMENTS).
+    """
+    if len(kwargs) == 0:
+        return ''
+    normalized = {}
+    for name, value in kwargs.items():
+        if name not in _COPY_READ_ARGUMENTS:
+            return None
+        try:
+            if name == 'dtype':
+                # Equivalent dtypes (e.g. str and 'str') share a key.
+                if isinstance(value, dict):
+                    value = {column: repr(pd.api.types.pandas_dtype(dtype))
+                             for column, dtype in value.items()}
+                else:
+                    value = repr(pd.api.types.pandas_dtype(value))
+            normalized[name] = _plain_value(value)
+        except (TypeError, ValueError):
+            return None
+    return hashlib.md5(
+        json.dumps(normalized, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def _plain_value(value: Any) -> Any:
+    """
+    Return value as JSON serializable data that identifies it, raising
+    TypeError if it is not made of plain values (e.g. a callable).
+    """
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_plain_value(item) for item in value]
+    if isinstance(value, dict):
+        # repr keeps e.g. column 0 and column '0' apart
+        return {repr(key): _plain_value(item) for key, item in value.items()}
+    raise TypeError(f"Unsupported read argument {value!r}")
+
+
+def derive_dtype_schema(data: pd.DataFrame) -> Dict[str, dict]:
+    """
+    Derive the most compact lossless dtypes of the columns of a table.
+
+    String columns in which at most half of the values are distinct (labels,
+    colors, cluster names, ...) become categoricals, integer columns the
+    narrowest integer type holding all their values and float columns
+    float32 if that represents every value exactly.
+
+    Parameters
+    ----------
+    data: pandas.DataFrame
+        The table.
+
+    Returns
+    -------
+    Dict[str, dict]
+        The schema, mapping column names to {'dtype': str} and, for
+        categoricals, the sorted 'categories' of the column. Columns whose
+        dtype is already compact are not included.
+    """
+    schema = {}
+    for column in data.columns:
+        values = data[column]
+        if values.dtype == object:
+            categories = values.dropna().unique()
+            if len(categories) <= _CATEGORY_MAX_FRACTION * len(values) \
+                    and all(isinstance(value, str) for value in categories):
+                schema[column] = {'dtype': 'category',
+                                  'categories': sorted(categories)}
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            compact = pd.to_numeric(values, downcast='integer')
+            if compact.dtype != values.dtype:
+                schema[column] = {'dtype': str(compact.dtype)}
+        elif values.dtype == np.float64:
+            as_float32 = values.to_numpy().astype(np.float32)
+            if np.array_equal(as_float32, values.to_numpy(), equal_nan=True):
+                schema[column] = {'dtype': 'float32'}
+    return schema
+
+
+def compact_dtypes(
+        data: pd.DataFrame,
+        schema: Dict[str, dict]
+) -> pd.DataFrame:
+    """
+    Convert the columns of a table to the dtypes of a schema returned by
+    derive_dtype_schema. Columns not in the table are ignored.
+
+    Parameters
+    ----------
+    data: pandas.DataFrame
+        The table.
+    schema: Dict[str, dict]
+        Compact dtypes of the columns of the table.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The table with converted columns.
+    """
+    dtypes = {}
+    recategorize = {}
+    for column, dtype in _schema_dtypes(schema).items():
+        if column not in data.columns:
+            continue
+        # astype treats unordered categoricals with the same categories in
+        # another order as equal, so categoricals are recoded explicitly.
+        if isinstance(dtype, pd.CategoricalDtype) \
+                and isinstance(data[column].dtype, pd.CategoricalDtype):
+            recategorize[column] = dtype.categories
+        else:
+            dtypes[column] = dtype
+    data = data.astype(dtypes, copy=False)
+    for column, categories in recategorize.items():
+        data[column] = data[column].cat.set_categories(categories)
+    return data
+
+
+def _schema_dtypes(schema: Dict[str, dict]) -> Dict[str, Any]:
+    """Return the pandas dtypes of the columns of a compact dtype schema."""
+    dtypes = {}
+    for column, column_schema in schema.items():
+        if column_schema['dtype'] == 'category':
+            dtypes[column] = pd.CategoricalDtype(column_schema['categories'])
+        else:
+            dtypes[column] = column_schema['dtype']
+    return dtypes
+
+
+def read_metadata_table(
+        csv_path: Union[str, Path],
+        file_hash: Optional[str] = None,
+        columns: Optional[Sequence[str]] = None,
+        filters: Optional[Filters] = None,
+        compact: bool = False,
+        **kwargs
+) -> pd.DataFrame:
+    """
+    Read a metadata csv, using its columnar copy when one is available.
+
+    The first time a whole csv is read, a Parquet copy of the resulting
+    dataframe is written next to it (see metadata_sidecar_path) and later
+    reads load that copy instead of parsing the csv again. A separate copy
+    is kept for each combination of the dtype, index_col and parse_dates
+    arguments of pandas.read_csv. A usecols list of column names reads
+    those columns from the copy of the whole table, which is written first
+    if needed; any other argument always reads the csv. Copies are only used if pyarrow is installed. Failing to
+    write the copy, e.g. in a read only cache directory, is not an error.
+
+    Only the requested columns and the rows passing the filters are read
+    from the Parquet copy, skipping row groups that cannot pass the filters.
+    Without a copy, the csv is parsed in chunks that are filtered as they
+    are read. Either way, the index of a filtered table is renumbered from
+    zero unless an index_col is passed to pandas.read_csv.
+
+    In compact mode the columns are converted to compact dtypes (see
+    derive_dtype_schema). The dtypes derived from a whole table are saved
+    next to the csv (see metadata_schema_path) and used for later reads of
+    any part of it, so that they do not depend on the rows selected. Once
+    saved, they are applied while reading: the csv is parsed straight into
+    them and categorical columns are read from the Parquet copy as
+    dictionary encoded columns, so that the strings of those columns are
+    never all held in memory at once.
+
+    Parameters
+    ----------
+    csv_path: str or pathlib.Path
+        Path to the metadata csv.
+    file_hash: Optional[str]
+        The file hash of the csv listed in the manifest. If None, the csv is
+        always parsed.
+    columns: Optional[Sequence[str]]
+        Names of the columns to read. If None, read all columns.
+    filters: Optional[List[tuple] or List[List[tuple]]]
+        Only read the rows passing these filters. Each filter is a tuple
+        (column, operator, value) with operator one of '==', '!=', '<',
+        '<=', '>', '>=', 'in' or 'not in'. Rows must pass all filters of a
+        list, or all filters of any one list in a list of lists (the filter
+        format of pandas.read_parquet).
+    compact: bool
+        If True, convert the columns to compact dtypes.
+    **kwargs
+        Keyword arguments to pass to pandas.read_csv
+
+    Returns
+    -------
+    pandas.DataFrame
+        The metadata table.
+
+    Raises
+    ------
+    ValueError
+        If a filter is malformed or both columns and usecols are given.
+    """
+    if columns is not None:
+        if 'usecols' in kwargs:
+            raise ValueError("Pass only one of columns and usecols")
+        columns = list(columns)
+    usecols_copy = 'usecols' in kwargs \
+        and _is_column_names(kwargs['usecols'])
+    if usecols_copy:
+        columns = _usecols_columns(csv_path, kwargs.pop('usecols'), kwargs)
+    filters = _normalize_filters(filters)
+    read_key = _read_arguments_key(kwargs)
+    schema = None
+    schema_path = None
+    if compact and file_hash is not None and read_key is not None:
+        schema_path = metadata_schema_path(csv_path, file_hash, read_key)
+        if schema_path.is_file():
+            with open(schema_path, 'r') as in_file:
+                schema = json.load(in_file)
+    data = _read_table(csv_path, file_hash, read_key, columns, filters,
+                       schema, write_copy=usecols_copy, **kwargs)
+    if not compact:
+        return data
+    if schema is not None:
+        return compact_dtypes(data, schema)
+
+    schema = derive_dtype_schema(data)
+    if schema_path is not None and columns is None and filters is None:
+        try:
+            atomic_write(schema_path, json.dumps(schema))
+            _remove_other_versions(schema_path, Path(csv_path).stem,
+                                   '.dtypes.json', file_hash)
+        except OSError as err:
+            logger.info(f"Could not write {schema_path}: {err}")
+    return compact_dtypes(data, schema)
+
+
+def _read_table(
+        csv_path: Union[str, Path],
+        file_hash: Optional[str],
+        read_key: Optional[str],
+        columns: Optional[List[str]],
+        filters: Optional[List[List[tuple]]],
+        schema: Optional[Dict[str, dict]] = None,
+        write_copy: bool = False,
+        **kwargs
+) -> pd.DataFrame:
+    """
+    Read the selected part of a metadata table from its Parquet copy if
+    there is one, otherwise from the csv (see read_metadata_table). If a
+    compact dtype schema is given, its dtypes are applied while reading
+    where possible. If write_copy is True, a missing copy is written even
+    though only some columns are selected.
+    """
+    if pyarrow is not None and file_hash is not None \
+            and read_key is not None:
+        sidecar_path = metadata_sidecar_path(csv_path, file_hash, read_key)
+        if sidecar_path.is_file():
+            try:
+                return _read_sidecar(sidecar_path, columns, filters, schema)
+            except (OSError, pyarrow.ArrowException) as err:
+                logger.warning(f"Could not read {sidecar_path} ({err}); "
+                               f"reading {csv_path} instead")
+        elif filters is None and (columns is None or write_copy):
+            data = pd.read_csv(csv_path, **kwargs)
+            _write_sidecar(data, sidecar_path, Path(csv_path).stem,
+                           file_hash)
+            return data if columns is None else data[columns]
+
+    if schema is not None:
+        dtype = kwargs.get('dtype')
+        if dtype is None or isinstance(dtype, dict):
+            # The schema was derived from the table read with these
+            # arguments, so its dtypes take precedence.
+            kwargs['dtype'] = {**(dtype or {}), **_schema_dtypes(schema)}
+
+    usecols = None
+    if columns is not None:
+        # The index columns must be read as well for index_col to find them.
+        usecols = list(dict.fromkeys(
+            _csv_index_columns(csv_path, kwargs) + columns
+        ))
+    if filters is None:
+        data = pd.read_csv(csv_path, usecols=usecols, **kwargs)
+        return data if columns is None else data[columns]
+    return _read_csv_filtered(csv_path, columns, usecols, filters, **kwargs)
+
+
+def _is_column_names(usecols: Any) -> bool:
+    """Whether a usecols argument of pandas.read_csv lists column names."""
+    return pd.api.types.is_list_like(usecols) \
+        and all(isinstance(column, str) for column in usecols)
+
+
+def _usecols_columns(
+        csv_path: Union[str, Path],
+        usecols: Sequence[str],
+        kwargs: dict
+) -> List[str]:
+    """
+    Return the columns that pandas.read_csv reads given usecols: the
+    columns of usecols that are not index columns, in the order of the csv.
+    """
+    index_columns = _csv_index_columns(csv_path, kwargs)
+    header = _csv_header(csv_path, kwargs)
+    usecols = set(usecols)
+    missing = usecols.difference(header)
+    if len(missing) > 0:
+        raise ValueError("usecols do not match columns, columns expected "
+                         f"but not found: {sorted(missing)}")
+    return [column for column in header
+            if column in usecols and column not in index_columns]
+
+
+def _csv_header(csv_path: Union[str, Path], kwargs: dict) -> pd.Index:
+    """Return the column names of a csv read with the pandas.read_csv
+    arguments kwargs."""
+    header_kwargs = {name: value for name, value in kwargs.items()
+                     if name in ('sep', 'delimiter', 'header', 'names',
+                                 'skiprows', 'encoding')}
+    return pd.read_csv(csv_path, nrows=0, **header_kwargs).columns
+
+
+def _csv_index_columns(csv_path: Union[str, Path], kwargs: dict) -> list:
+    """
+    Return the names of the columns given as index_col in the
+    pandas.read_csv arguments kwargs. Column positions in
+    kwargs['index_col'] are replaced by names, so that they refer to the
+    same columns when only some of the columns are read.
+    """
+    index_col = kwargs.get('index_col')
+    if index_col is None or index_col is False:
+        return []
+    is_list = isinstance(index_col, (list, tuple))
+    index_columns = list(index_col) if is_list else [index_col]
+    if not all(isinstance(column, str) for column in index_columns):
+        header = _csv_header(csv_path, kwargs)
+        index_columns = [column if isinstance(column, str) else header[column]
+                         for column in index_columns]
+        kwargs['index_col'] = index_columns if is_list else index_columns[0]
+    return index_columns
+
+
+def _normalize_filters(
+        filters: Optional[Filters]
+) -> Optional[List[List[tuple]]]:
+    """
+    Return filters as a list of lists of (column, operator, value) tuples,
+    checking that every filter is well formed.
+    """
+    if filters is None or len(filters) == 0:
+        return None
+    if isinstance(filters[0], tuple):
+        filters = [filters]
+    normalized = []
+    for conjunction in filters:
+        conjunction = [tuple(condition) for condition in conjunction]
+        for condition in conjunction:
+            if len(condition) != 3 \
+                    or condition[1] not in _FILTER_OPERATORS:
+                raise ValueError(
+                    f"Invalid filter {condition}; filters are tuples of "
+                    f"(column, operator, value) with operator one of "
+                    f"{list(_FILTER_OPERATORS)}"
+                )
+        normalized.append(conjunction)
+    return normalized
+
+
+def _filter_mask(
+        data: pd.DataFrame,
+        filters: List[List[tuple]]
+) -> np.ndarray:
+    """Return a boolean mask of the rows of data passing the filters."""
+    mask = np.zeros(len(data), dtype=bool)
+    for conjunction in filters:
+        passing = np.ones(len(data), dtype=bool)
+        for column, op, value in conjunction:
+            if column in data.columns:
+                values = data[column]
+            else:
+                # filters may refer to the index columns, as when reading
+                # the Parquet copy
+                values = pd.Series(data.index.get_level_values(column))
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # unordered categoricals do not support < and >
+                values = values.astype(values.cat.categories.dtype)
+            passing &= _FILTER_OPERATORS[op](values, value).to_numpy(
+                dtype=bool
+            )
+        mask |= passing
+    return mask
+
+
+def _read_csv_filtered(
+        csv_path: Union[str, Path],
+        columns: Optional[List[str]],
+        usecols: Optional[List[str]],
+        filters: List[List[tuple]],
+        **kwargs
+) -> pd.DataFrame:
+    """
+    Parse a csv in chunks, keeping the requested columns of the rows that
+    pass the filters. usecols are the columns to read to get the requested
+    columns, to which the columns the filters refer to are added.
+    """
+    if usecols is not None:
+        filter_columns = [column for conjunction in filters
+                          for column, _, _ in conjunction]
+        usecols = list(dict.fromkeys(usecols + filter_columns))
+    chunks = []
+    with pd.read_csv(csv_path, usecols=usecols, chunksize=_CSV_CHUNK_SIZE,
+                     **kwargs) as reader:
+        for chunk in reader:
+            chunk = chunk[_filter_mask(chunk, filters)]
+            chunks.append(chunk if columns is None else chunk[columns])
+    index_col = kwargs.get('index_col')
+    return pd.concat(chunks,
+                     ignore_index=index_col is None or index_col is False)
+
+
+def _read_sidecar(
+        sidecar_path: Path,
+        columns: Optional[List[str]] = None,
+        filters: Optional[List[List[tuple]]] = None,
+        schema: Optional[Dict[str, dict]] = None
+) -> pd.DataFrame:
+    """
+    Read a Parquet copy of a metadata csv, restoring the missing values of
+    string columns as NaN as pandas.read_csv would. The categorical columns
+    of a compact dtype schema are read as dictionary encoded columns and
+    converted to the dtypes of the schema.
+    """
+    read_dictionary = None
+    if schema is not None:
+        read_dictionary = [
+            column for column, column_schema in schema.items()
+            if column_schema['dtype'] == 'category'
+            and (columns is None or column in columns)
+        ]
+    data = pd.read_parquet(sidecar_path, engine='pyarrow', columns=columns,
+                           filters=filters, read_dictionary=read_dictionary)
+    if schema is not None:
+        data = compact_dtypes(data, schema)
+    for column in data.columns[data.dtypes == object]:
+        missing = data[column].isna()
+        if missing.any():
+            data[column] = data[column].where(~missing, np.nan)
+    return data
+
+
+def _write_sidecar(
+        data: pd.DataFrame,
+        sidecar_path: Path,
+        csv_stem: str,
+        file_hash: str
+) -> None:
+    """
+    Write the Parquet copy of a metadata csv and remove any copies of older
+    versions of the csv. Errors writing the copy are logged and ignored.
+    """
+    tmp_path = sidecar_path.with_name(
+        f'{sidecar_path.name}.{os.getpid()}.{threading.get_ident()}.tmp'
+    )
+    try:
+        data.to_parquet(tmp_path, engine='pyarrow',
+                        row_group_size=_ROW_GROUP_SIZE)
+        os.replace(tmp_path, sidecar_path)
+    except (OSError, ValueError, pyarrow.ArrowException) as err:
+        logger.info(f"Could not write {sidecar_path}: {err}")
+        return None
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    _remove_other_versions(sidecar_path, csv_stem, '.parquet', file_hash)
+    return None
+
+
+def _remove_other_versions(
+        path: Path,
+        csv_stem: str,
+        suffix: str,
+        file_hash: str
+) -> None:
+    """
+    Remove the files named <csv stem>.<file hash>[-<read key>]<suffix> next
+    to path that belong to other versions of the csv than file_hash.
+    """
+    for old_path in path.parent.glob(f'{csv_stem}.*{suffix}'):
+        version_name = old_path.name[len(csv_stem) + 1:-len(suffix)]
+        if '.' not in version_name \
+                and version_name.split('-')[0] != file_hash:
+            try:
+                old_path.unlink()
+            except OSError:
+                pass
+    return None
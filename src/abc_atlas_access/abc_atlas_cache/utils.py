@@ -1,6 +1,8 @@
 from typing import Union
 from pathlib import Path
 import hashlib
+import os
+import threading
 
 
 def file_hash_from_path(file_path: Union[str, Path]) -> str:
@@ -23,4 +25,31 @@ def file_hash_from_path(file_path: Union[str, Path]) -> str:
         while len(chunk) > 0:
             hasher.update(chunk)
             chunk = in_file.read(1000000)
-    return hasher.hexdigest()
\ No newline at end of file
+    return hasher.hexdigest()
+
+
+def atomic_write(file_path: Union[str, Path], data: Union[str, bytes]) -> None:
+    """
+    Write a file such that readers only ever see its previous or its new
+    contents. The data is written to a temporary file in the same directory
+    which is then renamed over file_path.
+
+    Parameters
+    ----------
+    file_path: Union[str, Path]
+        path to the file to write
+    data: Union[str, bytes]
+        contents of the file
+    """
+    file_path = Path(file_path)
+    tmp_path = file_path.with_name(
+        f'{file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp'
+    )
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    try:
+        with open(tmp_path, mode) as out_file:
+            out_file.write(data)
+        os.replace(tmp_path, file_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
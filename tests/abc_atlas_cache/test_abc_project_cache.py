@@ -1,7 +1,10 @@
+import io
 import json
 from moto import mock_aws
 import os
-from unittest.mock import patch
+from unittest.mock import PropertyMock, patch
+import numpy as np
+import pandas as pd
 import pytest
 
 from .utils import (
@@ -16,6 +19,7 @@ from abc_atlas_access.abc_atlas_cache.file_attributes import \
     CacheFileAttributes
 from abc_atlas_access.abc_atlas_cache.cloud_cache import (
     LocalCache,
+    MissingLocalManifestWarning,
     S3CloudCache
 )
 
@@ -201,6 +205,72 @@ class TestAbcProjectCache(BaseCacheTestCase):
         cache.load_latest_manifest()
         assert cache.current_manifest == f'releases/{self.new_version}/manifest.json'  # noqa: E501
 
+    def test_abc_project_cache_s3_multipart_options(self):
+        """Test that the multipart download options are passed through to
+        the S3CloudCache.
+        """
+        AbcProjectCache._default_bucket_name = self.test_bucket_name
+        cache = AbcProjectCache.from_s3_cache(
+            self.cache_dir,
+            multipart_threshold=1024,
+            multipart_chunksize=256,
+            max_concurrency=3
+        )
+        assert cache.cache._multipart_threshold == 1024
+        assert cache.cache._multipart_chunksize == 256
+        assert cache.cache._max_concurrency == 3
+        data_path = cache.get_file_path(directory="second_dir",
+                                        file_name=self.new_file)
+        assert data_path.read_bytes() == b'sendingoutanSOS'
+
+        with pytest.raises(ValueError, match="max_concurrency"):
+            AbcProjectCache.from_s3_cache(self.cache_dir, max_concurrency=0)
+
+    def test_abc_project_cache_s3_offline(self):
+        """Test that an offline cache serves downloaded files and raises an
+        error instead of contacting the bucket for any other file.
+        """
+        AbcProjectCache._default_bucket_name = self.test_bucket_name
+        cache = AbcProjectCache.from_s3_cache(self.cache_dir)
+        data_path = cache.get_file_path(directory="test_directory",
+                                        file_name=self.data_file)
+
+        cache = AbcProjectCache.from_s3_cache(self.cache_dir, offline=True)
+        with patch.object(S3CloudCache, 's3_client',
+                          new_callable=PropertyMock,
+                          side_effect=AssertionError('bucket contacted')):
+            assert cache.get_file_path(directory="test_directory",
+                                       file_name=self.data_file) == data_path
+            with pytest.raises(RuntimeError, match="offline"):
+                cache.get_file_path(directory="second_dir",
+                                    file_name=self.new_file)
+            with pytest.raises(RuntimeError, match="offline"):
+                cache.get_file_path(directory="test_directory",
+                                    file_name=self.data_file,
+                                    force_download=True)
+            with pytest.raises(RuntimeError, match="offline"):
+                cache.cache._download_manifest(
+                    f'releases/{self.old_version}/manifest.json'
+                )
+        assert not (self.cache_dir / self.new_file_attr.relative_path).exists()
+        assert data_path.exists()
+
+        # A file on disk that is missing from the record of downloads, e.g.
+        # in a cache copied without it, is reported as unverified.
+        cache.cache._download_ledger.path.unlink()
+        with pytest.warns(MissingLocalManifestWarning):
+            cache = AbcProjectCache.from_s3_cache(self.cache_dir,
+                                                  offline=True)
+        with patch.object(S3CloudCache, 's3_client',
+                          new_callable=PropertyMock,
+                          side_effect=AssertionError('bucket contacted')):
+            with pytest.raises(RuntimeError,
+                               match="present but not recorded as a "
+                                     "verified download"):
+                cache.get_file_path(directory="test_directory",
+                                    file_name=self.data_file)
+        assert data_path.exists()
+
     def test_abc_project_cache_local_cache(self):
         """Run a suite of integration tests on the AbcProjectCache class
         from_local_cache.
@@ -280,4 +350,186 @@ class TestAbcProjectCache(BaseCacheTestCase):
         # Initialize a new read only object from the local cache.
         with patch('os.access', return_value=False):
             cache = AbcProjectCache.from_cache_dir(self.cache_dir)
-        assert isinstance(cache.cache, LocalCache)
\ No newline at end of file
+        assert isinstance(cache.cache, LocalCache)
+
+@mock_aws
+class TestMetadataDataFrame(BaseCacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.version = "20240101"
+        self.csv_data = (b'cell_label,cluster,x,n_genes\n'
+                         b'a,c1,0.5,10\n'
+                         b'b,,1.5,20\n'
+                         b'c,c2,,30\n')
+        manifest, self.metadata_path, _ = create_manifest_dict(
+            version=self.version,
+            test_bucket_name=self.test_bucket_name,
+            file_hash=hash_data(self.csv_data)
+        )
+        self.client.put_object(Bucket=self.test_bucket_name,
+                               Key=self.metadata_path,
+                               Body=self.csv_data)
+        # A second metadata table in the same directory.
+        self.cluster_data = b'cluster,n_cells\nc1,1\nc2,1\n'
+        cluster_path = self.metadata_path.replace('metadata_file', 'cluster')
+        metadata = manifest['file_listing']['test_directory']['metadata']
+        metadata['cluster'] = {'files': {'csv': {
+            **metadata['metadata_file']['files']['csv'],
+            'relative_path': cluster_path,
+            'file_hash': hash_data(self.cluster_data)
+        }}}
+        self.client.put_object(Bucket=self.test_bucket_name,
+                               Key=cluster_path,
+                               Body=self.cluster_data)
+        self.client.put_object(
+            Bucket=self.test_bucket_name,
+            Key=f'releases/{self.version}/manifest.json',
+            Body=bytes(json.dumps(manifest), 'utf-8')
+        )
+        AbcProjectCache._default_bucket_name = self.test_bucket_name
+
+    def test_metadata_columnar_copy(self):
+        """Test that a Parquet copy of a metadata table is written on the
+        first read and returns the same table on later reads.
+        """
+        cache = AbcProjectCache.from_s3_cache(self.cache_dir)
+        csv_path = self.cache_dir / self.metadata_path
+        sidecar_path = csv_path.with_name(
+            f'metadata_file.{hash_data(self.csv_data)}.parquet'
+        )
+        stale_path = csv_path.with_name('metadata_file.abcd.parquet')
+        stale_path.parent.mkdir(parents=True, exist_ok=True)
+        stale_path.write_bytes(b'stale')
+
+        expected = pd.read_csv(io.BytesIO(self.csv_data))
+        first = cache.get_metadata_dataframe(directory="test_directory",
+                                             file_name="metadata_file")
+        pd.testing.assert_frame_equal(first, expected)
+        assert sidecar_path.is_file()
+        assert not stale_path.exists()
+
+        with patch('pandas.read_csv') as read_csv:
+            second = cache.get_metadata_dataframe(
+                directory="test_directory",
+                file_name="metadata_file"
+            )
+        read_csv.assert_not_called()
+        pd.testing.assert_frame_equal(second, expected)
+        assert second['cluster'].isna().sum() == 1
+
+        # Other read arguments than dtype, index_col, usecols and
+        # parse_dates always read the csv.
+        with patch('pandas.read_csv', wraps=pd.read_csv) as read_csv:
+            skipped = cache.get_metadata_dataframe(
+                directory="test_directory",
+                file_name="metadata_file",
+                skiprows=[1]
+            )
+        read_csv.assert_called_once()
+        assert list(skipped['cell_label']) == ['b', 'c']
+
+    def test_metadata_columnar_copy_read_arguments(self):
+        """Test that tables read with dtype and index_col arguments for
+        pandas.read_csv are served from a Parquet copy of their own.
+        """
+        cache = AbcProjectCache.from_s3_cache(self.cache_dir)
+        kwargs = {'dtype': {'cell_label': str, 'n_genes': 'float64'},
+                  'index_col': 'cell_label'}
+        expected = pd.read_csv(io.BytesIO(self.csv_data), **kwargs)
+        first = cache.get_metadata_dataframe(directory="test_directory",
+                                             file_name="metadata_file",
+                                             **kwargs)
+        pd.testing.assert_frame_equal(first, expected)
+        csv_path = self.cache_dir / self.metadata_path
+        copies = sorted(path.name for path in
+                        csv_path.parent.glob('metadata_file.*.parquet'))
+        assert len(copies) == 1
+        assert '-' in copies[0]
+
+        with patch('pandas.read_csv') as read_csv:
+            second = cache.get_metadata_dataframe(
+                directory="test_directory",
+                file_name="metadata_file",
+                dtype={'n_genes': np.float64, 'cell_label': 'str'},
+                index_col='cell_label'
+            )
+            subset = cache.get_metadata_dataframe(
+                directory="test_directory",
+                file_name="metadata_file",
+                columns=['n_genes'],
+                filters=[('x', '>', 1.0)],
+                **kwargs
+            )
+        read_csv.assert_not_called()
+        pd.testing.assert_frame_equal(second, expected)
+        pd.testing.assert_frame_equal(subset,
+                                      expected.loc[['b'], ['n_genes']])
+
+        # the copy of the table read without arguments is kept apart
+        plain = cache.get_metadata_dataframe(directory="test_directory",
+                                             file_name="metadata_file")
+        pd.testing.assert_frame_equal(
+            plain, pd.read_csv(io.BytesIO(self.csv_data))
+        )
+        assert len(list(csv_path.parent.glob('metadata_file.*.parquet'))) \
+            == 2
+
+    def test_metadata_dataframe_memo(self):
+        """Test that the in-memory cache of tables returns repeated requests
+        without reading the file and keys tables on the read arguments.
+        """
+        cache = AbcProjectCache.from_s3_cache(self.cache_dir)
+        cache.enable_dataframe_cache()
+        first = cache.get_metadata_dataframe(directory="test_directory",
+                                             file_name="metadata_file")
+        target = ('abc_atlas_access.abc_atlas_cache.abc_project_cache.'
+                  'read_metadata_table')
+        with patch(target) as read_table:
+            second = cache.get_metadata_dataframe(
+                directory="test_directory",
+                file_name="metadata_file"
+            )
+        read_table.assert_not_called()
+        pd.testing.assert_frame_equal(first, second)
+        assert second is not first
+
+        subset = cache.get_metadata_dataframe(directory="test_directory",
+                                              file_name="metadata_file",
+                                              columns=['cell_label'])
+        assert list(subset.columns) == ['cell_label']
+
+        cache.disable_dataframe_cache()
+        with patch(target) as read_table:
+            cache.get_metadata_dataframe(directory="test_directory",
+                                         file_name="metadata_file")
+        read_table.assert_called_once()
+
+    def test_metadata_dataframes(self):
+        """Test that several tables are loaded at once with their own read
+        arguments.
+        """
+        cache = AbcProjectCache.from_s3_cache(self.cache_dir)
+        tables = cache.get_metadata_dataframes([
+            ("test_directory", "cluster"),
+            ("test_directory", "metadata_file",
+             {"columns": ["cell_label", "cluster"],
+              "filters": [("cluster", "==", "c2")]}),
+        ], max_workers=2)
+        assert list(tables) == [("test_directory", "cluster"),
+                                ("test_directory", "metadata_file")]
+        pd.testing.assert_frame_equal(
+            tables[("test_directory", "cluster")],
+            pd.read_csv(io.BytesIO(self.cluster_data))
+        )
+        pd.testing.assert_frame_equal(
+            tables[("test_directory", "metadata_file")],
+            pd.DataFrame({'cell_label': ['c'], 'cluster': ['c2']})
+        )
+
+        with pytest.raises(ValueError, match="more than once"):
+            cache.get_metadata_dataframes([
+                ("test_directory", "cluster"),
+                ("test_directory", "cluster", {"compact": True}),
+            ])
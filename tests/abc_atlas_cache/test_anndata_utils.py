@@ -0,0 +1,575 @@
+import os
+import warnings
+from unittest.mock import patch
+
+import anndata
+import h5py
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse
+
+from abc_atlas_access.abc_atlas_cache import anndata_utils
+from abc_atlas_access.abc_atlas_cache.gene_data_cache import GeneDataCache
+from abc_atlas_access.abc_atlas_cache.anndata_utils import (
+    _row_blocks,
+    aggregate_gene_data,
+    create_gene_major_copies,
+    create_gene_major_copy,
+    gene_major_path,
+    iter_gene_data,
+    get_gene_data
+)
+
+
+class MockCache(object):
+    """Serve the paths of expression matrices written to a directory."""
+
+    current_manifest = 'releases/20240101/manifest.json'
+
+    def __init__(self, file_paths):
+        self.file_paths = file_paths
+
+    def get_file_path(self, directory, file_name):
+        return self.file_paths[(directory, file_name)]
+
+    def list_expression_matrix_files(self, directory):
+        return sorted(file_name for dir_name, file_name in self.file_paths
+                      if dir_name == directory)
+
+
+@pytest.fixture
+def gene_data(tmp_path):
+    """Write two small expression matrices and return a cache serving them
+    with the cell and gene metadata and the expected dense expression."""
+    rng = np.random.default_rng(seed=5)
+    n_genes = 20
+    genes = pd.DataFrame(
+        {'gene_symbol': [f'symbol_{idx}' for idx in range(n_genes)]},
+        index=pd.Index([f'gene_{idx}' for idx in range(n_genes)],
+                       name='gene_identifier')
+    )
+
+    file_paths = {}
+    cells = []
+    expression = []
+    for matrix_idx, n_cells in enumerate([37, 23]):
+        matrix = scipy.sparse.random(n_cells, n_genes, density=0.2,
+                                     format='csr', dtype=np.float32,
+                                     random_state=rng)
+        # values in [0, 4) so that integer casts keep some non-zeros
+        matrix.data *= 4
+        cell_labels = [f'cell_{matrix_idx}_{idx}' for idx in range(n_cells)]
+        adata = anndata.AnnData(
+            X=matrix,
+            obs=pd.DataFrame(index=pd.Index(cell_labels, name='cell_label')),
+            var=genes
+        )
+        file_path = tmp_path / f'matrix_{matrix_idx}-log2.h5ad'
+        adata.write_h5ad(file_path)
+        file_paths[('dataset', f'matrix_{matrix_idx}/log2')] = file_path
+        cells.append(pd.DataFrame(
+            {'dataset_label': 'dataset',
+             'feature_matrix_label': f'matrix_{matrix_idx}'},
+            index=pd.Index(cell_labels, name='cell_label')
+        ))
+        expression.append(pd.DataFrame(matrix.toarray(),
+                                       index=cell_labels,
+                                       columns=genes.gene_symbol))
+    cells = pd.concat(cells)
+    # cells are not stored in the same order as the matrices
+    cells = cells.sample(frac=1, random_state=3)
+    expression = pd.concat(expression)
+    return MockCache(file_paths), cells, genes, expression
+
+
+def test_get_gene_data(gene_data):
+    cache, cells, genes, expression = gene_data
+    selected_genes = ['symbol_3', 'symbol_0', 'symbol_17']
+    # only some of the cells of each matrix are requested
+    selected_cells = cells.iloc[::3]
+
+    result = get_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=selected_cells,
+        all_genes=genes,
+        selected_genes=selected_genes,
+        chunk_size=8
+    )
+
+    expected = expression.loc[
+        selected_cells.index,
+        ['symbol_0', 'symbol_3', 'symbol_17']
+    ]
+    assert list(result.index) == list(selected_cells.index)
+    assert list(result.columns) == list(expected.columns)
+    np.testing.assert_array_equal(result.to_numpy(dtype=np.float32),
+                                  expected.to_numpy())
+
+
+def test_get_gene_data_missing_cells(gene_data):
+    """Cells that are not in their expression matrix are left as NaN and
+    the output keeps the dtype of the matrices."""
+    cache, cells, genes, expression = gene_data
+    missing = pd.DataFrame(
+        {'dataset_label': 'dataset', 'feature_matrix_label': 'matrix_1'},
+        index=pd.Index(['not_a_cell'], name='cell_label')
+    )
+    selected_cells = pd.concat([cells.iloc[:5], missing])
+
+    result = get_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=selected_cells,
+        all_genes=genes,
+        selected_genes=['symbol_1', 'symbol_2'],
+    )
+
+    assert (result.dtypes == np.float32).all()
+    assert result.loc['not_a_cell'].isna().all()
+    np.testing.assert_array_equal(
+        result.iloc[:5].to_numpy(),
+        expression.loc[cells.index[:5], ['symbol_1', 'symbol_2']].to_numpy()
+    )
+
+
+def test_row_blocks():
+    rows = np.array([0, 1, 5, 6, 20, 21, 22, 23, 24, 50])
+    blocks = list(_row_blocks(rows, chunk_size=4))
+    assert blocks == [(0, 2), (5, 7), (20, 24), (24, 25), (50, 51)]
+    assert list(_row_blocks(np.array([], dtype=int), chunk_size=4)) == []
+
+
+@pytest.mark.parametrize("n_workers, max_memory", [(1, 64), (2, None)])
+def test_get_gene_data_workers(gene_data, n_workers, max_memory):
+    """Reading files in parallel or with a memory limit gives the same
+    result."""
+    cache, cells, genes, expression = gene_data
+    selected_genes = ['symbol_4', 'symbol_9']
+    expected = get_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=cells,
+        all_genes=genes,
+        selected_genes=selected_genes,
+    )
+
+    result = get_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=cells,
+        all_genes=genes,
+        selected_genes=selected_genes,
+        n_workers=n_workers,
+        max_memory=max_memory
+    )
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("max_memory", [2 * 1024**3, 40])
+def test_create_gene_major_copy(gene_data, max_memory):
+    """The gene-major copy holds the transposed matrix, whether the genes
+    are transposed at once or in several groups."""
+    cache, cells, genes, expression = gene_data
+    file_path = cache.file_paths[('dataset', 'matrix_0/log2')]
+
+    copy_path = create_gene_major_copy(file_path, max_memory=max_memory,
+                                       chunk_size=5)
+    assert copy_path == gene_major_path(file_path)
+
+    expected = anndata.read_h5ad(file_path).X.tocsc()
+    with h5py.File(copy_path, 'r') as copy:
+        result = scipy.sparse.csc_matrix(
+            (copy['data'][:], copy['indices'][:], copy['indptr'][:]),
+            shape=tuple(copy.attrs['shape'])
+        )
+        assert list(copy['var_names'].asstr()[:]) == list(genes.index)
+        assert list(copy['obs_names'].asstr()[:]) == \
+            list(expression.index[:37])
+    assert (result != expected).nnz == 0
+    np.testing.assert_array_equal(result.indices, expected.indices)
+
+
+def test_get_gene_data_gene_major(gene_data):
+    """get_gene_data reads the gene-major copies while they match their
+    h5ad files."""
+    cache, cells, genes, expression = gene_data
+    selected_genes = ['symbol_2', 'symbol_11']
+    selected_cells = cells.iloc[::2]
+    expected = get_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=selected_cells,
+        all_genes=genes,
+        selected_genes=selected_genes,
+    )
+
+    copy_paths = create_gene_major_copies(cache, 'dataset',
+                                          data_types=('log2',))
+    assert len(copy_paths) == 2
+    with patch('abc_atlas_access.abc_atlas_cache.anndata_utils.'
+               '_read_gene_major_genes',
+               wraps=anndata_utils._read_gene_major_genes) as mock_read:
+        result = get_gene_data(
+            abc_atlas_cache=cache,
+            all_cells=selected_cells,
+            all_genes=genes,
+            selected_genes=selected_genes,
+        )
+        assert mock_read.call_count == 2
+    pd.testing.assert_frame_equal(result, expected)
+
+    # a copy made from a different version of its h5ad file is not used
+    file_path = cache.file_paths[('dataset', 'matrix_0/log2')]
+    stat = file_path.stat()
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    with patch('abc_atlas_access.abc_atlas_cache.anndata_utils.'
+               '_read_gene_major_genes',
+               wraps=anndata_utils._read_gene_major_genes) as mock_read:
+        result = get_gene_data(
+            abc_atlas_cache=cache,
+            all_cells=selected_cells,
+            all_genes=genes,
+            selected_genes=selected_genes,
+        )
+        assert mock_read.call_count == 1
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("selected_genes", [None, ['symbol_5', 'symbol_1']])
+def test_aggregate_gene_data(gene_data, selected_genes):
+    cache, cells, genes, expression = gene_data
+    cells = cells.copy()
+    rng = np.random.default_rng(seed=11)
+    cells['cluster'] = rng.choice(['a', 'b', 'c', None], size=len(cells))
+    cells['region'] = rng.choice(['x', 'y'], size=len(cells))
+
+    result = aggregate_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=cells,
+        all_genes=genes,
+        group_by=['cluster', 'region'],
+        selected_genes=selected_genes,
+        statistics=("sum", "mean", "fraction", "var"),
+        chunk_size=7
+    )
+
+    if selected_genes is not None:
+        expression = expression[['symbol_1', 'symbol_5']]
+    grouped = expression.loc[cells.index].astype(np.float64).groupby(
+        [cells.cluster, cells.region]
+    )
+    expected = {
+        "sum": grouped.sum(),
+        "mean": grouped.mean(),
+        "fraction": (expression.loc[cells.index] != 0).groupby(
+            [cells.cluster, cells.region]).mean(),
+        "var": grouped.var(),
+    }
+    assert set(result.keys()) == set(expected.keys())
+    for statistic, values in expected.items():
+        pd.testing.assert_frame_equal(result[statistic], values,
+                                      check_names=False)
+
+    with pytest.raises(ValueError, match="Unknown statistics"):
+        aggregate_gene_data(cache, cells, genes, 'cluster',
+                            statistics=("median",))
+
+
+def test_aggregate_gene_data_raw_counts(tmp_path):
+    """Squares of integer counts do not overflow the dtype of the matrix."""
+    genes = pd.DataFrame(
+        {'gene_symbol': ['symbol_0', 'symbol_1']},
+        index=pd.Index(['gene_0', 'gene_1'], name='gene_identifier')
+    )
+    counts = np.array([[200, 0], [1000, 3], [30000, 7], [0, 9]],
+                      dtype=np.int16)
+    cell_labels = [f'cell_{idx}' for idx in range(len(counts))]
+    adata = anndata.AnnData(
+        X=scipy.sparse.csr_matrix(counts),
+        obs=pd.DataFrame(index=pd.Index(cell_labels, name='cell_label')),
+        var=genes
+    )
+    file_path = tmp_path / 'matrix_0-raw.h5ad'
+    adata.write_h5ad(file_path)
+    cache = MockCache({('dataset', 'matrix_0/raw'): file_path})
+    cells = pd.DataFrame(
+        {'dataset_label': 'dataset',
+         'feature_matrix_label': 'matrix_0',
+         'cluster': ['a', 'a', 'a', 'b']},
+        index=pd.Index(cell_labels, name='cell_label')
+    )
+
+    result = aggregate_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=cells,
+        all_genes=genes,
+        group_by='cluster',
+        statistics=("var",),
+        data_type="raw"
+    )
+
+    expected = pd.DataFrame(counts.astype(np.float64), index=cells.index,
+                            columns=genes.gene_symbol)
+    expected = expected.groupby(cells.cluster).var()
+    pd.testing.assert_frame_equal(result["var"], expected,
+                                  check_names=False)
+
+
+def test_gene_data_categorical_cells(gene_data):
+    """Cells metadata with categorical matrix labels, as loaded in compact
+    mode, are grouped by the matrices that are used only."""
+    cache, cells, genes, expression = gene_data
+    compact_cells = cells.astype({'dataset_label': 'category',
+                                  'feature_matrix_label': 'category'})
+    compact_cells['cluster'] = 'a'
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", FutureWarning)
+        result = get_gene_data(cache, compact_cells, genes, ['symbol_1'])
+        chunks = list(iter_gene_data(cache, compact_cells, genes,
+                                     ['symbol_1']))
+        aggregated = aggregate_gene_data(cache, compact_cells, genes,
+                                         'cluster', ['symbol_1'])
+    expected = get_gene_data(cache, cells, genes, ['symbol_1'])
+    pd.testing.assert_frame_equal(result, expected)
+    pd.testing.assert_frame_equal(pd.concat(chunks).loc[result.index],
+                                  expected)
+    assert aggregated["mean"].shape == (1, 1)
+
+
+def test_get_gene_data_result_cache(gene_data, tmp_path):
+    """Genes already in the result cache are not read again."""
+    cache, cells, genes, expression = gene_data
+    result_cache = GeneDataCache(tmp_path / 'gene_cache')
+    first = get_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=cells,
+        all_genes=genes,
+        selected_genes=['symbol_6', 'symbol_8'],
+        result_cache=result_cache
+    )
+
+    with patch('abc_atlas_access.abc_atlas_cache.anndata_utils.'
+               '_load_gene_data',
+               wraps=anndata_utils._load_gene_data) as mock_load:
+        result = get_gene_data(
+            abc_atlas_cache=cache,
+            all_cells=cells,
+            all_genes=genes,
+            selected_genes=['symbol_6', 'symbol_7', 'symbol_8'],
+            result_cache=result_cache
+        )
+        mock_load.assert_called_once()
+        np.testing.assert_array_equal(
+            mock_load.call_args.kwargs['gene_positions'], [7]
+        )
+    expected = get_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=cells,
+        all_genes=genes,
+        selected_genes=['symbol_6', 'symbol_7', 'symbol_8'],
+    )
+    pd.testing.assert_frame_equal(result, expected)
+    pd.testing.assert_frame_equal(result[['symbol_6', 'symbol_8']], first)
+
+    # a different set of cells is not served from the cache
+    with patch('abc_atlas_access.abc_atlas_cache.anndata_utils.'
+               '_load_gene_data',
+               wraps=anndata_utils._load_gene_data) as mock_load:
+        get_gene_data(
+            abc_atlas_cache=cache,
+            all_cells=cells.iloc[:10],
+            all_genes=genes,
+            selected_genes=['symbol_6'],
+            result_cache=result_cache
+        )
+        mock_load.assert_called_once()
+
+
+@pytest.mark.parametrize("n_workers, gene_major, use_result_cache",
+                         [(1, False, False), (2, False, False),
+                          (1, True, False), (1, False, True)])
+def test_get_gene_data_sparse_output(gene_data, tmp_path, n_workers,
+                                     gene_major, use_result_cache):
+    """Sparse and AnnData output hold the same values as the DataFrame
+    output, with cells missing from their matrix as 0."""
+    cache, cells, genes, expression = gene_data
+    if gene_major:
+        create_gene_major_copies(cache, 'dataset')
+    result_cache = GeneDataCache(tmp_path / 'gene_cache') \
+        if use_result_cache else None
+    missing = pd.DataFrame(
+        {'dataset_label': 'dataset', 'feature_matrix_label': 'matrix_0'},
+        index=pd.Index(['not_a_cell'], name='cell_label')
+    )
+    selected_cells = pd.concat([cells.iloc[::2], missing])
+    selected_genes = ['symbol_1', 'symbol_12', 'symbol_13']
+    expected = get_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=selected_cells,
+        all_genes=genes,
+        selected_genes=selected_genes,
+        result_cache=result_cache
+    ).fillna(0)
+
+    result = get_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=selected_cells,
+        all_genes=genes,
+        selected_genes=selected_genes,
+        n_workers=n_workers,
+        result_cache=result_cache,
+        output="sparse"
+    )
+    assert scipy.sparse.issparse(result)
+    assert result.dtype == np.float32
+    np.testing.assert_array_equal(result.toarray(), expected.to_numpy())
+
+    result = get_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=selected_cells,
+        all_genes=genes,
+        selected_genes=selected_genes,
+        n_workers=n_workers,
+        result_cache=result_cache,
+        output="anndata",
+        dtype=np.int32
+    )
+    assert isinstance(result, anndata.AnnData)
+    assert scipy.sparse.issparse(result.X)
+    assert result.X.dtype == np.int32
+    # values cast to 0 are not stored
+    assert result.X.nnz == np.count_nonzero(result.X.toarray())
+    assert result.X.nnz > 0
+    pd.testing.assert_frame_equal(result.obs, selected_cells)
+    pd.testing.assert_frame_equal(
+        result.var, genes[genes.gene_symbol.isin(selected_genes)]
+    )
+    np.testing.assert_array_equal(result.X.toarray(),
+                                  expected.to_numpy().astype(np.int32))
+
+
+def test_get_gene_data_dtype(gene_data):
+    cache, cells, genes, expression = gene_data
+    result = get_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=cells,
+        all_genes=genes,
+        selected_genes=['symbol_1'],
+        dtype=np.float16
+    )
+    assert (result.dtypes == np.float16).all()
+    np.testing.assert_array_equal(
+        result.to_numpy(),
+        expression.loc[cells.index, ['symbol_1']].to_numpy(dtype=np.float16)
+    )
+
+    with pytest.raises(ValueError, match="output must be"):
+        get_gene_data(cache, cells, genes, ['symbol_1'], output="list")
+
+    # scipy.sparse cannot hold float16; this is caught before any reading
+    with patch('abc_atlas_access.abc_atlas_cache.anndata_utils.'
+               '_load_gene_data') as mock_load:
+        with pytest.raises(ValueError, match="not supported by scipy"):
+            get_gene_data(cache, cells, genes, ['symbol_1'],
+                          output="sparse", dtype=np.float16)
+        mock_load.assert_not_called()
+
+
+@pytest.mark.parametrize("use_result_cache", [False, True])
+def test_get_gene_data_integer_dtype_missing_cells(gene_data, tmp_path,
+                                                   use_result_cache):
+    """Cells that are not in their expression matrix are 0 in integer
+    output, including genes served from the result cache."""
+    cache, cells, genes, expression = gene_data
+    result_cache = GeneDataCache(tmp_path / 'gene_cache') \
+        if use_result_cache else None
+    missing = pd.DataFrame(
+        {'dataset_label': 'dataset', 'feature_matrix_label': 'matrix_1'},
+        index=pd.Index(['not_a_cell'], name='cell_label')
+    )
+    selected_cells = pd.concat([cells.iloc[:5], missing])
+    expected = np.zeros((6, 2), dtype=np.int32)
+    expected[:5] = expression.loc[
+        cells.index[:5], ['symbol_1', 'symbol_2']
+    ].to_numpy().astype(np.int32)
+
+    # the first call fills the result cache and the second is served by it
+    for _ in range(2):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", RuntimeWarning)
+            result = get_gene_data(
+                abc_atlas_cache=cache,
+                all_cells=selected_cells,
+                all_genes=genes,
+                selected_genes=['symbol_1', 'symbol_2'],
+                result_cache=result_cache,
+                dtype=np.int32
+            )
+        assert (result.dtypes == np.int32).all()
+        np.testing.assert_array_equal(result.to_numpy(), expected)
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_get_gene_data_stats(gene_data, caplog, n_workers):
+    """The statistics of each file are passed to the callback and
+    logged."""
+    cache, cells, genes, expression = gene_data
+    selected_cells = cells[cells.feature_matrix_label == 'matrix_0'].iloc[:5]
+    selected_cells = pd.concat(
+        [selected_cells, cells[cells.feature_matrix_label == 'matrix_1']]
+    )
+    stats = []
+    with caplog.at_level('INFO',
+                         logger='abc_atlas_access.abc_atlas_cache.'
+                                'anndata_utils'):
+        get_gene_data(
+            abc_atlas_cache=cache,
+            all_cells=selected_cells,
+            all_genes=genes,
+            selected_genes=['symbol_1'],
+            chunk_size=8,
+            n_workers=n_workers,
+            stats_callback=stats.append
+        )
+    stats = {file_stats['matrix']: file_stats for file_stats in stats}
+    assert set(stats.keys()) == {'matrix_0', 'matrix_1'}
+    assert stats['matrix_0']['cells_kept'] == 5
+    assert stats['matrix_0']['cells_skipped'] == 32
+    assert stats['matrix_1']['cells_kept'] == 23
+    assert stats['matrix_1']['cells_skipped'] == 0
+    assert stats['matrix_1']['chunks'] == 3
+    for file_stats in stats.values():
+        assert file_stats['directory'] == 'dataset'
+        assert file_stats['bytes_read'] > 0
+        assert file_stats['wall_time'] >= 0
+        assert file_stats['cpu_time'] >= 0
+    assert 'dataset/matrix_1' in caplog.text
+    assert 'processed cells: 28' in caplog.text
+
+
+def test_iter_gene_data(gene_data):
+    cache, cells, genes, expression = gene_data
+    selected_cells = cells.iloc[::2]
+    selected_genes = ['symbol_3', 'symbol_15']
+    stats = []
+    chunks = list(iter_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=selected_cells,
+        all_genes=genes,
+        selected_genes=selected_genes,
+        chunk_size=8,
+        dtype=np.float64,
+        stats_callback=stats.append
+    ))
+    assert len(chunks) > 2
+    assert all(len(chunk) <= 8 for chunk in chunks)
+    assert len(stats) == 2
+
+    result = pd.concat(chunks)
+    assert (result.dtypes == np.float64).all()
+    assert sorted(result.index) == sorted(selected_cells.index)
+    expected = get_gene_data(
+        abc_atlas_cache=cache,
+        all_cells=selected_cells,
+        all_genes=genes,
+        selected_genes=selected_genes,
+        dtype=np.float64
+    )
+    pd.testing.assert_frame_equal(result, expected.loc[result.index])
@@ -1,16 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 import hashlib
+import sys
 import warnings
 
 import pytest
 from pathlib import Path
+from unittest.mock import patch
 from moto import mock_aws
+from botocore.exceptions import EndpointConnectionError
 import json
 
 from abc_atlas_access.abc_atlas_cache.file_attributes import \
     CacheFileAttributes
+from abc_atlas_access.abc_atlas_cache.manifest import Manifest
 from abc_atlas_access.abc_atlas_cache.cloud_cache import (
     S3CloudCache,
+    MissingLocalManifestWarning,
     OutdatedManifestWarning
 )
 from .utils import create_manifest_dict, BaseCacheTestCase, hash_data
@@ -66,6 +72,68 @@ class TestCache(BaseCacheTestCase):
             self.new_manifest_string
         ]
 
+    def test_manifest_listing_cached(self):
+        """
+        Test that the listing of the manifests in the bucket is reused
+        until it expires, and that the cache can be used offline or when
+        the bucket cannot be reached
+        """
+        manifest_list = self.create_manifests(manifest_count=2)
+        cache = S3CloudCache(self.cache_dir, self.test_bucket_name)
+        assert cache.manifest_file_names == manifest_list
+        cache.load_manifest(manifest_list[0])
+
+        new_manifest = self.create_manifests(manifest_count=3)[-1]
+        cache = S3CloudCache(self.cache_dir, self.test_bucket_name)
+        assert cache.manifest_file_names == manifest_list
+        cache = S3CloudCache(self.cache_dir, self.test_bucket_name,
+                             manifest_list_ttl=0)
+        assert cache.manifest_file_names == manifest_list + [new_manifest]
+
+        # offline, only the downloaded manifest is available
+        with patch.object(S3CloudCache, '_list_bucket_manifests',
+                          side_effect=AssertionError('bucket listed')):
+            cache = S3CloudCache(self.cache_dir, self.test_bucket_name,
+                                 manifest_list_ttl=0, offline=True)
+        assert cache.manifest_file_names == [manifest_list[0]]
+        cache.load_last_manifest()
+        assert cache.current_manifest == manifest_list[0]
+
+        with pytest.raises(RuntimeError, match="No manifests"):
+            S3CloudCache(Path(self.cache_dir) / 'empty',
+                         self.test_bucket_name, offline=True)
+
+        # an unreachable bucket falls back to the cached listing
+        error = EndpointConnectionError(endpoint_url='https://example.com')
+        with patch.object(S3CloudCache, '_list_bucket_manifests',
+                          side_effect=error):
+            with pytest.warns(UserWarning, match="Could not list"):
+                cache = S3CloudCache(self.cache_dir, self.test_bucket_name,
+                                     manifest_list_ttl=0)
+            assert cache.manifest_file_names == \
+                manifest_list + [new_manifest]
+            with pytest.raises(EndpointConnectionError):
+                S3CloudCache(Path(self.cache_dir) / 'empty',
+                             self.test_bucket_name)
+
+    def test_s3_client_connection_pool(self):
+        """
+        Test that the S3 client keeps enough connections open for the
+        parts of concurrently downloading files
+        """
+        self.create_manifests(manifest_count=1)
+        cache = S3CloudCache(self.cache_dir, self.test_bucket_name,
+                             max_concurrency=16)
+        assert cache.s3_client.meta.config.max_pool_connections == 64
+
+        cache.download_files(directory='test_directory', file_names=[],
+                             max_workers=8)
+        assert cache.s3_client.meta.config.max_pool_connections == 128
+
+        cache = S3CloudCache(self.cache_dir, self.test_bucket_name,
+                             max_concurrency=1)
+        assert cache.s3_client.meta.config.max_pool_connections == 10
+
     def test_list_all_manifests_many(self):
         """
         Test the extreme case when there are more manifests than
@@ -196,6 +264,174 @@ class TestCache(BaseCacheTestCase):
             hasher.update(in_file.read())
         assert hasher.hexdigest() == true_checksum
 
+    def test_download_file_multipart(self):
+        """
+        Test that S3CloudCache._download_file downloads large files as
+        concurrent byte-range parts and reassembles them correctly
+        """
+        data = b'11235813kjlssergwesvsdd' * 7
+        true_checksum = hash_data(data)
+        relative_path = 'data/data_file.txt'
+
+        self.client.put_object(Bucket=self.test_bucket_name,
+                               Key=relative_path,
+                               Body=data)
+
+        cache = S3CloudCache(self.cache_dir,
+                             self.test_bucket_name,
+                             multipart_threshold=10,
+                             multipart_chunksize=9,
+                             max_concurrency=4)
+
+        expected_path = self.cache_dir / relative_path
+
+        url = f'http://{self.test_bucket_name}.s3.amazonaws.com/data/data_file.txt'  # noqa: E501
+        good_attributes = CacheFileAttributes(url=url,
+                                              version=self.new_version,
+                                              file_size=len(data),
+                                              local_path=expected_path,
+                                              relative_path=relative_path,
+                                              file_type='txt',
+                                              file_hash=true_checksum)
+
+        # A longer key sharing the prefix of the file, even if listed
+        # first, does not affect the size of the parts.
+        self.client.put_object(Bucket=self.test_bucket_name,
+                               Key=relative_path + '.bak',
+                               Body=data * 3)
+        sibling_listing = {'Contents': [{'Key': relative_path + '.bak',
+                                         'Size': len(data) * 3}]}
+
+        assert not expected_path.exists()
+        with patch.object(cache.s3_client, 'list_objects_v2',
+                          return_value=sibling_listing):
+            assert cache._download_file(good_attributes)
+        assert expected_path.exists()
+        with open(expected_path, 'rb') as in_file:
+            assert in_file.read() == data
+
+        # The hash computed over the parts must match the file hash.
+        expected_path.unlink()
+        bad_attributes = good_attributes.model_copy(
+            update={'file_hash': hash_data(data[::-1])}
+        )
+        with pytest.raises(RuntimeError,
+                           match=f"Could not download {relative_path}"):
+            cache._download_file(bad_attributes)
+        assert not expected_path.exists()
+
+    def test_download_file_streams_hash(self):
+        """
+        Test that S3CloudCache._download_file hashes the chunks of a file
+        downloaded in order as they arrive instead of buffering its bytes
+        """
+        data = b'11235813kjlssergwesvsdd' * 7
+        true_checksum = hash_data(data)
+        relative_path = 'data/data_file.txt'
+
+        self.client.put_object(Bucket=self.test_bucket_name,
+                               Key=relative_path,
+                               Body=data)
+
+        expected_path = self.cache_dir / relative_path
+        url = f'http://{self.test_bucket_name}.s3.amazonaws.com/data/data_file.txt'  # noqa: E501
+        attributes = CacheFileAttributes(url=url,
+                                         version=self.new_version,
+                                         file_size=len(data),
+                                         local_path=expected_path,
+                                         relative_path=relative_path,
+                                         file_type='txt',
+                                         file_hash=true_checksum)
+
+        for kwargs in ({}, {'multipart_threshold': 10,
+                            'multipart_chunksize': 9,
+                            'max_concurrency': 1}):
+            cache = S3CloudCache(self.cache_dir,
+                                 self.test_bucket_name,
+                                 **kwargs)
+            download_range = cache._download_range
+            with patch.object(cache, '_download_range',
+                              side_effect=download_range) as mock_range:
+                assert cache._download_file(attributes, force_download=True)
+            for call in mock_range.call_args_list:
+                assert not call.kwargs.get('keep_bytes', False)
+                assert call.kwargs['hasher'] is not None
+            with open(expected_path, 'rb') as in_file:
+                assert in_file.read() == data
+
+    def test_resume_interrupted_download(self):
+        """
+        Test that S3CloudCache._download_file resumes an interrupted download
+        from the byte ranges recorded in its journal
+        """
+        data = b'11235813kjlssergwesvsdd' * 7
+        true_checksum = hash_data(data)
+        relative_path = 'data/data_file.txt'
+
+        self.client.put_object(Bucket=self.test_bucket_name,
+                               Key=relative_path,
+                               Body=data)
+
+        cache = S3CloudCache(self.cache_dir,
+                             self.test_bucket_name,
+                             multipart_threshold=10,
+                             multipart_chunksize=9,
+                             max_concurrency=1)
+
+        expected_path = self.cache_dir / relative_path
+        partial_path = cache._partial_path(expected_path)
+        journal_path = cache._journal_path(expected_path)
+
+        url = f'http://{self.test_bucket_name}.s3.amazonaws.com/data/data_file.txt'  # noqa: E501
+        good_attributes = CacheFileAttributes(url=url,
+                                              version=self.new_version,
+                                              file_size=len(data),
+                                              local_path=expected_path,
+                                              relative_path=relative_path,
+                                              file_type='txt',
+                                              file_hash=true_checksum)
+
+        get_object = cache.s3_client.get_object
+        requested_ranges = []
+
+        def failing_get_object(**kwargs):
+            requested_ranges.append(kwargs['Range'])
+            if kwargs['Range'] == 'bytes=90-98':
+                raise ConnectionError('connection dropped')
+            return get_object(**kwargs)
+
+        with patch.object(cache.s3_client, 'get_object',
+                          side_effect=failing_get_object):
+            with pytest.raises(ConnectionError):
+                cache._download_file(good_attributes)
+        assert not expected_path.exists()
+        assert partial_path.exists()
+        assert journal_path.exists()
+        n_parts = len(requested_ranges)
+
+        # The partial download of the first file of a fresh cache is not
+        # mistaken for untracked data files.
+        assert not cache._download_ledger.exists()
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', MissingLocalManifestWarning)
+            S3CloudCache(self.cache_dir, self.test_bucket_name)
+
+        requested_ranges.clear()
+        with patch.object(cache.s3_client, 'get_object',
+                          side_effect=lambda **kwargs: (
+                              requested_ranges.append(kwargs['Range'])
+                              or get_object(**kwargs))):
+            assert cache._download_file(good_attributes)
+
+        # Only the parts that were not completed are requested again.
+        assert 'bytes=90-98' in requested_ranges
+        assert 'bytes=0-8' not in requested_ranges
+        assert len(requested_ranges) < n_parts
+        assert not partial_path.exists()
+        assert not journal_path.exists()
+        with open(expected_path, 'rb') as in_file:
+            assert in_file.read() == data
+
     def test_re_download_file(self):
         """
         Test that S3CloudCache._download_file will re-download a file
@@ -427,6 +663,64 @@ class TestCache(BaseCacheTestCase):
 
         assert cache.current_manifest == manifest_list[0]
 
+    def test_parsed_manifest_reused(self):
+        """
+        Test that the pre-parsed manifest written next to a downloaded
+        manifest is used while the manifest is unchanged and rewritten
+        when it changes
+        """
+        manifest_list = self.create_manifests(manifest_count=1)
+        cache = S3CloudCache(self.cache_dir, self.test_bucket_name)
+        cache.load_manifest(manifest_list[0])
+        expected_version = cache.version
+
+        manifest_path = Path(self.cache_dir) / manifest_list[0]
+        parsed_path = cache._parsed_manifest_path(manifest_path)
+        assert parsed_path.suffix == '.marshal'
+        assert parsed_path.is_file()
+
+        with patch('abc_atlas_access.abc_atlas_cache.cloud_cache.Manifest',
+                   wraps=Manifest) as mock_manifest:
+            cache = S3CloudCache(self.cache_dir, self.test_bucket_name)
+            cache.load_manifest(manifest_list[0])
+            mock_manifest.assert_not_called()
+        assert cache.version == expected_version
+        assert cache.list_all_downloaded_manifests() == manifest_list
+
+        # a changed manifest is parsed again
+        manifest = json.loads(manifest_path.read_text())
+        manifest['version'] = 'changed'
+        manifest_path.write_text(json.dumps(manifest))
+        cache = S3CloudCache(self.cache_dir, self.test_bucket_name)
+        assert cache._load_manifest(manifest_list[0]).version == 'changed'
+        assert Manifest.from_serialized(
+            self.cache_dir,
+            parsed_path.read_bytes().split(b'\n', 1)[1]
+        ).version == 'changed'
+
+        # a corrupted pre-parsed manifest is ignored
+        header = parsed_path.read_bytes().split(b'\n', 1)[0]
+        parsed_path.write_bytes(header + b'\n' + b'\x00garbage')
+        cache = S3CloudCache(self.cache_dir, self.test_bucket_name)
+        assert cache._load_manifest(manifest_list[0]).version == 'changed'
+
+        # a pre-parsed manifest written by another Python version is not
+        # loaded
+        cache._load_manifest(manifest_list[0])
+        header, body = parsed_path.read_bytes().split(b'\n', 1)
+        python_version = '.'.join(str(v) for v in sys.version_info[:2])
+        assert f'python-{python_version}'.encode() in header
+        parsed_path.write_bytes(
+            header.replace(f'python-{python_version}'.encode(),
+                           b'python-2.7') + b'\n' + body
+        )
+        with patch('abc_atlas_access.abc_atlas_cache.cloud_cache.Manifest',
+                   wraps=Manifest) as mock_manifest:
+            cache = S3CloudCache(self.cache_dir, self.test_bucket_name)
+            assert cache._load_manifest(manifest_list[0]).version \
+                == 'changed'
+            mock_manifest.assert_called_once()
+
     def test_corrupted_load_last_manifest(self):
         """
         Test that load_last_manifest works when the record of the last
@@ -499,6 +793,112 @@ class TestCache(BaseCacheTestCase):
         assert metadata_path_list == [expected_path]
         assert expected_path.exists()
 
+    def test_download_files_concurrently(self):
+        """
+        Test that S3CloudCache.download_files() downloads several files at
+        once and reports failures per file.
+        """
+        data = b'11235813kjlssergwesvsdd'
+        true_checksum = hash_data(data)
+
+        version = self.new_version
+        manifest, metadata_path, data_path = create_manifest_dict(
+            version=version,
+            test_bucket_name=self.test_bucket_name,
+            file_hash=true_checksum
+        )
+        manifest['file_listing']['test_directory']['metadata']['other'] = {
+            'files': {
+                'csv': {
+                    'version': version,
+                    'relative_path': metadata_path.replace('metadata_file',
+                                                           'other'),
+                    'url': 'junk',
+                    'size': len(data),
+                    'file_hash': true_checksum
+                }
+            }
+        }
+
+        self.client.put_object(Bucket=self.test_bucket_name,
+                               Key=metadata_path,
+                               Body=data)
+        self.client.put_object(Bucket=self.test_bucket_name,
+                               Key=metadata_path.replace('metadata_file',
+                                                         'other'),
+                               Body=data)
+        self.client.put_object(Bucket=self.test_bucket_name,
+                               Key=self.new_manifest_string,
+                               Body=bytes(json.dumps(manifest), 'utf-8'))
+
+        cache = S3CloudCache(self.cache_dir, self.test_bucket_name)
+        cache.load_manifest(self.new_manifest_string)
+
+        results = cache.download_files(
+            directory='test_directory',
+            file_names=['metadata_file', 'not_a_file', 'other'],
+            max_workers=3
+        )
+        assert list(results.keys()) == ['metadata_file', 'not_a_file', 'other']
+        assert results['metadata_file']['error'] is None
+        assert results['metadata_file']['local_path'] == \
+            self.cache_dir / metadata_path
+        assert results['metadata_file']['local_path'].exists()
+        assert results['other']['error'] is None
+        assert results['other']['local_path'].exists()
+        assert isinstance(results['not_a_file']['error'], KeyError)
+        assert results['not_a_file']['local_path'] is None
+
+        paths = cache.download_directory_metadata(
+            directory='test_directory',
+            max_workers=2
+        )
+        assert paths == [self.cache_dir / metadata_path,
+                         results['other']['local_path']]
+
+    def test_download_file_once_when_concurrent(self):
+        """
+        Test that concurrent requests for the same missing file download it
+        only once and all return its path.
+        """
+        data = b'11235813kjlssergwesvsdd'
+        true_checksum = hash_data(data)
+
+        manifest, metadata_path, _ = create_manifest_dict(
+            version=self.new_version,
+            test_bucket_name=self.test_bucket_name,
+            file_hash=true_checksum
+        )
+        self.client.put_object(Bucket=self.test_bucket_name,
+                               Key=metadata_path,
+                               Body=data)
+        self.client.put_object(Bucket=self.test_bucket_name,
+                               Key=self.new_manifest_string,
+                               Body=bytes(json.dumps(manifest), 'utf-8'))
+
+        cache = S3CloudCache(self.cache_dir, self.test_bucket_name)
+        cache.load_manifest(self.new_manifest_string)
+
+        get_object = cache.s3_client.get_object
+        n_requests = []
+
+        def counting_get_object(**kwargs):
+            n_requests.append(1)
+            return get_object(**kwargs)
+
+        with patch.object(cache.s3_client, 'get_object',
+                          side_effect=counting_get_object):
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                paths = list(executor.map(
+                    lambda _: cache.download_file(
+                        directory='test_directory',
+                        file_name='metadata_file'
+                    ),
+                    range(4)
+                ))
+        assert paths == [self.cache_dir / metadata_path] * 4
+        assert len(n_requests) == 1
+
     def test_hashing_check(self):
         """
         Test that the hash check works correctly.
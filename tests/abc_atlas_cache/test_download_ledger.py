@@ -0,0 +1,69 @@
+import json
+from abc_atlas_access.abc_atlas_cache.download_ledger import DownloadLedger
+
+
+def test_add_get_remove(tmp_path):
+    """Test recording, looking up and removing downloads."""
+    ledger = DownloadLedger(tmp_path / 'ledger.jsonl')
+    assert not ledger.exists()
+    assert ledger.get('/data/a.csv') is None
+
+    ledger.add('/data/a.csv', size=12, file_hash='abcd',
+               manifest_version='20240101')
+    ledger.add('/data/b.csv', size=34, file_hash='efgh',
+               manifest_version='20240101')
+    assert ledger.exists()
+    record = ledger.get('/data/a.csv')
+    assert record['size'] == 12
+    assert record['file_hash'] == 'abcd'
+    assert record['manifest_version'] == '20240101'
+    assert '/data/b.csv' in ledger
+
+    ledger.remove('/data/a.csv')
+    assert '/data/a.csv' not in ledger
+    assert '/data/b.csv' in ledger
+
+    # Re-adding an identical record does not grow the log.
+    n_lines = len((tmp_path / 'ledger.jsonl').read_text().splitlines())
+    ledger.add('/data/b.csv', size=34, file_hash='efgh',
+               manifest_version='20240101')
+    assert len((tmp_path / 'ledger.jsonl').read_text().splitlines()) == \
+        n_lines
+
+
+def test_shared_log(tmp_path):
+    """Test that records appended by another ledger on the same log are
+    picked up, and that incomplete records are ignored until finished."""
+    path = tmp_path / 'ledger.jsonl'
+    ledger_0 = DownloadLedger(path)
+    ledger_1 = DownloadLedger(path)
+
+    ledger_0.add('/data/a.csv', size=12)
+    assert '/data/a.csv' in ledger_1
+
+    record = json.dumps({'path': '/data/b.csv', 'size': 1})
+    with open(path, 'a') as out_file:
+        out_file.write(record[:10])
+    assert '/data/b.csv' not in ledger_1
+    with open(path, 'a') as out_file:
+        out_file.write(record[10:] + '\n')
+    assert ledger_1.get('/data/b.csv')['size'] == 1
+
+    ledger_1.remove('/data/a.csv')
+    assert '/data/a.csv' not in ledger_0
+    assert '/data/a.csv' not in DownloadLedger(path)
+
+
+def test_import_legacy(tmp_path):
+    """Test that the JSON list of downloads from older versions is
+    imported."""
+    legacy_path = tmp_path / '_downloaded_data.json'
+    with open(legacy_path, 'w') as out_file:
+        json.dump(['/data/a.csv', '/data/b.csv'], out_file)
+
+    ledger = DownloadLedger(tmp_path / 'ledger.jsonl',
+                            legacy_path=legacy_path)
+    assert ledger.exists()
+    assert ledger.get('/data/a.csv')['size'] is None
+    assert '/data/b.csv' in ledger
+    assert (tmp_path / 'ledger.jsonl').exists()
@@ -0,0 +1,98 @@
+import errno
+import gc
+import multiprocessing
+import threading
+import time
+from unittest.mock import patch
+import pytest
+from abc_atlas_access.abc_atlas_cache.file_lock import FileLock
+
+
+def _try_lock(path, queue):
+    try:
+        with FileLock(path, timeout=0.2, poll_interval=0.05):
+            queue.put('locked')
+    except TimeoutError:
+        queue.put('timeout')
+
+
+def test_lock_threads(tmp_path):
+    """Test that threads holding the same lock file do not overlap."""
+    lock_path = tmp_path / 'file.lock'
+    active = []
+    overlaps = []
+
+    def work():
+        for _ in range(5):
+            with FileLock(lock_path):
+                active.append(1)
+                if len(active) > 1:
+                    overlaps.append(1)
+                time.sleep(0.001)
+                active.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == []
+    assert lock_path.exists()
+
+
+def test_thread_locks_released(tmp_path):
+    """Test that the per path thread locks do not outlive their FileLocks."""
+    lock_paths = [tmp_path / f'file_{idx}.lock' for idx in range(3)]
+    locks = [FileLock(path) for path in lock_paths]
+    for lock in locks:
+        with lock:
+            pass
+    same_path = FileLock(lock_paths[0])
+    assert same_path._thread_lock is locks[0]._thread_lock
+    n_locks = len(FileLock._thread_locks)
+
+    del locks, lock, same_path
+    gc.collect()
+    assert len(FileLock._thread_locks) == n_locks - 3
+
+
+def test_lock_timeout(tmp_path):
+    """Test that waiting on a held lock times out."""
+    lock_path = tmp_path / 'file.lock'
+    with FileLock(lock_path):
+        with pytest.raises(TimeoutError):
+            FileLock(lock_path, timeout=0.1, poll_interval=0.01).acquire()
+    with FileLock(lock_path, timeout=0.1):
+        pass
+
+
+def test_lock_unsupported(tmp_path):
+    """Test that a file system that cannot lock raises instead of being
+    waited on forever."""
+    lock_path = tmp_path / 'file.lock'
+    with patch.object(FileLock, '_lock_file',
+                      side_effect=OSError(errno.ENOLCK, 'No locks available')):
+        with pytest.raises(OSError) as err:
+            FileLock(lock_path).acquire()
+    assert err.value.errno == errno.ENOLCK
+    # the thread lock was released
+    with FileLock(lock_path, timeout=0.1):
+        pass
+
+
+def test_lock_processes(tmp_path):
+    """Test that a lock held by one process excludes another."""
+    lock_path = tmp_path / 'file.lock'
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+
+    with FileLock(lock_path):
+        process = context.Process(target=_try_lock, args=(lock_path, queue))
+        process.start()
+        assert queue.get(timeout=60) == 'timeout'
+        process.join()
+
+    process = context.Process(target=_try_lock, args=(lock_path, queue))
+    process.start()
+    assert queue.get(timeout=60) == 'locked'
+    process.join()
@@ -0,0 +1,84 @@
+import os
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from abc_atlas_access.abc_atlas_cache.gene_data_cache import GeneDataCache
+
+
+def test_get_put(tmp_path):
+    cache = GeneDataCache(tmp_path / 'genes')
+    key = cache.key('releases/20240101/manifest.json', 'log2', 'gene_0',
+                    'abc')
+    assert cache.get(key) is None
+
+    values = np.array([0.5, np.nan, 2.0], dtype=np.float32)
+    cache.put(key, values)
+    result = cache.get(key)
+    np.testing.assert_array_equal(result, values)
+    assert result.dtype == np.float32
+
+    assert cache.key('releases/20240101/manifest.json', 'raw', 'gene_0',
+                     'abc') != key
+    cache.clear()
+    assert cache.get(key) is None
+    assert cache.size == 0
+
+
+def test_cells_fingerprint():
+    cells = pd.DataFrame(
+        {'dataset_label': ['a', 'a', 'b'],
+         'feature_matrix_label': ['m0', 'm0', 'm1'],
+         'cluster': [1, 2, 3]},
+        index=['cell_0', 'cell_1', 'cell_2']
+    )
+    fingerprint = GeneDataCache.cells_fingerprint(cells)
+    # other columns do not change the fingerprint
+    assert GeneDataCache.cells_fingerprint(
+        cells.drop(columns='cluster')) == fingerprint
+    assert GeneDataCache.cells_fingerprint(cells.iloc[::-1]) != fingerprint
+    assert GeneDataCache.cells_fingerprint(cells.iloc[:2]) != fingerprint
+
+
+def test_evict_least_recently_used(tmp_path):
+    values = np.zeros(100, dtype=np.float64)
+    cache = GeneDataCache(tmp_path, max_size=3 * 1000)
+    keys = [cache.key('manifest', 'log2', f'gene_{idx}', 'abc')
+            for idx in range(4)]
+    for idx, key in enumerate(keys[:3]):
+        cache.put(key, values)
+        # make the access order unambiguous
+        os.utime(cache._entry_path(key), ns=(idx * 10**9, idx * 10**9))
+    assert cache.get(keys[0]) is not None
+
+    cache.put(keys[3], values)
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) is not None
+               for key in (keys[0], keys[2], keys[3]))
+    assert cache.size <= 3 * 1000
+
+
+def test_put_does_not_rescan(tmp_path):
+    values = np.zeros(100, dtype=np.float64)
+    cache = GeneDataCache(tmp_path, max_size=3 * 1000)
+    keys = [cache.key('manifest', 'log2', f'gene_{idx}', 'abc')
+            for idx in range(4)]
+    entry_paths = cache._entry_paths
+    with patch.object(cache, '_entry_paths',
+                      side_effect=entry_paths) as mock_entry_paths:
+        for idx, key in enumerate(keys[:2]):
+            cache.put(key, values)
+            os.utime(cache._entry_path(key), ns=(idx * 10**9, idx * 10**9))
+        # only the initial size is scanned while the cache fits
+        assert mock_entry_paths.call_count == 1
+
+        for key in keys[2:]:
+            cache.put(key, values, evict=False)
+        assert mock_entry_paths.call_count == 1
+        cache.evict(keep=keys[2:])
+        assert mock_entry_paths.call_count == 2
+
+    assert cache.get(keys[0]) is None
+    assert all(cache.get(key) is not None for key in keys[1:])
+    assert cache.size <= 3 * 1000
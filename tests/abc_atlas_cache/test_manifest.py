@@ -343,3 +343,43 @@ class TestManifest(unittest.TestCase):
 
         ans = manifest.get_directory_mapmycells_size(metadata_dir)
         assert ans == "1.29 GB"
+
+    def test_file_index(self):
+        """
+        Test that the files found through the lookup index are the same as
+        those found by searching the manifest's file listing.
+        """
+        cache_path = Path(self.cache_dir)
+        with open(self.manifest_path, "r") as jfile:
+            manifest = Manifest(cache_dir=cache_path, json_input=jfile)
+
+        n_files = 0
+        for directory in manifest.list_directories:
+            for data_kind in manifest.data["file_listing"][directory].keys():
+                try:
+                    file_names = manifest._list_data_in_directory(
+                        directory=directory, data_kind=data_kind
+                    )
+                except DataTypeNotInDirectory:
+                    continue
+                for file_name in file_names:
+                    assert (directory, file_name) in manifest._file_index
+                    assert manifest._file_index[(directory, file_name)] == \
+                        manifest._find_file_entry(directory, file_name)
+                    record = manifest._get_file_record(directory, file_name)
+                    attributes = manifest.get_file_attributes(directory,
+                                                              file_name)
+                    assert record._asdict() == attributes.model_dump(
+                        exclude={"local_path"}
+                    )
+                    assert attributes.local_path == \
+                        cache_path.resolve() / record.relative_path
+                    n_files += 1
+        assert n_files == len(manifest._file_index)
+
+        with pytest.raises(KeyError, match="multiple files found"):
+            manifest.get_file_attributes(
+                directory="WMB-10Xv3", file_name="WMB-10Xv3-Isocortex-1"
+            )
+        with pytest.raises(KeyError, match="not-a-directory"):
+            manifest.list_metadata_files("not-a-directory")
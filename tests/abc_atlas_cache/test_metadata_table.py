@@ -0,0 +1,250 @@
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import pytest
+
+from abc_atlas_access.abc_atlas_cache.metadata_table import (
+    DataFrameMemo,
+    metadata_schema_path,
+    metadata_sidecar_path,
+    read_metadata_table
+)
+
+
+@pytest.fixture
+def metadata_csv(tmp_path):
+    rng = np.random.default_rng(7)
+    n_rows = 250
+    data = pd.DataFrame({
+        'cell_label': [f'cell_{idx}' for idx in range(n_rows)],
+        'dataset_label': rng.choice(['WMB-10Xv2', 'WMB-10Xv3', None],
+                                    size=n_rows),
+        'x': rng.uniform(0, 10, size=n_rows),
+        'n_genes': rng.integers(0, 5000, size=n_rows),
+    })
+    csv_path = tmp_path / 'cell_metadata.csv'
+    data.to_csv(csv_path, index=False)
+    return csv_path
+
+
+@pytest.mark.parametrize('with_sidecar', [False, True])
+@pytest.mark.parametrize('filters', [
+    None,
+    [('dataset_label', '==', 'WMB-10Xv3')],
+    [('dataset_label', '!=', 'WMB-10Xv3'), ('x', '<', 5.0)],
+    [[('n_genes', '>=', 4000)], [('dataset_label', 'not in', ['WMB-10Xv2'])]],
+])
+def test_read_metadata_table_columns_filters(
+        metadata_csv, monkeypatch, with_sidecar, filters):
+    """Test that projected and filtered reads from the csv and from its
+    Parquet copy return the selected part of the full table.
+    """
+    monkeypatch.setattr(
+        'abc_atlas_access.abc_atlas_cache.metadata_table._CSV_CHUNK_SIZE', 40
+    )
+    monkeypatch.setattr(
+        'abc_atlas_access.abc_atlas_cache.metadata_table._ROW_GROUP_SIZE', 50
+    )
+    full = pd.read_csv(metadata_csv)
+    expected = full
+    if filters is not None:
+        if isinstance(filters[0], tuple):
+            filters_or = [filters]
+        else:
+            filters_or = filters
+        mask = np.zeros(len(full), dtype=bool)
+        for conjunction in filters_or:
+            passing = np.ones(len(full), dtype=bool)
+            for column, op, value in conjunction:
+                values = full[column]
+                if op == '==':
+                    passing &= (values == value).to_numpy()
+                elif op == '!=':
+                    passing &= (values.notna() & (values != value)).to_numpy()
+                elif op == '<':
+                    passing &= (values < value).to_numpy()
+                elif op == '>=':
+                    passing &= (values >= value).to_numpy()
+                elif op == 'not in':
+                    passing &= (~values.isin(value)).to_numpy()
+            mask |= passing
+        expected = full[mask].reset_index(drop=True)
+    expected = expected[['x', 'cell_label']]
+
+    file_hash = 'abcd1234'
+    if with_sidecar:
+        read_metadata_table(metadata_csv, file_hash=file_hash)
+        assert metadata_sidecar_path(metadata_csv, file_hash).is_file()
+
+    result = read_metadata_table(metadata_csv,
+                                 file_hash=file_hash,
+                                 columns=['x', 'cell_label'],
+                                 filters=filters)
+    pd.testing.assert_frame_equal(result, expected)
+    # Partial reads never write the Parquet copy.
+    assert metadata_sidecar_path(metadata_csv, file_hash).is_file() \
+        == with_sidecar
+
+
+@pytest.mark.parametrize('with_sidecar', [False, True])
+@pytest.mark.parametrize('index_col', ['cell_label', 0])
+@pytest.mark.parametrize('filters', [
+    None,
+    [('dataset_label', '==', 'WMB-10Xv3')],
+    [('cell_label', 'in', ['cell_3', 'cell_10', 'cell_200'])],
+])
+def test_read_metadata_table_columns_index_col(
+        metadata_csv, monkeypatch, with_sidecar, index_col, filters):
+    """Test that projected reads with an index_col return the same table
+    from the csv and from its Parquet copy, including filters on the index.
+    """
+    monkeypatch.setattr(
+        'abc_atlas_access.abc_atlas_cache.metadata_table._CSV_CHUNK_SIZE', 40
+    )
+    full = pd.read_csv(metadata_csv, index_col='cell_label')
+    expected = full
+    if filters is not None:
+        column, _, value = filters[0]
+        values = full.index if column == 'cell_label' else full[column]
+        if isinstance(value, str):
+            value = [value]
+        expected = full[np.asarray(values.isin(value))]
+    expected = expected[['n_genes', 'x']]
+
+    file_hash = 'abcd1234'
+    if with_sidecar:
+        read_metadata_table(metadata_csv, file_hash=file_hash,
+                            index_col=index_col)
+        assert len(list(metadata_csv.parent.glob('*.parquet'))) == 1
+
+    result = read_metadata_table(metadata_csv,
+                                 file_hash=file_hash,
+                                 columns=['n_genes', 'x'],
+                                 filters=filters,
+                                 index_col=index_col)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_read_metadata_table_bad_filter(metadata_csv):
+    """Test that malformed filters are rejected."""
+    with pytest.raises(ValueError, match="Invalid filter"):
+        read_metadata_table(metadata_csv, filters=[('x', '~', 1)])
+    with pytest.raises(ValueError, match="usecols"):
+        read_metadata_table(metadata_csv, columns=['x'], usecols=['x'])
+
+
+@pytest.mark.parametrize('index_col', [None, 'cell_label'])
+def test_read_metadata_table_usecols_share_copy(metadata_csv, index_col):
+    """Test that reads with different usecols are projections of a single
+    Parquet copy of the whole table, matching pandas.read_csv.
+    """
+    file_hash = 'abcd1234'
+    kwargs = {} if index_col is None else {'index_col': index_col}
+    for usecols in (['x', 'cell_label'], ['cell_label', 'n_genes'],
+                    ['cell_label', 'dataset_label', 'x']):
+        result = read_metadata_table(metadata_csv, file_hash=file_hash,
+                                     usecols=usecols, **kwargs)
+        pd.testing.assert_frame_equal(
+            result, pd.read_csv(metadata_csv, usecols=usecols, **kwargs)
+        )
+        assert len(list(metadata_csv.parent.glob('*.parquet'))) == 1
+    pd.testing.assert_frame_equal(
+        read_metadata_table(metadata_csv, file_hash=file_hash, **kwargs),
+        pd.read_csv(metadata_csv, **kwargs)
+    )
+    assert len(list(metadata_csv.parent.glob('*.parquet'))) == 1
+
+
+def test_read_metadata_table_compact(metadata_csv):
+    """Test that compact reads return the same values in compact dtypes and
+    that the dtypes of the whole table are reused for partial reads.
+    """
+    full = pd.read_csv(metadata_csv)
+    file_hash = 'abcd1234'
+    compact = read_metadata_table(metadata_csv, file_hash=file_hash,
+                                  compact=True)
+    assert compact['dataset_label'].dtype == 'category'
+    assert list(compact['dataset_label'].cat.categories) == \
+        ['WMB-10Xv2', 'WMB-10Xv3']
+    assert compact['cell_label'].dtype == object
+    assert compact['n_genes'].dtype == np.int16
+    assert compact['x'].dtype == np.float64
+    pd.testing.assert_frame_equal(compact.astype(full.dtypes), full)
+    assert metadata_schema_path(metadata_csv, file_hash).is_file()
+
+    # A subset containing a single dataset keeps the full set of categories.
+    subset = read_metadata_table(metadata_csv, file_hash=file_hash,
+                                 filters=[('dataset_label', '==',
+                                           'WMB-10Xv2')],
+                                 compact=True)
+    assert list(subset['dataset_label'].cat.categories) == \
+        ['WMB-10Xv2', 'WMB-10Xv3']
+    assert (subset['dataset_label'] == 'WMB-10Xv2').all()
+
+
+def test_read_metadata_table_compact_while_reading(metadata_csv, monkeypatch):
+    """Test that a saved compact dtype schema is applied while reading the
+    Parquet copy and the csv rather than after loading the strings.
+    """
+    monkeypatch.setattr(
+        'abc_atlas_access.abc_atlas_cache.metadata_table._CSV_CHUNK_SIZE', 40
+    )
+    file_hash = 'abcd1234'
+    expected = read_metadata_table(metadata_csv, file_hash=file_hash,
+                                   compact=True)
+    assert metadata_sidecar_path(metadata_csv, file_hash).is_file()
+
+    with patch('pandas.read_parquet', wraps=pd.read_parquet) as read_parquet:
+        from_copy = read_metadata_table(metadata_csv, file_hash=file_hash,
+                                        compact=True)
+    assert read_parquet.call_args.kwargs['read_dictionary'] == \
+        ['dataset_label']
+    pd.testing.assert_frame_equal(from_copy, expected)
+
+    metadata_sidecar_path(metadata_csv, file_hash).unlink()
+    filters = [('dataset_label', '<', 'WMB-10Xv3')]
+    with patch('pandas.read_csv', wraps=pd.read_csv) as read_csv:
+        from_csv = read_metadata_table(metadata_csv, file_hash=file_hash,
+                                       filters=filters, compact=True)
+    dtype = read_csv.call_args.kwargs['dtype']
+    assert dtype['dataset_label'] == pd.CategoricalDtype(
+        ['WMB-10Xv2', 'WMB-10Xv3'])
+    assert dtype['n_genes'] == 'int16'
+    pd.testing.assert_frame_equal(
+        from_csv,
+        expected[expected['dataset_label'] == 'WMB-10Xv2'].reset_index(
+            drop=True)
+    )
+
+
+def test_dataframe_memo():
+    """Test that the memo returns independent copies and drops the least
+    recently used tables once over its size limit.
+    """
+    tables = {name: pd.DataFrame({'x': np.arange(100, dtype=np.int64)})
+              for name in 'abc'}
+    table_size = int(tables['a'].memory_usage(deep=True).sum())
+    memo = DataFrameMemo(max_bytes=2 * table_size)
+
+    memo.put('a', tables['a'])
+    memo.put('b', tables['b'])
+    assert len(memo) == 2
+    assert memo.nbytes == 2 * table_size
+
+    hit = memo.get('a')
+    pd.testing.assert_frame_equal(hit, tables['a'])
+    hit.loc[0, 'x'] = -1
+    assert memo.get('a').loc[0, 'x'] == 0
+
+    # 'b' is now the least recently used table.
+    memo.put('c', tables['c'])
+    assert memo.get('b') is None
+    assert memo.get('a') is not None
+    assert memo.get('c') is not None
+
+    memo.put('big', pd.concat([tables['a']] * 3))
+    assert memo.get('big') is None
+
+    memo.clear()
+    assert len(memo) == 0
+    assert memo.nbytes == 0
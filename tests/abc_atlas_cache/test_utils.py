@@ -22,3 +22,17 @@ def test_file_hash_from_path(tmpdir):
 
     ans = utils.file_hash_from_path(fname)
     assert ans == hasher.hexdigest()
+
+
+def test_atomic_write(tmpdir):
+
+    fname = tmpdir / 'atomic.txt'
+    utils.atomic_write(fname, 'first')
+    utils.atomic_write(fname, 'second')
+    with open(fname, 'r') as in_file:
+        assert in_file.read() == 'second'
+
+    utils.atomic_write(fname, b'\x00\x01')
+    with open(fname, 'rb') as in_file:
+        assert in_file.read() == b'\x00\x01'
+    assert tmpdir.listdir() == [fname]